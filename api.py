@@ -0,0 +1,9 @@
+from src.constant.training_pipeline import SERVING_HOST, SERVING_PORT
+from src.serving.api import create_app
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=SERVING_HOST, port=SERVING_PORT)
@@ -10,11 +10,12 @@ from sklearn.metrics import accuracy_score, f1_score
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
 from src.pipeline.training_pipeline import TrainingPipeline
-from src.utils.main_utils.utils import load_object
+from src.serving.model_registry import get_model_registry
 from src.utils.ml_utils.model.estimator import CreditCardModel
 from src.constant.training_pipeline import (
     DATA_INGESTION_COLLECTION_NAME,
     DATA_INGESTION_DATABASE_NAME,
+    SERVING_MODEL_FILE_PATH,
 )
 
 # Load environment variables
@@ -52,6 +53,8 @@ if action == "Train Model":
 
 else:  # Predict
     st.header("Make Predictions")
+    # load the model ahead of the first prediction, once per process
+    get_model_registry(SERVING_MODEL_FILE_PATH)
 
     # File upload
     uploaded_file = st.file_uploader("Upload your CSV file", type="csv")
@@ -65,14 +68,41 @@ else:  # Predict
 
             if st.button("Make Predictions"):
                 with st.spinner("Processing..."):
-                    # Load model components
+                    # Take the loaded model, with its threshold, drift sketch and
+                    # schema, from the registry following the final model file
                     try:
-                        model = load_object("final_model/model.pkl")
-                        preprocessor = load_object("final_model/preprocessor.pkl")
-                        
-                        # Create CreditCardModel instance
-                        network_model = CreditCardModel(preprocessor=preprocessor, model=model)
-                        logging.info("Model and preprocessor loaded successfully")
+                        model_version = get_model_registry(
+                            SERVING_MODEL_FILE_PATH
+                        ).get_current()
+                        network_model: CreditCardModel = model_version.model
+                        logging.info(f"Using model version {model_version.version[:12]}")
+
+                        # Check the uploaded data against the schema
+                        # None for models saved without a schema validator
+                        schema_result = network_model.validate(df)
+                        if schema_result is not None and not schema_result.status:
+                            st.warning(
+                                "The uploaded data does not match the schema: "
+                                + "; ".join(schema_result.errors)
+                            )
+                        if schema_result is not None and schema_result.n_invalid_rows:
+                            st.warning(
+                                f"{schema_result.n_invalid_rows} rows break the "
+                                "schema constraints"
+                            )
+
+                        # Check the uploaded data against the training data
+                        drift_report = network_model.check_drift(df)
+                        drifted = [
+                            column
+                            for column, result in drift_report.items()
+                            if result["drift_status"]
+                        ]
+                        if drifted:
+                            st.warning(
+                                "The uploaded data drifted from the training data in: "
+                                + ", ".join(drifted)
+                            )
 
                         # Make predictions
                         y_pred = network_model.predict(df)
@@ -1,56 +1,30 @@
-from src.components.data_ingestion import DataIngestion
-from src.components.data_validation import DataValidation
-from src.components.data_transformation import DataTransformation
+import argparse
+import sys
+
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
-from src.entity.config_entity import (
-    DataIngestionConfig,
-    DataValidationConfig,
-    DataTransformationConfig,
-)
-from src.entity.config_entity import TrainingPipelineConfig
+from src.pipeline.training_pipeline import TrainingPipeline
 
-from src.components.model_trainer import ModelTrainer
-from src.entity.config_entity import ModelTrainerConfig
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the training pipeline")
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_DIR",
+        default=None,
+        help="artifact dir of a failed run, continued after its last completed stage",
+    )
+    return parser.parse_args()
 
-import sys
 
 if __name__ == "__main__":
     try:
-        trainingpipelineconfig = TrainingPipelineConfig()
-        dataingestionconfig = DataIngestionConfig(trainingpipelineconfig)
-        data_ingestion = DataIngestion(dataingestionconfig)
-        logging.info("Initiate the data ingestion")
-        dataingestionartifact = data_ingestion.initiate_data_ingestion()
-        logging.info("Data Initiation Completed")
-        # print(dataingestionartifact)
-        data_validation_config = DataValidationConfig(trainingpipelineconfig)
-        data_validation = DataValidation(dataingestionartifact, data_validation_config)
-        logging.info("Initiate the data Validation")
-        data_validation_artifact = data_validation.initiate_data_validation()
-        logging.info("data Validation Completed")
-        # print(data_validation_artifact)
-        data_transformation_config = DataTransformationConfig(trainingpipelineconfig)
-        logging.info("data Transformation started")
-        data_transformation = DataTransformation(
-            data_validation_artifact, data_transformation_config
-        )
-        data_transformation_artifact = (
-            data_transformation.initiate_data_transformation()
+        args = parse_args()
+        logging.info("Training pipeline started")
+        model_trainer_artifact = TrainingPipeline().run_pipeline(
+            resume_dir=args.resume, deploy=False
         )
-        # print(data_transformation_artifact)
-        logging.info("data Transformation completed")
-
-        logging.info("Model Training sstared")
-        model_trainer_config = ModelTrainerConfig(trainingpipelineconfig)
-        model_trainer = ModelTrainer(
-            model_trainer_config=model_trainer_config,
-            data_transformation_artifact=data_transformation_artifact,
-        )
-        model_trainer_artifact = model_trainer.initiate_model_trainer()
-
-        logging.info("Model Training artifact created")
+        logging.info(f"Model Training artifact created: {model_trainer_artifact}")
 
     except Exception as e:
         raise CreditCardException(e, sys)
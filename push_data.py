@@ -1,6 +1,8 @@
 import json
 import os
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
 
@@ -15,10 +17,18 @@ ca = certifi.where()
 import numpy as np
 import pandas as pd
 import pymongo
+from pymongo.errors import BulkWriteError
 
+from src.constant.training_pipeline import (
+    DATA_INGESTION_COLLECTION_NAME,
+    DATA_INGESTION_DATABASE_NAME,
+    DATA_INGESTION_FALLBACK_FILE_PATH,
+)
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
 
+DUPLICATE_KEY_ERROR_CODE = 11000
+
 
 class NetworkDataExtract:
     def __init__(self):
@@ -73,11 +83,171 @@ class NetworkDataExtract:
             raise CreditCardException(e, sys)
 
 
+class BulkDataLoader:
+    """
+    Load a csv file into MongoDB chunk by chunk. Every chunk is converted with
+    to_dict("records") and sent as unordered insert_many batches by a pool of
+    threads sharing one MongoClient. The last contiguously committed chunk is
+    written to a checkpoint file, so an interrupted load resumes from there.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        collection: str,
+        chunk_size: int = 50000,
+        batch_size: int = 5000,
+        max_workers: int = 4,
+    ):
+        try:
+            self.chunk_size = chunk_size
+            self.batch_size = batch_size
+            self.max_workers = max_workers
+            self.database = database
+            self.collection_name = collection
+
+            logging.info("Attempting to connect to MongoDB...")
+            self.mongo_client = pymongo.MongoClient(
+                MONGO_DB_URL,
+                tlsCAFile=certifi.where(),
+                serverSelectionTimeoutMS=60000,
+                connectTimeoutMS=30000,
+                socketTimeoutMS=30000,
+                maxPoolSize=max(50, max_workers),
+                retryWrites=True,
+            )
+            self.collection = self.mongo_client[database][collection]
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    @staticmethod
+    def chunk_to_records(chunk: pd.DataFrame, first_row: int) -> list:
+        """
+        Convert a chunk to documents without a json round trip. The _id is the row
+        number in the file, so a chunk inserted twice only raises duplicate keys.
+        """
+        if chunk.isna().to_numpy().any():
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+        records = chunk.to_dict("records")
+        for row_number, record in enumerate(records, start=first_row):
+            record["_id"] = row_number
+        return records
+
+    def insert_records(self, records: list) -> int:
+        """Insert the records in unordered batches, ignoring duplicate keys"""
+        inserted = 0
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start : start + self.batch_size]
+            try:
+                inserted += len(
+                    self.collection.insert_many(batch, ordered=False).inserted_ids
+                )
+            except BulkWriteError as bulk_error:
+                errors = bulk_error.details.get("writeErrors", [])
+                if any(error["code"] != DUPLICATE_KEY_ERROR_CODE for error in errors):
+                    raise
+                inserted += bulk_error.details.get("nInserted", 0)
+        return inserted
+
+    def read_checkpoint(self, checkpoint_file_path: str) -> int:
+        """Get the index of the last committed chunk, -1 to start from scratch"""
+        if not os.path.exists(checkpoint_file_path):
+            return -1
+        with open(checkpoint_file_path, "r") as file:
+            checkpoint = json.load(file)
+        if (
+            checkpoint.get("chunk_size") != self.chunk_size
+            or checkpoint.get("database") != self.database
+            or checkpoint.get("collection") != self.collection_name
+        ):
+            logging.warning("Checkpoint does not match the load, starting from scratch")
+            return -1
+        return checkpoint["last_committed_chunk"]
+
+    def write_checkpoint(self, checkpoint_file_path: str, last_committed_chunk: int):
+        tmp_file_path = f"{checkpoint_file_path}.tmp"
+        with open(tmp_file_path, "w") as file:
+            json.dump(
+                {
+                    "database": self.database,
+                    "collection": self.collection_name,
+                    "chunk_size": self.chunk_size,
+                    "last_committed_chunk": last_committed_chunk,
+                },
+                file,
+            )
+        os.replace(tmp_file_path, checkpoint_file_path)
+
+    def load(self, file_path: str, checkpoint_file_path: str = None) -> dict:
+        """
+        Load the csv file and return the number of inserted rows and the rows/sec
+        """
+        try:
+            checkpoint_file_path = checkpoint_file_path or f"{file_path}.checkpoint.json"
+            last_committed_chunk = self.read_checkpoint(checkpoint_file_path)
+            first_chunk = last_committed_chunk + 1
+            if first_chunk:
+                logging.info(f"Resuming the load after chunk {last_committed_chunk}")
+
+            reader = pd.read_csv(
+                file_path,
+                chunksize=self.chunk_size,
+                skiprows=range(1, first_chunk * self.chunk_size + 1),
+            )
+
+            start_time = time.perf_counter()
+            inserted_rows = 0
+            done_chunks = set()
+            pending = {}
+
+            def commit(finished) -> None:
+                nonlocal inserted_rows, last_committed_chunk
+                for future in finished:
+                    inserted_rows += future.result()
+                    done_chunks.add(pending.pop(future))
+                while last_committed_chunk + 1 in done_chunks:
+                    last_committed_chunk += 1
+                    done_chunks.remove(last_committed_chunk)
+                    self.write_checkpoint(checkpoint_file_path, last_committed_chunk)
+                elapsed = time.perf_counter() - start_time
+                logging.info(
+                    f"Committed chunk {last_committed_chunk}, {inserted_rows} rows "
+                    f"({inserted_rows / max(elapsed, 1e-9):.0f} rows/sec)"
+                )
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for chunk_index, chunk in enumerate(reader, start=first_chunk):
+                    records = BulkDataLoader.chunk_to_records(
+                        chunk, first_row=chunk_index * self.chunk_size
+                    )
+                    pending[executor.submit(self.insert_records, records)] = chunk_index
+                    # Bound the number of converted chunks held in memory
+                    if len(pending) >= 2 * self.max_workers:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        commit(finished)
+                if pending:
+                    finished, _ = wait(pending)
+                    commit(finished)
+
+            elapsed = time.perf_counter() - start_time
+            stats = {
+                "inserted_rows": inserted_rows,
+                "seconds": elapsed,
+                "rows_per_sec": inserted_rows / max(elapsed, 1e-9),
+            }
+            logging.info(f"Data insertion completed successfully: {stats}")
+            # The load is complete, a new run starts from scratch
+            if os.path.exists(checkpoint_file_path):
+                os.remove(checkpoint_file_path)
+            return stats
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+
 if __name__ == "__main__":
-    FILE_PATH = "data\creditcard_2023.csv"
-    DATABASE = "JSEGSecurity"
-    Collection = "NetworkData"
-    networkobj = NetworkDataExtract()
-    records = networkobj.csv_to_json_convertor(file_path=FILE_PATH)
-    no_of_records = networkobj.insert_data_mongodb(records, DATABASE, Collection)
-    print(no_of_records)
+    loader = BulkDataLoader(
+        database=DATA_INGESTION_DATABASE_NAME,
+        collection=DATA_INGESTION_COLLECTION_NAME,
+    )
+    stats = loader.load(file_path=DATA_INGESTION_FALLBACK_FILE_PATH)
+    print(stats)
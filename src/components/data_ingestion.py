@@ -1,27 +1,231 @@
+import glob
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 import pymongo
+from bson import ObjectId
 from dotenv import load_dotenv
 from sklearn.model_selection import train_test_split
 
+from src.constant.training_pipeline import SCHEMA_FILE_PATH
 from src.entity.artifact_entity import DataIngestionArtifact
 from src.entity.config_entity import DataIngestionConfig
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
+from src.utils.main_utils.utils import (
+    apply_schema_dtypes,
+    get_schema_dtypes,
+    read_dataframe,
+    read_yaml_file,
+    write_dataframe,
+    write_yaml_file,
+)
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.instrumentation import add_rows, profiled
 
 load_dotenv()
 
 MONGO_DB_URL = os.getenv("MONGO_DB_URL")
 
 
+def _to_column_array(values: list) -> np.ndarray:
+    """
+    Convert the values of one column of a chunk into a typed numpy array.
+    MongoDBs "na" markers and missing fields become np.nan.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in "biuf":
+        return array
+    array = np.array(
+        [np.nan if value is None or value == "na" else value for value in values],
+        dtype=object,
+    )
+    try:
+        return array.astype(np.float64)
+    except (TypeError, ValueError):
+        return array
+
+
+def split_key_range(lower, upper, n_partitions: int) -> list:
+    """
+    Split the closed key range [lower, upper] into contiguous (start, end) ranges.
+    Integer keys and ObjectIds are split with integer arithmetic, everything
+    else is treated as float.
+    """
+    if isinstance(lower, ObjectId):
+        bounds = split_key_range(
+            int(str(lower), 16), int(str(upper), 16), n_partitions
+        )
+        return [
+            (ObjectId(format(start, "024x")), ObjectId(format(end, "024x")))
+            for start, end in bounds
+        ]
+
+    n_partitions = max(int(n_partitions), 1)
+    if isinstance(lower, (int, np.integer)) and isinstance(upper, (int, np.integer)):
+        edges = [lower + (upper - lower) * i // n_partitions for i in range(n_partitions)]
+    else:
+        edges = [lower + (upper - lower) * i / n_partitions for i in range(n_partitions)]
+    edges = list(dict.fromkeys(edges)) + [upper]
+    return list(zip(edges[:-1], edges[1:])) or [(lower, upper)]
+
+
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataIngestionConfig):
+    def __init__(
+        self,
+        data_ingestion_config: DataIngestionConfig,
+        writer: BackgroundWriter = None,
+    ):
+        """
+        With a writer, the splits are handed to the next stage in the artifact and
+        their files are written in the background
+        """
         try:
             self.data_ingestion_config = data_ingestion_config
+            self.in_process = writer is not None
+            self.writer = writer if writer is not None else BackgroundWriter(False)
             self.mongo_client = pymongo.MongoClient(MONGO_DB_URL)
+            self._schema_dtypes = get_schema_dtypes(read_yaml_file(SCHEMA_FILE_PATH))
+            # Float columns are parsed straight into their schema dtype
+            self._float_dtypes = {
+                column: dtype
+                for column, dtype in self._schema_dtypes.items()
+                if np.dtype(dtype).kind == "f"
+            }
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def limit_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Sample down to the configured sample_size, None keeps all rows"""
+        sample_size = self.data_ingestion_config.sample_size
+        if sample_size and len(df) > sample_size:
+            logging.info(f"Sampling {sample_size} of {len(df)} rows")
+            df = df.sample(n=sample_size, random_state=42)
+        return df
+
+    @staticmethod
+    def cursor_to_dataframe(cursor, batch_size: int) -> pd.DataFrame:
+        """
+        Consume a MongoDB cursor chunk by chunk into typed numpy column buffers,
+        so the documents are never held as one big list of python dicts.
+
+        Args:
+          cursor: iterable of documents
+          batch_size: number of documents converted per chunk
+
+        Returns:
+          A DataFrame with one column per document field
+        """
+        columns: dict = {}
+        n_rows = 0
+        chunk = []
+
+        def flush(chunk: list, n_rows: int) -> None:
+            for key in dict.fromkeys(key for document in chunk for key in document):
+                if key not in columns:
+                    # Field first seen in this chunk, pad the previous rows
+                    columns[key] = [np.full(n_rows, np.nan)] if n_rows else []
+            for key, buffers in columns.items():
+                buffers.append(
+                    _to_column_array([document.get(key) for document in chunk])
+                )
+
+        for document in cursor:
+            chunk.append(document)
+            if len(chunk) == batch_size:
+                flush(chunk, n_rows)
+                n_rows += len(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk, n_rows)
+
+        return pd.DataFrame(
+            {key: np.concatenate(buffers) for key, buffers in columns.items()}
+        )
+
+    def export_collection_streaming(self, collection) -> pd.DataFrame:
+        """
+        Export the collection through a batched cursor. The _id column is dropped
+        by the server and the sampling is pushed down with $sample.
+        """
+        try:
+            batch_size = self.data_ingestion_config.batch_size
+            sample_size = self.data_ingestion_config.sample_size
+            projection = {"_id": 0}
+
+            if sample_size and collection.estimated_document_count() > sample_size:
+                logging.info(f"Sampling {sample_size} documents on the server")
+                cursor = collection.aggregate(
+                    [{"$sample": {"size": sample_size}}, {"$project": projection}],
+                    batchSize=batch_size,
+                    allowDiskUse=True,
+                )
+            else:
+                cursor = collection.find({}, projection, batch_size=batch_size)
+
+            return DataIngestion.cursor_to_dataframe(cursor, batch_size)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def read_partition(self, collection, key_filter: dict) -> pd.DataFrame:
+        """Read one key range of the collection, sorted by the partition key"""
+        try:
+            batch_size = self.data_ingestion_config.batch_size
+            cursor = collection.find(
+                key_filter,
+                {"_id": 0},
+                batch_size=batch_size,
+                sort=[(self.data_ingestion_config.partition_key, pymongo.ASCENDING)],
+                allow_disk_use=True,
+            )
+            return DataIngestion.cursor_to_dataframe(cursor, batch_size)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def export_collection_parallel(self, collection) -> pd.DataFrame:
+        """
+        Split the collection into partition_key ranges and read them with a pool
+        of threads sharing the connection pool of self.mongo_client. The partial
+        frames are concatenated in key order, so the row order is deterministic.
+        """
+        try:
+            key = self.data_ingestion_config.partition_key
+            num_workers = self.data_ingestion_config.num_workers
+
+            first = collection.find_one(
+                {key: {"$ne": None}}, {key: 1}, sort=[(key, pymongo.ASCENDING)]
+            )
+            last = collection.find_one(
+                {key: {"$ne": None}}, {key: 1}, sort=[(key, pymongo.DESCENDING)]
+            )
+            key_filters = []
+            if first is not None:
+                ranges = split_key_range(first[key], last[key], num_workers)
+                for i, (start, end) in enumerate(ranges):
+                    upper_op = "$lte" if i == len(ranges) - 1 else "$lt"
+                    key_filters.append({key: {"$gte": start, upper_op: end}})
+            # Documents without a partition key are read as an extra partition
+            key_filters.append({key: None})
+
+            logging.info(
+                f"Reading {len(key_filters)} partitions of {key} with {num_workers} workers"
+            )
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                frames = list(
+                    executor.map(
+                        lambda key_filter: self.read_partition(collection, key_filter),
+                        key_filters,
+                    )
+                )
+
+            frames = [frame for frame in frames if not frame.empty]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+            return self.limit_rows(df)
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
@@ -36,17 +240,20 @@ class DataIngestion:
 
                 logging.info("Requesting data from MongoDB Database")
 
-                # Get all data from collection and drop the id column
-                df = pd.DataFrame(list(collection.find()))
-                if "_id" in df.columns.to_list():
-                    df = df.drop(columns=["_id"], axis=1)
+                if self.data_ingestion_config.export_mode == "streaming":
+                    df = self.export_collection_streaming(collection)
+                elif self.data_ingestion_config.export_mode == "parallel":
+                    df = self.export_collection_parallel(collection)
+                else:
+                    # Get all data from collection and drop the id column
+                    df = pd.DataFrame(list(collection.find()))
+                    if "_id" in df.columns.to_list():
+                        df = df.drop(columns=["_id"])
 
-                # Replace MongoDBS "na" with numpys np.nan
-                df.replace({"na": np.nan}, inplace=True)
+                    # Replace MongoDBS "na" with numpys np.nan
+                    df.replace({"na": np.nan}, inplace=True)
 
-                # Limit to 10,000 cases
-                if len(df) > 10000:
-                    df = df.sample(n=10000, random_state=42)
+                    df = self.limit_rows(df)
 
                 logging.info("Successfully retrieved data from MongoDB")
                 return df
@@ -56,18 +263,14 @@ class DataIngestion:
                 logging.info("Falling back to local data file")
 
                 # Fallback to data/creditcard_2023.csv
-                file_path = os.path.join("data", "creditcard_2023.csv")
+                file_path = self.data_ingestion_config.fallback_file_path
                 if not os.path.exists(file_path):
                     raise FileNotFoundError(
                         f"Fallback data file not found at {file_path}"
                     )
 
-                df = pd.read_csv(file_path)
-                df.replace({"na": np.nan}, inplace=True)
-
-                # Limit to 10,000 cases
-                if len(df) > 10000:
-                    df = df.sample(n=10000, random_state=42)
+                df = pd.read_csv(file_path, dtype=self._float_dtypes, na_values=["na"])
+                df = self.limit_rows(df)
 
                 logging.info("Successfully retrieved data from local file")
                 return df
@@ -75,6 +278,174 @@ class DataIngestion:
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
+    def get_source_fingerprint(self) -> Optional[str]:
+        """
+        Cheap fingerprint of the source data: the document count and the last _id of
+        the collection, or the size and mtime of the fallback file. In-place updates
+        of documents are not detected. None if neither source is reachable.
+        MongoDB is given fingerprint_timeout seconds, server selection included.
+        """
+        try:
+            database_name = self.data_ingestion_config.database_name
+            collection_name = self.data_ingestion_config.collection_name
+            collection = self.mongo_client[database_name][collection_name]
+            with pymongo.timeout(self.data_ingestion_config.fingerprint_timeout):
+                last = list(collection.find({}, {"_id": 1}).sort("_id", -1).limit(1))
+                last_id = last[0]["_id"] if last else None
+                return f"mongodb:{collection.estimated_document_count()}:{last_id}"
+        except Exception as mongo_error:
+            logging.warning(f"Failed to fingerprint MongoDB data: {mongo_error}")
+        file_path = self.data_ingestion_config.fallback_file_path
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            return f"file:{file_path}:{stat.st_size}:{stat.st_mtime_ns}"
+        return None
+
+    def read_watermark(self):
+        """Get the watermark of the previous incremental run, None on the first run"""
+        try:
+            watermark_file_path = self.data_ingestion_config.watermark_file_path
+            if not os.path.exists(watermark_file_path):
+                return None
+            watermark = read_yaml_file(watermark_file_path) or {}
+            if watermark.get("key") != self.data_ingestion_config.watermark_key:
+                logging.warning(
+                    f"Watermark key changed to {self.data_ingestion_config.watermark_key}, "
+                    "ignoring the previous watermark"
+                )
+                return None
+            return watermark.get("value")
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def write_watermark(self, value) -> None:
+        """Atomically replace the watermark file"""
+        try:
+            if isinstance(value, pd.Timestamp):
+                value = value.to_pydatetime()
+            elif hasattr(value, "item"):
+                value = value.item()
+            watermark_file_path = self.data_ingestion_config.watermark_file_path
+            tmp_file_path = f"{watermark_file_path}.tmp"
+            write_yaml_file(
+                tmp_file_path,
+                {"key": self.data_ingestion_config.watermark_key, "value": value},
+            )
+            os.replace(tmp_file_path, watermark_file_path)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def export_new_documents(self, watermark) -> pd.DataFrame:
+        """Fetch the documents above the watermark, from MongoDB or the local file"""
+        try:
+            key = self.data_ingestion_config.watermark_key
+            try:
+                database_name = self.data_ingestion_config.database_name
+                collection_name = self.data_ingestion_config.collection_name
+                collection = self.mongo_client[database_name][collection_name]
+
+                logging.info(f"Requesting documents with {key} > {watermark}")
+                batch_size = self.data_ingestion_config.batch_size
+                query = {key: {"$gt": watermark}} if watermark is not None else {}
+                cursor = collection.find(
+                    query,
+                    {"_id": 0},
+                    batch_size=batch_size,
+                    sort=[(key, pymongo.ASCENDING)],
+                    allow_disk_use=True,
+                )
+                return DataIngestion.cursor_to_dataframe(cursor, batch_size)
+
+            except Exception as mongo_error:
+                logging.warning(f"Failed to get data from MongoDB: {str(mongo_error)}")
+                logging.info("Falling back to local data file")
+
+                file_path = self.data_ingestion_config.fallback_file_path
+                if not os.path.exists(file_path):
+                    raise FileNotFoundError(
+                        f"Fallback data file not found at {file_path}"
+                    )
+                df = pd.read_csv(file_path, dtype=self._float_dtypes, na_values=["na"])
+                if watermark is not None:
+                    df = df[df[key] > watermark]
+                return df.sort_values(key, kind="stable")
+
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def read_persistent_feature_store(self) -> pd.DataFrame:
+        """Read all partitions of the persistent feature store"""
+        try:
+            extension = os.path.splitext(
+                self.data_ingestion_config.feature_store_partition_file_path
+            )[1]
+            # Partitions are read in the order they were appended
+            partition_file_paths = sorted(
+                (
+                    file_path
+                    for file_path in glob.glob(
+                        os.path.join(
+                            self.data_ingestion_config.persistent_feature_store_dir,
+                            f"part_*{extension}",
+                        )
+                    )
+                    if not file_path.endswith(f".tmp{extension}")
+                ),
+                key=os.path.getmtime,
+            )
+            if not partition_file_paths:
+                return pd.DataFrame()
+            df = pd.concat(
+                [read_dataframe(file_path) for file_path in partition_file_paths],
+                ignore_index=True,
+            )
+            # A run interrupted before the watermark was written is fetched again
+            key = self.data_ingestion_config.watermark_key
+            if key in df.columns:
+                df = df.drop_duplicates(subset=[key], keep="last", ignore_index=True)
+            return df
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def export_incremental(self) -> pd.DataFrame:
+        """
+        Append the documents above the previous watermark as a new partition of the
+        persistent feature store and return the whole feature store.
+        """
+        try:
+            key = self.data_ingestion_config.watermark_key
+            watermark = self.read_watermark()
+            new_df = self.export_new_documents(watermark)
+
+            if new_df.empty:
+                logging.info(f"No new documents above watermark {watermark}")
+            else:
+                if key not in new_df.columns:
+                    raise KeyError(f"Watermark key {key} is not a column of the data")
+                new_df = apply_schema_dtypes(new_df, self._schema_dtypes)
+                partition_file_path = (
+                    self.data_ingestion_config.feature_store_partition_file_path
+                )
+                root, extension = os.path.splitext(partition_file_path)
+                # Never overwrite a partition of a run with the same timestamp
+                suffix = 1
+                while os.path.exists(partition_file_path):
+                    partition_file_path = f"{root}_{suffix}{extension}"
+                    suffix += 1
+                tmp_file_path = f"{os.path.splitext(partition_file_path)[0]}.tmp{extension}"
+                write_dataframe(tmp_file_path, new_df)
+                os.replace(tmp_file_path, partition_file_path)
+                self.write_watermark(new_df[key].max())
+                logging.info(
+                    f"Appended {len(new_df)} documents to the feature store, "
+                    f"watermark {new_df[key].max()}"
+                )
+
+            df = self.read_persistent_feature_store()
+            return self.limit_rows(df)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
     def export_data_into_feature_store(self, dataframe: pd.DataFrame):
         try:
             # Create folder to save data
@@ -82,7 +453,7 @@ class DataIngestion:
             dir_path = os.path.dirname(feature_store_file_path)
             os.makedirs(dir_path, exist_ok=True)
             # Save dataframe
-            dataframe.to_csv(feature_store_file_path, index=False, header=True)
+            self.writer.write_dataframe(feature_store_file_path, dataframe)
 
             logging.info("Saved data from the Database")
 
@@ -95,9 +466,14 @@ class DataIngestion:
         try:
             # Perform train test split
             train_set, test_set = train_test_split(
-                dataframe, test_size=self.data_ingestion_config.train_test_split_ratio
+                dataframe,
+                test_size=self.data_ingestion_config.train_test_split_ratio,
+                random_state=self.data_ingestion_config.random_state,
             )
             logging.info("Performed train test split on the dataframe")
+            # the files are written without the index
+            train_set = train_set.reset_index(drop=True)
+            test_set = test_set.reset_index(drop=True)
 
             # Create folder to save split data
             dir_path = os.path.dirname(self.data_ingestion_config.training_file_path)
@@ -106,26 +482,35 @@ class DataIngestion:
 
             logging.info("Exporting train and test file path.")
             # Save train and test data
-            train_set.to_csv(
-                self.data_ingestion_config.training_file_path, index=False, header=True
+            self.writer.write_dataframe(
+                self.data_ingestion_config.training_file_path, train_set
             )
-
-            test_set.to_csv(
-                self.data_ingestion_config.testing_file_path, index=False, header=True
+            self.writer.write_dataframe(
+                self.data_ingestion_config.testing_file_path, test_set
             )
             logging.info("Exported train and test file path.")
+            return train_set, test_set
 
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
+    @profiled("data_ingestion")
     def initiate_data_ingestion(self):
         try:
-            dataframe = self.export_collection_as_dataframe()
-            dataframe = self.export_data_into_feature_store(dataframe)
-            self.split_data_as_train_test(dataframe)
+            if self.data_ingestion_config.incremental:
+                # The persistent feature store already holds the data
+                dataframe = self.export_incremental()
+            else:
+                dataframe = self.export_collection_as_dataframe()
+                dataframe = apply_schema_dtypes(dataframe, self._schema_dtypes)
+                dataframe = self.export_data_into_feature_store(dataframe)
+            train_set, test_set = self.split_data_as_train_test(dataframe)
+            add_rows(len(dataframe))
             dataingestionartifact = DataIngestionArtifact(
                 trained_file_path=self.data_ingestion_config.training_file_path,
                 test_file_path=self.data_ingestion_config.testing_file_path,
+                train_dataframe=train_set if self.in_process else None,
+                test_dataframe=test_set if self.in_process else None,
             )
             return dataingestionartifact
 
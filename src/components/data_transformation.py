@@ -1,11 +1,12 @@
 import sys
 import os
+from typing import Optional
+
 import numpy as np
 import pandas as pd
-from sklearn.impute import KNNImputer
 from sklearn.pipeline import Pipeline
 
-from src.constant.training_pipeline import TARGET_COLUMN
+from src.constant.training_pipeline import ID_COLUMN, TARGET_COLUMN, SCHEMA_FILE_PATH
 from src.constant.training_pipeline import DATA_TRANSFORMATION_IMPUTER_PARAMS
 
 from src.entity.artifact_entity import (
@@ -16,7 +17,20 @@ from src.entity.artifact_entity import (
 from src.entity.config_entity import DataTransformationConfig
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
-from src.utils.main_utils.utils import save_numpy_array_data, save_object
+from src.utils.ml_utils.preprocessing.imputer import FastPathImputer, get_imputer
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.instrumentation import add_rows, profiled
+from src.utils.main_utils.utils import (
+    apply_schema_dtypes,
+    count_dataframe_rows,
+    get_schema_dtypes,
+    iter_dataframe_chunks,
+    load_numpy_array_data,
+    read_dataframe,
+    read_yaml_file,
+    save_numpy_array_data,
+    save_object,
+)
 
 
 class DataTransformation:
@@ -24,7 +38,13 @@ class DataTransformation:
         self,
         data_validation_artifact: DataValidationArtifact,
         data_transformation_config: DataTransformationConfig,
+        writer: BackgroundWriter = None,
     ):
+        """
+        The validated splits are taken from the artifact when they were handed over
+        in process. The writer of the pipeline is flushed before the out-of-core
+        transformation reads the validated files.
+        """
         try:
             self.data_validation_artifact: DataValidationArtifact = (
                 data_validation_artifact
@@ -32,20 +52,22 @@ class DataTransformation:
             self.data_transformation_config: DataTransformationConfig = (
                 data_transformation_config
             )
+            self._schema_dtypes = get_schema_dtypes(read_yaml_file(SCHEMA_FILE_PATH))
+            self.writer = writer
         except Exception as e:
             raise CreditCardException(e, sys)
 
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, dtypes: dict = None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, dtypes=dtypes)
         except Exception as e:
             raise CreditCardException(e, sys)
 
     def get_data_transformer_object(cls) -> Pipeline:
         """
-        It initialises a KNNImputer object with the parameters specified in the training_pipeline.py file
-        and returns a Pipeline object with the KNNImputer object as the first step.
+        It initialises the imputer selected by the "method" of the parameters specified in
+        the training_pipeline.py file and returns a Pipeline object with the imputer as the first step.
 
         Args:
           cls: DataTransformation
@@ -57,35 +79,167 @@ class DataTransformation:
             "Entered get_data_trnasformer_object method of Trnasformation class"
         )
         try:
-            imputer: KNNImputer = KNNImputer(**DATA_TRANSFORMATION_IMPUTER_PARAMS)
-            logging.info(
-                f"Initialise KNNImputer with {DATA_TRANSFORMATION_IMPUTER_PARAMS}"
-            )
+            imputer: FastPathImputer = get_imputer(DATA_TRANSFORMATION_IMPUTER_PARAMS)
             processor: Pipeline = Pipeline([("imputer", imputer)])
             return processor
         except Exception as e:
             raise CreditCardException(e, sys)
 
+    @profiled("data_transformation")
     def initiate_data_transformation(self) -> DataTransformationArtifact:
         logging.info(
             "Entered initiate_data_transformation method of DataTransformation class"
         )
         try:
             logging.info("Starting data transformation")
-            train_df = DataTransformation.read_data(
-                self.data_validation_artifact.valid_train_file_path
+            if self.data_transformation_config.out_of_core:
+                preprocessor_object = self.transform_out_of_core()
+            else:
+                preprocessor_object = self.transform_in_memory()
+            has_sample_weights = self.save_sample_weights()
+            save_object(
+                self.data_transformation_config.transformed_object_file_path,
+                preprocessor_object,
+            )
+
+            save_object(
+                "final_model/preprocessor.pkl",
+                preprocessor_object,
+            )
+
+            # preparing artifacts
+            config = self.data_transformation_config
+            for target_file_path in (
+                config.transformed_train_target_file_path,
+                config.transformed_test_target_file_path,
+            ):
+                add_rows(len(load_numpy_array_data(target_file_path, mmap_mode="r")))
+            has_row_ids = config.row_id_column is not None
+
+            data_transformation_artifact = DataTransformationArtifact(
+                transformed_object_file_path=config.transformed_object_file_path,
+                transformed_train_file_path=config.transformed_train_file_path,
+                transformed_test_file_path=config.transformed_test_file_path,
+                transformed_train_target_file_path=config.transformed_train_target_file_path,
+                transformed_test_target_file_path=config.transformed_test_target_file_path,
+                transformed_train_row_id_file_path=(
+                    config.transformed_train_row_id_file_path if has_row_ids else None
+                ),
+                transformed_test_row_id_file_path=(
+                    config.transformed_test_row_id_file_path if has_row_ids else None
+                ),
+                transformed_train_sample_weight_file_path=(
+                    config.transformed_train_sample_weight_file_path
+                    if has_sample_weights
+                    else None
+                ),
+                transformed_test_sample_weight_file_path=(
+                    config.transformed_test_sample_weight_file_path
+                    if has_sample_weights
+                    else None
+                ),
+                reference_sketch_file_path=(
+                    self.data_validation_artifact.reference_sketch_file_path
+                ),
             )
-            test_df = DataTransformation.read_data(
-                self.data_validation_artifact.valid_test_file_path
+            return data_transformation_artifact
+
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    @staticmethod
+    def get_input_features(df: pd.DataFrame) -> pd.DataFrame:
+        """Model inputs of a frame: every column but the target and the row key"""
+        return df.drop(columns=[TARGET_COLUMN, ID_COLUMN], errors="ignore")
+
+    def get_row_ids(self, df: pd.DataFrame, offset: int = 0) -> Optional[np.ndarray]:
+        """
+        Ids of the rows of a frame from the configured row id column, or their
+        positions in the split if the column is missing. None if no row ids are stored.
+        """
+        row_id_column = self.data_transformation_config.row_id_column
+        if row_id_column is None:
+            return None
+        if row_id_column in df.columns:
+            return df[row_id_column].to_numpy(dtype=np.int64)
+        return np.arange(offset, offset + len(df), dtype=np.int64)
+
+    def get_class_weight(self, target: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Weights of the configured sample weighting indexed by label, computed on the
+        train labels as n_samples / (n_classes * class count). None if no sample
+        weights are stored.
+        """
+        sample_weight = self.data_transformation_config.sample_weight
+        if sample_weight is None:
+            return None
+        if sample_weight != "balanced":
+            raise ValueError(f"Unknown sample weight: {sample_weight}")
+        counts = np.bincount(np.asarray(target, dtype=np.int64))
+        with np.errstate(divide="ignore"):
+            class_weight = len(target) / (np.count_nonzero(counts) * counts)
+        return np.where(counts > 0, class_weight, 0.0).astype(np.float32)
+
+    def save_sample_weights(self) -> bool:
+        """
+        Save the sample weights of both splits next to their labels. Returns whether
+        sample weights were saved.
+        """
+        try:
+            config = self.data_transformation_config
+            class_weight = self.get_class_weight(
+                load_numpy_array_data(
+                    config.transformed_train_target_file_path, mmap_mode="r"
+                )
             )
+            if class_weight is None:
+                return False
+            for target_file_path, sample_weight_file_path in (
+                (
+                    config.transformed_train_target_file_path,
+                    config.transformed_train_sample_weight_file_path,
+                ),
+                (
+                    config.transformed_test_target_file_path,
+                    config.transformed_test_sample_weight_file_path,
+                ),
+            ):
+                target = load_numpy_array_data(target_file_path, mmap_mode="r")
+                save_numpy_array_data(
+                    sample_weight_file_path,
+                    array=np.take(class_weight, target, mode="clip"),
+                )
+            logging.info(f"Saved sample weights with class weights {class_weight}")
+            return True
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def transform_in_memory(self) -> Pipeline:
+        """
+        Read the validated splits into memory, fit the preprocessor on the train split
+        and save the transformed splits. Returns the fitted preprocessor.
+        """
+        try:
+            if self.data_validation_artifact.train_dataframe is not None:
+                train_df = self.data_validation_artifact.train_dataframe
+                test_df = self.data_validation_artifact.test_dataframe
+            else:
+                train_df = DataTransformation.read_data(
+                    self.data_validation_artifact.valid_train_file_path,
+                    dtypes=self._schema_dtypes,
+                )
+                test_df = DataTransformation.read_data(
+                    self.data_validation_artifact.valid_test_file_path,
+                    dtypes=self._schema_dtypes,
+                )
 
             ## training dataframe
-            input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
+            input_feature_train_df = DataTransformation.get_input_features(train_df)
             target_feature_train_df = train_df[TARGET_COLUMN]
             target_feature_train_df = target_feature_train_df.replace(-1, 0)
 
             # testing dataframe
-            input_feature_test_df = test_df.drop(columns=[TARGET_COLUMN], axis=1)
+            input_feature_test_df = DataTransformation.get_input_features(test_df)
             target_feature_test_df = test_df[TARGET_COLUMN]
             target_feature_test_df = target_feature_test_df.replace(-1, 0)
 
@@ -99,40 +253,136 @@ class DataTransformation:
                 input_feature_test_df
             )
 
-            train_arr = np.c_[
-                transformed_input_train_feature, np.array(target_feature_train_df)
-            ]
-            test_arr = np.c_[
-                transformed_input_test_feature, np.array(target_feature_test_df)
-            ]
-
-            # save numpy array data
+            # save features, labels and row ids as separate numpy arrays
+            config = self.data_transformation_config
+            feature_dtype = self.data_transformation_config.feature_dtype
+            target_dtype = self.data_transformation_config.target_dtype
             save_numpy_array_data(
                 self.data_transformation_config.transformed_train_file_path,
-                array=train_arr,
+                array=transformed_input_train_feature,
+                dtype=feature_dtype,
+            )
+            save_numpy_array_data(
+                self.data_transformation_config.transformed_train_target_file_path,
+                array=target_feature_train_df.to_numpy(),
+                dtype=target_dtype,
             )
             save_numpy_array_data(
                 self.data_transformation_config.transformed_test_file_path,
-                array=test_arr,
+                array=transformed_input_test_feature,
+                dtype=feature_dtype,
             )
-            save_object(
-                self.data_transformation_config.transformed_object_file_path,
-                preprocessor_object,
+            save_numpy_array_data(
+                self.data_transformation_config.transformed_test_target_file_path,
+                array=target_feature_test_df.to_numpy(),
+                dtype=target_dtype,
             )
+            for df, row_id_file_path in (
+                (train_df, config.transformed_train_row_id_file_path),
+                (test_df, config.transformed_test_row_id_file_path),
+            ):
+                row_ids = self.get_row_ids(df)
+                if row_ids is not None:
+                    save_numpy_array_data(row_id_file_path, array=row_ids)
+            return preprocessor_object
 
-            save_object(
-                "final_model/preprocessor.pkl",
-                preprocessor_object,
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def transform_file_out_of_core(
+        self,
+        preprocessor: Pipeline,
+        file_path: str,
+        feature_file_path: str,
+        target_file_path: str,
+        row_id_file_path: str,
+    ) -> None:
+        """
+        Transform a data file chunk by chunk into memory-mapped .npy files of the
+        features, the labels and the row ids.
+        """
+        try:
+            n_rows = count_dataframe_rows(file_path)
+            os.makedirs(os.path.dirname(feature_file_path), exist_ok=True)
+            features_out = None
+            target_out = np.lib.format.open_memmap(
+                target_file_path,
+                mode="w+",
+                dtype=self.data_transformation_config.target_dtype,
+                shape=(n_rows,),
             )
+            row_id_out = None
+            if self.data_transformation_config.row_id_column is not None:
+                row_id_out = np.lib.format.open_memmap(
+                    row_id_file_path, mode="w+", dtype=np.int64, shape=(n_rows,)
+                )
+            offset = 0
+            for chunk in iter_dataframe_chunks(
+                file_path, self.data_transformation_config.chunk_size
+            ):
+                chunk = apply_schema_dtypes(chunk, self._schema_dtypes)
+                features = preprocessor.transform(
+                    DataTransformation.get_input_features(chunk)
+                )
+                if features_out is None:
+                    features_out = np.lib.format.open_memmap(
+                        feature_file_path,
+                        mode="w+",
+                        dtype=self.data_transformation_config.feature_dtype,
+                        shape=(n_rows, features.shape[1]),
+                    )
+                end = offset + len(chunk)
+                features_out[offset:end] = features
+                target_out[offset:end] = chunk[TARGET_COLUMN].replace(-1, 0).to_numpy()
+                if row_id_out is not None:
+                    row_id_out[offset:end] = self.get_row_ids(chunk, offset)
+                offset = end
 
-            # preparing artifacts
+            if features_out is None:
+                raise ValueError(f"No rows to transform in {file_path}")
+            features_out.flush()
+            target_out.flush()
+            if row_id_out is not None:
+                row_id_out.flush()
+            logging.info(f"Transformed {offset} rows into {feature_file_path}")
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
-            data_transformation_artifact = DataTransformationArtifact(
-                transformed_object_file_path=self.data_transformation_config.transformed_object_file_path,
-                transformed_train_file_path=self.data_transformation_config.transformed_train_file_path,
-                transformed_test_file_path=self.data_transformation_config.transformed_test_file_path,
+    def transform_out_of_core(self) -> Pipeline:
+        """
+        Fit the preprocessor on the first fit_sample_size rows of the train split, which
+        is shuffled by the ingestion, and transform both splits chunk by chunk.
+        Returns the fitted preprocessor.
+        """
+        try:
+            if self.writer is not None:
+                self.writer.flush()
+            train_file_path = self.data_validation_artifact.valid_train_file_path
+            fit_df = next(
+                iter_dataframe_chunks(
+                    train_file_path, self.data_transformation_config.fit_sample_size
+                )
             )
-            return data_transformation_artifact
+            fit_df = apply_schema_dtypes(fit_df, self._schema_dtypes)
+            preprocessor_object = self.get_data_transformer_object().fit(
+                DataTransformation.get_input_features(fit_df)
+            )
+            del fit_df
 
+            self.transform_file_out_of_core(
+                preprocessor_object,
+                train_file_path,
+                self.data_transformation_config.transformed_train_file_path,
+                self.data_transformation_config.transformed_train_target_file_path,
+                self.data_transformation_config.transformed_train_row_id_file_path,
+            )
+            self.transform_file_out_of_core(
+                preprocessor_object,
+                self.data_validation_artifact.valid_test_file_path,
+                self.data_transformation_config.transformed_test_file_path,
+                self.data_transformation_config.transformed_test_target_file_path,
+                self.data_transformation_config.transformed_test_row_id_file_path,
+            )
+            return preprocessor_object
         except Exception as e:
             raise CreditCardException(e, sys)
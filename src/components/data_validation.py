@@ -2,7 +2,6 @@ import os
 import sys
 
 import pandas as pd
-from scipy.stats import ks_2samp
 
 from src.constant.training_pipeline import SCHEMA_FILE_PATH
 from src.entity.artifact_entity import (
@@ -12,7 +11,17 @@ from src.entity.artifact_entity import (
 from src.entity.config_entity import DataValidationConfig
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
-from src.utils.main_utils.utils import read_yaml_file, write_yaml_file
+from src.utils.main_utils.utils import (
+    apply_schema_dtypes,
+    get_schema_dtypes,
+    read_dataframe,
+    read_yaml_file,
+    write_yaml_file,
+)
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.instrumentation import add_rows, profiled
+from src.utils.ml_utils.validation.drift import DriftDetector, ReferenceSketch
+from src.utils.ml_utils.validation.schema import SchemaValidationResult, SchemaValidator
 
 
 class DataValidation:
@@ -20,55 +29,75 @@ class DataValidation:
         self,
         data_ingestion_artifact: DataIngestionArtifact,
         data_validation_config: DataValidationConfig,
+        writer: BackgroundWriter = None,
     ):
+        """
+        With a writer, the validated splits are handed to the next stage in the
+        artifact and their files are written in the background
+        """
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
+            self.in_process = writer is not None
+            self.writer = writer if writer is not None else BackgroundWriter(False)
             self._schema_config = read_yaml_file(SCHEMA_FILE_PATH)
+            self._schema_dtypes = get_schema_dtypes(self._schema_config)
+            self._schema_validator = SchemaValidator(self._schema_config)
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, dtypes: dict = None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, dtypes=dtypes)
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
-    def validate_schema(self, dataframe: pd.DataFrame) -> bool:
+    def validate_schema(self, dataframe: pd.DataFrame) -> SchemaValidationResult:
         try:
-            status = True
-            all_cols = list(dataframe.columns)
-            for col in self._schema_config.keys():
-                if col not in all_cols:
-                    status = False
-                    logging.warning(f"Required column:{col} is missing!")
-            return status
+            result = self._schema_validator.validate(dataframe)
+            if result.n_invalid_rows:
+                logging.warning(
+                    f"{result.n_invalid_rows} of {len(dataframe)} rows break the schema constraints"
+                )
+            return result
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
-    def detect_dataset_drift(self, base_df, current_df, threshold=0.05) -> bool:
+    def split_valid_rows(
+        self,
+        dataframe: pd.DataFrame,
+        result: SchemaValidationResult,
+        valid_file_path: str,
+        invalid_file_path: str,
+    ):
+        """
+        Write the valid rows to valid_file_path and the invalid ones, if any, to
+        invalid_file_path.
+
+        Returns:
+          valid rows and the invalid file path, None without invalid rows
+        """
         try:
-            status = True
-            report = {}
-            for column in base_df.columns:
-                d1 = base_df[column]
-                d2 = current_df[column]
-                # Detect whether they are the same distribution
-                is_same_dist = ks_2samp(d1, d2)
-                if threshold <= is_same_dist.pvalue:
-                    is_found = False
-                else:
-                    is_found = True
-                    status = False
-                report.update(
-                    {
-                        column: {
-                            "p_value": float(is_same_dist.pvalue),
-                            "drift_status": is_found,
-                        }
-                    }
+            if result.n_invalid_rows:
+                self.writer.write_dataframe(
+                    invalid_file_path, dataframe[~result.valid_rows]
                 )
+                dataframe = dataframe[result.valid_rows].reset_index(drop=True)
+            else:
+                invalid_file_path = None
+            self.writer.write_dataframe(valid_file_path, dataframe)
+            return dataframe, invalid_file_path
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def detect_dataset_drift(self, base_df, current_df, threshold=None) -> bool:
+        try:
+            drift_params = dict(self.data_validation_config.drift_params)
+            if threshold is not None:
+                drift_params["threshold"] = threshold
+            report = DriftDetector(**drift_params).detect(base_df, current_df)
+            status = not any(result["drift_status"] for result in report.values())
             drift_report_file_path = self.data_validation_config.drift_report_file_path
 
             dir_path = os.path.dirname(drift_report_file_path)
@@ -79,6 +108,40 @@ class DataValidation:
         except Exception as e:
             raise CreditCardException(e, sys) from e
 
+    def save_reference_sketch(self, dataframe: pd.DataFrame) -> ReferenceSketch:
+        """
+        Sketch the feature columns of the train data as the drift reference of the
+        model and check them against the reference of the deployed model, if there
+        is one
+        """
+        try:
+            config = self.data_validation_config
+            dataframe = dataframe.drop(
+                columns=config.sketch_exclude_columns, errors="ignore"
+            )
+            sketch = ReferenceSketch.from_frame(dataframe, **config.sketch_params)
+            write_yaml_file(config.reference_sketch_file_path, sketch.to_dict())
+
+            if os.path.exists(config.production_reference_sketch_file_path):
+                production_sketch = ReferenceSketch.from_dict(
+                    read_yaml_file(config.production_reference_sketch_file_path)
+                )
+                report = production_sketch.check(
+                    dataframe,
+                    psi_threshold=config.drift_params.get("psi_threshold", 0.2),
+                    min_rows=config.sketch_min_rows,
+                )
+                write_yaml_file(config.reference_drift_report_file_path, report)
+                drifted = [c for c, result in report.items() if result["drift_status"]]
+                if drifted:
+                    logging.warning(
+                        f"Train data drifted from the deployed model's reference: {drifted}"
+                    )
+            return sketch
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    @profiled("data_validation")
     def initiate_data_validation(self) -> DataValidationArtifact:
         try:
             validation_status = True
@@ -86,55 +149,70 @@ class DataValidation:
             train_file_path = self.data_ingestion_artifact.trained_file_path
             test_file_path = self.data_ingestion_artifact.test_file_path
 
-            train_dataframe = DataValidation.read_data(train_file_path)
-            test_dataframe = DataValidation.read_data(test_file_path)
+            if self.data_ingestion_artifact.train_dataframe is not None:
+                train_dataframe = apply_schema_dtypes(
+                    self.data_ingestion_artifact.train_dataframe, self._schema_dtypes
+                )
+                test_dataframe = apply_schema_dtypes(
+                    self.data_ingestion_artifact.test_dataframe, self._schema_dtypes
+                )
+            else:
+                train_dataframe = DataValidation.read_data(
+                    train_file_path, dtypes=self._schema_dtypes
+                )
+                test_dataframe = DataValidation.read_data(
+                    test_file_path, dtypes=self._schema_dtypes
+                )
+
+            add_rows(len(train_dataframe) + len(test_dataframe))
 
             ## validate schema
-            train_schema_status = self.validate_schema(dataframe=train_dataframe)
-            if not train_schema_status:
+            train_schema_result = self.validate_schema(dataframe=train_dataframe)
+            if not train_schema_result.status:
                 logging.warning("Schema of train dataset is not correct!")
-            test_schema_status = self.validate_schema(dataframe=test_dataframe)
-            if not test_schema_status:
+            test_schema_result = self.validate_schema(dataframe=test_dataframe)
+            if not test_schema_result.status:
                 logging.warning("Schema of test dataset is not correct!")
 
+            ## route the invalid rows out of the validated data
+            train_dataframe, invalid_train_file_path = self.split_valid_rows(
+                train_dataframe,
+                train_schema_result,
+                self.data_validation_config.valid_train_file_path,
+                self.data_validation_config.invalid_train_file_path,
+            )
+            test_dataframe, invalid_test_file_path = self.split_valid_rows(
+                test_dataframe,
+                test_schema_result,
+                self.data_validation_config.valid_test_file_path,
+                self.data_validation_config.invalid_test_file_path,
+            )
+
             ## Datadrift detection
             datadrift_status = self.detect_dataset_drift(
                 base_df=train_dataframe, current_df=test_dataframe
             )
-            if not test_schema_status:
+            if not datadrift_status:
                 logging.warning("Datadrift was detected!")
-
-            dir_path = os.path.dirname(
-                self.data_validation_config.valid_train_file_path
-            )
-            os.makedirs(dir_path, exist_ok=True)
-
-            train_dataframe.to_csv(
-                self.data_validation_config.valid_train_file_path,
-                index=False,
-                header=True,
-            )
-
-            test_dataframe.to_csv(
-                self.data_validation_config.valid_test_file_path,
-                index=False,
-                header=True,
-            )
+            self.save_reference_sketch(train_dataframe)
 
             if (
                 not datadrift_status
-                or not test_schema_status
-                or not train_schema_status
+                or not test_schema_result.status
+                or not train_schema_result.status
             ):
                 validation_status = False
 
             data_validation_artifact = DataValidationArtifact(
                 validation_status=validation_status,
-                valid_train_file_path=self.data_ingestion_artifact.trained_file_path,
-                valid_test_file_path=self.data_ingestion_artifact.test_file_path,
-                invalid_train_file_path=None,
-                invalid_test_file_path=None,
+                valid_train_file_path=self.data_validation_config.valid_train_file_path,
+                valid_test_file_path=self.data_validation_config.valid_test_file_path,
+                invalid_train_file_path=invalid_train_file_path,
+                invalid_test_file_path=invalid_test_file_path,
                 drift_report_file_path=self.data_validation_config.drift_report_file_path,
+                reference_sketch_file_path=self.data_validation_config.reference_sketch_file_path,
+                train_dataframe=train_dataframe if self.in_process else None,
+                test_dataframe=test_dataframe if self.in_process else None,
             )
             return data_validation_artifact
         except Exception as e:
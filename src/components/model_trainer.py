@@ -1,6 +1,8 @@
 import os
 import sys
 
+import numpy as np
+
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
 
@@ -9,18 +11,32 @@ from src.entity.artifact_entity import (
     ModelTrainerArtifact,
 )
 from src.entity.config_entity import ModelTrainerConfig
+from src.constant.training_pipeline import ID_COLUMN, SCHEMA_FILE_PATH, TARGET_COLUMN
 
 
 from src.utils.ml_utils.model.estimator import CreditCardModel
+from src.utils.ml_utils.model.fit_cache import FitCache
+from src.utils.ml_utils.model.model_selection import ModelSelector
+from src.utils.ml_utils.model.out_of_core import fit_out_of_core
+from src.utils.main_utils.instrumentation import add_rows, profiled
 from src.utils.main_utils.utils import save_object, load_object
+from src.utils.main_utils.model_artifact import save_model_artifact
 from src.utils.main_utils.utils import (
     load_numpy_array_data,
     evaluate_models,
+    read_yaml_file,
+    write_yaml_file,
 )
+from src.utils.ml_utils.validation.drift import ReferenceSketch
+from src.utils.ml_utils.validation.schema import SchemaValidator
 from src.utils.ml_utils.metric.classification_metric import (
     get_classification_score,
+    get_positive_scores,
+    select_threshold,
 )
 
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
 from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import (
@@ -76,6 +92,12 @@ class ModelTrainer:
                 mlflow.log_metric("f1_score", f1_score)
                 mlflow.log_metric("precision", precision_score)
                 mlflow.log_metric("recall_score", recall_score)
+                if classificationmetric.pr_auc is not None:
+                    mlflow.log_metric("pr_auc", classificationmetric.pr_auc)
+                if classificationmetric.recall_at_precision is not None:
+                    mlflow.log_metric(
+                        "recall_at_precision", classificationmetric.recall_at_precision
+                    )
 
                 # Save only the model's state dict if possible
                 if hasattr(best_model, "state_dict"):
@@ -102,13 +124,81 @@ class ModelTrainer:
             # Continue execution even if MLflow tracking fails
             pass
 
-    def train_model(self, X_train, y_train, x_test, y_test):
+    def get_search_sample(self, X_train, y_train, sample_weight=None):
+        """
+        Draw the rows the model search runs on from memory-mapped training data
+        """
+        sample_size = self.model_trainer_config.search_sample_size
+        if not sample_size or len(X_train) <= sample_size:
+            rows = slice(None)
+        else:
+            rng = np.random.default_rng(42)
+            rows = np.sort(rng.choice(len(X_train), sample_size, replace=False))
+            logging.info(f"Searching models on {sample_size} of {len(X_train)} rows")
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight[rows])
+        return np.asarray(X_train[rows]), np.asarray(y_train[rows]), sample_weight
+
+    def tune_threshold(
+        self, model, X, y, sample_weight=None, fit_cache: FitCache = None
+    ) -> float:
+        """
+        Decision threshold of the model, chosen on out-of-fold probabilities of the
+        training rows, or on their scores if no folds are configured. The
+        out-of-fold probabilities are read from the fit cache when it holds them
+        """
+        try:
+            threshold_params = self.model_trainer_config.threshold_params
+            method = threshold_params.get("method")
+            if method is None:
+                return 0.5
+            cv = threshold_params.get("cv", 3)
+            if cv:
+                key, y_score = None, None
+                if fit_cache is not None:
+                    key = FitCache.make_key(
+                        FitCache.hash_arrays(X, y, sample_weight),
+                        FitCache.describe_estimator(model, {}),
+                        "oof",
+                        cv,
+                    )
+                    y_score = fit_cache.get(key)
+                if y_score is None:
+                    fit_params = {}
+                    if sample_weight is not None:
+                        fit_params["sample_weight"] = np.asarray(sample_weight)
+                    y_score = cross_val_predict(
+                        clone(model),
+                        X,
+                        y,
+                        cv=StratifiedKFold(cv, shuffle=True, random_state=42),
+                        method="predict_proba",
+                        n_jobs=self.model_trainer_config.search_params.get("n_jobs"),
+                        params=fit_params,
+                    )[:, 1]
+                    if key is not None:
+                        fit_cache.set(key, y_score)
+            else:
+                y_score = get_positive_scores(model, X)
+            threshold = select_threshold(
+                y,
+                y_score,
+                method=method,
+                target_precision=threshold_params.get("target_precision", 0.9),
+                cost_ratio=threshold_params.get("cost_ratio", 10.0),
+            )
+            logging.info(f"Tuned the decision threshold to {threshold:.4f} ({method})")
+            return threshold
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def train_model(self, X_train, y_train, x_test, y_test, sample_weight=None):
         models = {
             "Random Forest": RandomForestClassifier(),
             "Decision Tree": DecisionTreeClassifier(),
             "Gradient Boosting": GradientBoostingClassifier(),
             "Logistic Regression": LogisticRegression(),
-            "AdaBoost": AdaBoostClassifier(algorithm="SAMME"),
+            "AdaBoost": AdaBoostClassifier(),
             "XGBoost": XGBClassifier(),
         }
         params = {
@@ -133,13 +223,36 @@ class ModelTrainer:
                 "subsample": [0.7, 0.9],
             },
         }
+        if self.model_trainer_config.out_of_core:
+            X_search, y_search, search_weight = self.get_search_sample(
+                X_train, y_train, sample_weight
+            )
+        else:
+            X_search, y_search, search_weight = X_train, y_train, sample_weight
+
+        fit_cache = None
+        if self.model_trainer_config.fit_cache_dir is not None:
+            fit_cache = FitCache(
+                self.model_trainer_config.fit_cache_dir,
+                max_bytes=self.model_trainer_config.fit_cache_max_bytes,
+            )
+
+        selector = ModelSelector(
+            metric=self.model_trainer_config.selection_metric,
+            min_precision=self.model_trainer_config.min_precision,
+        )
         model_report: dict = evaluate_models(
-            X_train=X_train,
-            y_train=y_train,
+            X_train=X_search,
+            y_train=y_search,
             X_test=x_test,
             y_test=y_test,
             models=models,
             param=params,
+            sample_weight=search_weight,
+            search_params=self.model_trainer_config.search_params,
+            fit_cache=fit_cache,
+            selector=selector,
+            checkpoint_dir=self.model_trainer_config.search_checkpoint_dir,
         )
 
         ## To get best model score from dict
@@ -151,18 +264,48 @@ class ModelTrainer:
             list(model_report.values()).index(best_model_score)
         ]
         best_model = models[best_model_name]
-        y_train_pred = best_model.predict(X_train)
+        logging.info(
+            f"Best model {best_model_name} with test "
+            f"{selector.metric} {best_model_score:.4f}"
+        )
+        # the test scores of the selection are reused unless the model is refitted
+        y_test_score = selector.scores_[best_model_name].y_score
+        if not self.model_trainer_config.out_of_core:
+            threshold = self.tune_threshold(
+                best_model, X_train, y_train, sample_weight, fit_cache
+            )
+            y_train_score = get_positive_scores(best_model, X_train)
+        else:
+            threshold = self.tune_threshold(
+                best_model, X_search, y_search, search_weight, fit_cache
+            )
+            best_model = fit_out_of_core(
+                best_model,
+                X_train,
+                y_train,
+                chunk_size=self.model_trainer_config.chunk_size,
+                cache_dir=self.model_trainer_config.external_memory_dir,
+                sample_weight=sample_weight,
+            )
+            y_test_score = get_positive_scores(best_model, x_test)
+            y_train_score = get_positive_scores(best_model, X_train)
+        min_precision = self.model_trainer_config.min_precision
 
         classification_train_metric = get_classification_score(
-            y_true=y_train, y_pred=y_train_pred
+            y_true=y_train,
+            y_score=y_train_score,
+            threshold=threshold,
+            min_precision=min_precision,
         )
 
         ## Track the experiements with mlflow
         self.track_mlflow(best_model, classification_train_metric)
 
-        y_test_pred = best_model.predict(x_test)
         classification_test_metric = get_classification_score(
-            y_true=y_test, y_pred=y_test_pred
+            y_true=y_test,
+            y_score=y_test_score,
+            threshold=threshold,
+            min_precision=min_precision,
         )
 
         self.track_mlflow(best_model, classification_test_metric)
@@ -177,6 +320,24 @@ class ModelTrainer:
         os.makedirs(model_dir_path, exist_ok=True)
 
         try:
+            # Keep the drift reference of the train data next to the model
+            reference_sketch = None
+            reference_sketch_file_path = None
+            if self.data_transformation_artifact.reference_sketch_file_path is not None:
+                reference_sketch = ReferenceSketch.from_dict(
+                    read_yaml_file(
+                        self.data_transformation_artifact.reference_sketch_file_path
+                    )
+                )
+                reference_sketch_file_path = (
+                    self.model_trainer_config.reference_sketch_file_path
+                )
+                for file_path in (
+                    reference_sketch_file_path,
+                    self.model_trainer_config.final_reference_sketch_file_path,
+                ):
+                    write_yaml_file(file_path, reference_sketch.to_dict())
+
             # Create model directory if it doesn't exist
             os.makedirs("final_model", exist_ok=True)
             
@@ -185,8 +346,27 @@ class ModelTrainer:
             save_object("final_model/preprocessor.pkl", preprocessor)
             
             # Save the complete pipeline
-            CreditCard_Model = CreditCardModel(preprocessor=preprocessor, model=best_model)
-            save_object(self.model_trainer_config.trained_model_file_path, obj=CreditCard_Model)
+            CreditCard_Model = CreditCardModel(
+                preprocessor=preprocessor,
+                model=best_model,
+                threshold=threshold,
+                reference_sketch=reference_sketch,
+                schema_validator=SchemaValidator(
+                    read_yaml_file(SCHEMA_FILE_PATH),
+                    exclude=[TARGET_COLUMN, ID_COLUMN],
+                ),
+            )
+            # compiled first, so the flattened trees of the scorer are saved too
+            CreditCard_Model.compile()
+            for file_path in (
+                self.model_trainer_config.trained_model_file_path,
+                self.model_trainer_config.final_model_file_path,
+            ):
+                save_model_artifact(
+                    file_path,
+                    CreditCard_Model,
+                    compression=self.model_trainer_config.artifact_compression,
+                )
             
             logging.info("Model, preprocessor and pipeline saved successfully")
             
@@ -198,30 +378,43 @@ class ModelTrainer:
             trained_model_file_path=self.model_trainer_config.trained_model_file_path,
             train_metric_artifact=classification_train_metric,
             test_metric_artifact=classification_test_metric,
+            threshold=threshold,
+            reference_sketch_file_path=reference_sketch_file_path,
         )
         logging.info(f"Model trainer artifact: {model_trainer_artifact}")
         return model_trainer_artifact
 
+    @profiled("model_trainer")
     def initiate_model_trainer(self) -> ModelTrainerArtifact:
         try:
-            train_file_path = (
-                self.data_transformation_artifact.transformed_train_file_path
+            artifact = self.data_transformation_artifact
+
+            # The arrays are memory-mapped, so all model searches share one
+            # page-cached copy of the data
+            x_train = load_numpy_array_data(
+                artifact.transformed_train_file_path, mmap_mode="r"
+            )
+            y_train = load_numpy_array_data(
+                artifact.transformed_train_target_file_path, mmap_mode="r"
+            )
+            x_test = load_numpy_array_data(
+                artifact.transformed_test_file_path, mmap_mode="r"
             )
-            test_file_path = (
-                self.data_transformation_artifact.transformed_test_file_path
+            y_test = load_numpy_array_data(
+                artifact.transformed_test_target_file_path, mmap_mode="r"
             )
 
-            train_arr = load_numpy_array_data(train_file_path)
-            test_arr = load_numpy_array_data(test_file_path)
+            add_rows(len(x_train) + len(x_test))
 
-            x_train, y_train, x_test, y_test = (
-                train_arr[:, :-1],
-                train_arr[:, -1],
-                test_arr[:, :-1],
-                test_arr[:, -1],
-            )
+            sample_weight = None
+            if artifact.transformed_train_sample_weight_file_path is not None:
+                sample_weight = load_numpy_array_data(
+                    artifact.transformed_train_sample_weight_file_path, mmap_mode="r"
+                )
 
-            model_trainer_artifact = self.train_model(x_train, y_train, x_test, y_test)
+            model_trainer_artifact = self.train_model(
+                x_train, y_train, x_test, y_test, sample_weight=sample_weight
+            )
             return model_trainer_artifact
 
         except Exception as e:
@@ -1,5 +1,6 @@
 import os
 import sys
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -8,6 +9,8 @@ import pandas as pd
 defining common constant variable for training pipeline
 """
 TARGET_COLUMN = "Class"
+## row key of the transactions, kept as row ids but never a model input
+ID_COLUMN = "id"
 PIPELINE_NAME: str = "CreditCardFraud"
 ARTIFACT_DIR: str = "Artifacts"
 FILE_NAME: str = "creditcard_2023.csv"
@@ -15,6 +18,32 @@ FILE_NAME: str = "creditcard_2023.csv"
 TRAIN_FILE_NAME: str = "train.csv"
 TEST_FILE_NAME: str = "test.csv"
 
+## file format of the feature store and the train/test split artifacts,
+## "parquet", "feather" (Arrow IPC) or "csv"
+DATA_ARTIFACT_FORMAT: str = "parquet"
+DATA_ARTIFACT_FILE_EXTENSIONS: dict = {
+    "parquet": ".parquet",
+    "feather": ".arrow",
+    "csv": ".csv",
+}
+
+## hand the train/test frames from stage to stage in process and write the stage
+## files on a background thread, False reads every stage input back from disk
+TRAINING_PIPELINE_IN_PROCESS: bool = True
+## artifacts of the stages keyed by a fingerprint of their inputs, config and code,
+## unchanged stages reuse the artifacts of a previous run. None runs every stage
+TRAINING_PIPELINE_STAGE_CACHE_DIR: Optional[str] = os.path.join(ARTIFACT_DIR, "stage_cache")
+## wall/CPU time, peak RSS, rows and bytes read/written of every stage and model
+## family, written as a JSON run report to the artifact dir and exported as
+## "prometheus" text next to it and/or as "mlflow" metrics
+TRAINING_PIPELINE_RUN_REPORT_FILE_NAME: str = "run_report.json"
+TRAINING_PIPELINE_PROMETHEUS_FILE_NAME: str = "run_metrics.prom"
+TRAINING_PIPELINE_PROFILE_EXPORTS: tuple = ("prometheus",)
+TRAINING_PIPELINE_PROFILE_SAMPLE_INTERVAL: float = 0.05
+## every stage writes its artifact as JSON and a completion marker to the run dir,
+## a run resumed from that dir continues after the last completed stage
+TRAINING_PIPELINE_CHECKPOINT_DIR_NAME: str = "checkpoints"
+
 SCHEMA_FILE_PATH = os.path.join("data_schema", "schema.yaml")
 
 SAVED_MODEL_DIR = os.path.join("saved_models")
@@ -30,6 +59,30 @@ DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE_DIR: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATION: float = 0.2
+## seed of the train test split, so re-runs on unchanged data reuse cached fits
+DATA_INGESTION_RANDOM_STATE: Optional[int] = 42
+DATA_INGESTION_FALLBACK_FILE_PATH: str = os.path.join("data", FILE_NAME)
+
+## "streaming" reads the collection through a batched cursor, "full" loads it at once,
+## "parallel" reads key ranges of the collection with a pool of threads
+DATA_INGESTION_EXPORT_MODE: str = "streaming"
+DATA_INGESTION_BATCH_SIZE: int = 10000
+## number of rows sampled from the data, None to train on all rows
+DATA_INGESTION_SAMPLE_SIZE: Optional[int] = 10000
+DATA_INGESTION_NUM_WORKERS: int = 4
+DATA_INGESTION_PARTITION_KEY: str = "id"
+## seconds the source fingerprint waits for MongoDB before it falls back to the
+## local file, instead of the 30 s server selection timeout of the client
+DATA_INGESTION_FINGERPRINT_TIMEOUT: float = 3.0
+
+## incremental ingestion only fetches the documents above the watermark of the
+## previous run and appends them as a partition of a persistent feature store
+DATA_INGESTION_INCREMENTAL: bool = False
+DATA_INGESTION_WATERMARK_KEY: str = "id"
+DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR: str = os.path.join(
+    ARTIFACT_DIR, "feature_store"
+)
+DATA_INGESTION_WATERMARK_FILE_NAME: str = "watermark.yaml"
 
 """
 Data Validation related constant start with DATA_VALIDATION VAR NAME
@@ -39,6 +92,32 @@ DATA_VALIDATION_VALID_DIR: str = "validated"
 DATA_VALIDATION_INVALID_DIR: str = "invalid"
 DATA_VALIDATION_DRIFT_REPORT_DIR: str = "drift_report"
 DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.yaml"
+## "ks" runs a vectorized two-sample KS test per column (drift below the p-value
+## threshold), "psi" the cheaper population stability index over quantile bins
+## (drift above psi_threshold). Columns are tested in blocks, in a process pool
+## of n_jobs workers once the frames hold min_parallel_cells values (rows x columns)
+DATA_VALIDATION_DRIFT_PARAMS: dict = {
+    "method": "ks",
+    "threshold": 0.05,
+    "psi_threshold": 0.2,
+    "n_bins": 10,
+    "n_jobs": -1,
+    "block_size": 8,
+    "min_parallel_cells": 20_000_000,
+}
+## per-column sketch of the train data stored next to the model, new batches are
+## checked against it (PSI above the drift psi_threshold) from min_rows rows on
+DATA_VALIDATION_REFERENCE_SKETCH_FILE_NAME: str = "reference_sketch.yaml"
+DATA_VALIDATION_REFERENCE_DRIFT_REPORT_FILE_NAME: str = "reference_report.yaml"
+DATA_VALIDATION_SKETCH_PARAMS: dict = {
+    "n_bins": 10,
+    "n_quantiles": 101,
+    "max_samples": 100000,
+}
+DATA_VALIDATION_SKETCH_MIN_ROWS: int = 100
+## only the model inputs are sketched: new transactions always have ids outside
+## the train range, so sketching the row key would flag drift on every batch
+DATA_VALIDATION_SKETCH_EXCLUDE_COLUMNS: list = [ID_COLUMN, TARGET_COLUMN]
 PREPROCESSING_OBJECT_FILE_NAME = "preprocessing.pkl"
 
 """
@@ -48,12 +127,34 @@ DATA_TRANSFORMATION_DIR_NAME: str = "data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR: str = "transformed"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR: str = "transformed_object"
 
-## kkn imputer to replace nan values
+## imputer to replace nan values, the method is one of "knn", "knn_tree"
+## (knn over a tree index of a capped reference sample), "median", "mean",
+## "most_frequent" or "iterative"
 DATA_TRANSFORMATION_IMPUTER_PARAMS: dict = {
+    "method": "knn_tree",
     "missing_values": np.nan,
     "n_neighbors": 3,
     "weights": "uniform",
+    "max_reference_samples": 50000,
+    "max_iter": 10,
 }
+
+## out-of-core transformation, the preprocessor is fitted on the first rows of the
+## shuffled train split and the splits are transformed chunk by chunk into
+## memory-mapped .npy files
+DATA_TRANSFORMATION_OUT_OF_CORE: bool = False
+DATA_TRANSFORMATION_CHUNK_SIZE: int = 100000
+DATA_TRANSFORMATION_FIT_SAMPLE_SIZE: int = 100000
+
+## transformed features and labels are stored as separate arrays of these dtypes
+DATA_TRANSFORMATION_FEATURE_DTYPE: str = "float32"
+DATA_TRANSFORMATION_TARGET_DTYPE: str = "int8"
+## column stored next to the transformed arrays to join results back to the rows,
+## None to skip the row ids
+DATA_TRANSFORMATION_ROW_ID_COLUMN: Optional[str] = ID_COLUMN
+## "balanced" stores class-balanced sample weights used to fit the models, None to skip
+DATA_TRANSFORMATION_SAMPLE_WEIGHT: Optional[str] = None
+
 DATA_TRANSFORMATION_TRAIN_FILE_PATH: str = "train.npy"
 
 DATA_TRANSFORMATION_TEST_FILE_PATH: str = "test.npy"
@@ -66,9 +167,82 @@ Model Trainer ralated constant start with MODE TRAINER VAR NAME
 MODEL_TRAINER_DIR_NAME: str = "model_trainer"
 MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str = "model.pkl"
+## the full CreditCardModel (preprocessor, model, threshold, sketch and schema) is also
+## published to the final model dir, next to the bare model and preprocessor
+MODEL_TRAINER_FINAL_MODEL_NAME: str = "credit_card_model.pkl"
+## the CreditCardModel is saved as a model artifact, its arrays and XGBoost model
+## (native UBJ) out of band. None memory-maps them on load, "lz4", "zstd" (both
+## optional packages) or "zlib" compress them instead
+MODEL_TRAINER_ARTIFACT_COMPRESSION: Optional[str] = None
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.6
 MODEL_TRAINER_OVER_FIITING_UNDER_FITTING_THRESHOLD: float = 0.05
 
+## hyperparameter search shared by all model families, method "halving" or "random",
+## time_budget in seconds and max_trials in candidate evaluations (None for no limit)
+MODEL_TRAINER_SEARCH_PARAMS: dict = {
+    "method": "halving",
+    "scoring": "average_precision",
+    "cv": 3,
+    "n_jobs": -1,
+    "n_candidates": 20,
+    "factor": 3,
+    "min_resources": 1000,
+    "batch_size": 4,
+    "patience": 2,
+    "time_budget": None,
+    "max_trials": None,
+    "random_state": 42,
+}
+## metric the best model is selected by on the test data, one of "pr_auc",
+## "recall_at_precision", "best_f1" or "f1", and the precision recall is measured at
+MODEL_TRAINER_SELECTION_METRIC: str = "pr_auc"
+MODEL_TRAINER_MIN_PRECISION: float = 0.9
+## decision threshold stored with the model, tuned on out-of-fold probabilities of the
+## train data ("cv" folds, 0 to tune on the train scores). method "precision" for the
+## best recall at target_precision, "cost" for the least false positives +
+## cost_ratio * false negatives, "f1" for the best f1, None to keep 0.5
+MODEL_TRAINER_THRESHOLD_PARAMS: dict = {
+    "method": "precision",
+    "target_precision": MODEL_TRAINER_MIN_PRECISION,
+    "cost_ratio": 10.0,
+    "cv": 3,
+}
+## fold scores and fitted estimators of the model search, and the out-of-fold
+## probabilities the threshold is tuned on, are cached across runs, the least
+## recently used entries are evicted beyond the size limit. None disables it
+MODEL_TRAINER_FIT_CACHE_DIR: Optional[str] = os.path.join(ARTIFACT_DIR, "fit_cache")
+MODEL_TRAINER_FIT_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+## the result of every model family is checkpointed in the run dir once searched,
+## so a resumed run only searches the families left
+MODEL_TRAINER_SEARCH_CHECKPOINT_DIR_NAME: str = "search_checkpoints"
+
+## out-of-core training, the model search runs on a sample of the memory-mapped
+## train data and the best model is refitted on all rows in chunks (estimators
+## with partial_fit) or through an external-memory DMatrix (XGBoost)
+MODEL_TRAINER_OUT_OF_CORE: bool = False
+MODEL_TRAINER_SEARCH_SAMPLE_SIZE: int = 50000
+MODEL_TRAINER_CHUNK_SIZE: int = 100000
+MODEL_TRAINER_EXTERNAL_MEMORY_DIR_NAME: str = "external_memory"
+
+"""
+Serving related constant start with SERVING VAR NAME
+"""
+
+## model loaded once at startup of the FastAPI service
+SERVING_MODEL_FILE_PATH: str = os.path.join("final_model", MODEL_TRAINER_FINAL_MODEL_NAME)
+## concurrent /predict requests are coalesced into micro-batches of up to
+## max_batch_size records, waiting at most max_wait seconds after the first request,
+## and scored on a pool of n_workers threads
+SERVING_MAX_BATCH_SIZE: int = 64
+SERVING_MAX_WAIT: float = 0.002
+SERVING_N_WORKERS: int = 2
+## the model file is polled for new versions every poll_interval seconds, which are
+## swapped in atomically; the last versions_kept versions stay loaded for rollback
+SERVING_MODEL_POLL_INTERVAL: float = 5.0
+SERVING_MODEL_VERSIONS_KEPT: int = 2
+SERVING_HOST: str = "0.0.0.0"
+SERVING_PORT: int = 8000
+
 TRAINING_BUCKET_NAME = "creditcardfraud"
 
 # Azure ML constants
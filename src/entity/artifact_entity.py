@@ -1,10 +1,20 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Optional, get_args, get_type_hints
+
+import pandas as pd
 
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path: str
     test_file_path: str
+    # splits handed to the next stage in process, while the files are written
+    train_dataframe: Optional[pd.DataFrame] = field(
+        default=None, repr=False, compare=False
+    )
+    test_dataframe: Optional[pd.DataFrame] = field(
+        default=None, repr=False, compare=False
+    )
 
 
 @dataclass
@@ -12,9 +22,18 @@ class DataValidationArtifact:
     validation_status: bool
     valid_train_file_path: str
     valid_test_file_path: str
-    invalid_train_file_path: str
-    invalid_test_file_path: str
+    # None when every row passed the schema constraints
+    invalid_train_file_path: Optional[str]
+    invalid_test_file_path: Optional[str]
     drift_report_file_path: str
+    reference_sketch_file_path: Optional[str] = None
+    # validated splits handed to the next stage in process
+    train_dataframe: Optional[pd.DataFrame] = field(
+        default=None, repr=False, compare=False
+    )
+    test_dataframe: Optional[pd.DataFrame] = field(
+        default=None, repr=False, compare=False
+    )
 
 
 @dataclass
@@ -22,6 +41,13 @@ class DataTransformationArtifact:
     transformed_object_file_path: str
     transformed_train_file_path: str
     transformed_test_file_path: str
+    transformed_train_target_file_path: str
+    transformed_test_target_file_path: str
+    transformed_train_row_id_file_path: Optional[str] = None
+    transformed_test_row_id_file_path: Optional[str] = None
+    transformed_train_sample_weight_file_path: Optional[str] = None
+    transformed_test_sample_weight_file_path: Optional[str] = None
+    reference_sketch_file_path: Optional[str] = None
 
 
 @dataclass
@@ -29,6 +55,8 @@ class ClassificationMetricArtifact:
     f1_score: float
     precision_score: float
     recall_score: float
+    pr_auc: Optional[float] = None
+    recall_at_precision: Optional[float] = None
 
 
 @dataclass
@@ -36,3 +64,34 @@ class ModelTrainerArtifact:
     trained_model_file_path: str
     train_metric_artifact: ClassificationMetricArtifact
     test_metric_artifact: ClassificationMetricArtifact
+    threshold: float = 0.5
+    reference_sketch_file_path: Optional[str] = None
+
+
+def artifact_to_dict(artifact) -> dict:
+    """Plain dict of an artifact and its nested artifacts, without in-process frames"""
+    content = {}
+    for artifact_field in fields(artifact):
+        if not artifact_field.compare:
+            continue
+        value = getattr(artifact, artifact_field.name)
+        content[artifact_field.name] = (
+            artifact_to_dict(value) if is_dataclass(value) else value
+        )
+    return content
+
+
+def artifact_from_dict(artifact_class, content: dict):
+    """Rebuild an artifact of artifact_class from artifact_to_dict output"""
+    hints = get_type_hints(artifact_class)
+    kwargs = {}
+    for artifact_field in fields(artifact_class):
+        if artifact_field.name not in content:
+            continue
+        value = content[artifact_field.name]
+        if isinstance(value, dict):
+            hint = hints[artifact_field.name]
+            nested = [hint, *get_args(hint)]
+            value = artifact_from_dict(next(filter(is_dataclass, nested)), value)
+        kwargs[artifact_field.name] = value
+    return artifact_class(**kwargs)
@@ -1,21 +1,44 @@
 import os
 from datetime import datetime
+from typing import Optional
 
 from src.constant import training_pipeline
 
 
+def get_artifact_file_name(file_name: str, artifact_format: str) -> str:
+    """Swap the extension of file_name for the one of the artifact format"""
+    extension = training_pipeline.DATA_ARTIFACT_FILE_EXTENSIONS[artifact_format]
+    return os.path.splitext(file_name)[0] + extension
+
+
 class TrainingPipelineConfig:
-    def __init__(self, timestamp=datetime.now()):
+    def __init__(
+        self, timestamp: Optional[datetime] = None, artifact_dir: Optional[str] = None
+    ):
+        """
+        timestamp: time of the run, now by default
+        artifact_dir: run dir to continue, a new dir of the timestamp by default
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
         timestamp = timestamp.strftime("%m_%d_%Y_%H_%M_%S")
+        if artifact_dir is not None:
+            # a continued run keeps the timestamp of its dir
+            timestamp = os.path.basename(os.path.normpath(artifact_dir))
         self.pipeline_name = training_pipeline.PIPELINE_NAME
         self.artifact_name = training_pipeline.ARTIFACT_DIR
-        self.artifact_dir = os.path.join(self.artifact_name, timestamp)
+        self.artifact_dir = artifact_dir or os.path.join(self.artifact_name, timestamp)
+        self.checkpoint_dir = os.path.join(
+            self.artifact_dir, training_pipeline.TRAINING_PIPELINE_CHECKPOINT_DIR_NAME
+        )
         self.model_dir = os.path.join("final_model")
         self.timestamp: str = timestamp
+        self.artifact_format: str = training_pipeline.DATA_ARTIFACT_FORMAT
 
 
 class DataIngestionConfig:
     def __init__(self, training_pipeline_config: TrainingPipelineConfig):
+        artifact_format = training_pipeline_config.artifact_format
         self.data_ingestion_dir: str = os.path.join(
             training_pipeline_config.artifact_dir,
             training_pipeline.DATA_INGESTION_DIR_NAME,
@@ -23,27 +46,55 @@ class DataIngestionConfig:
         self.feature_store_file_path: str = os.path.join(
             self.data_ingestion_dir,
             training_pipeline.DATA_INGESTION_FEATURE_STORE_DIR,
-            training_pipeline.FILE_NAME,
+            get_artifact_file_name(training_pipeline.FILE_NAME, artifact_format),
         )
         self.training_file_path: str = os.path.join(
             self.data_ingestion_dir,
             training_pipeline.DATA_INGESTION_INGESTED_DIR,
-            training_pipeline.TRAIN_FILE_NAME,
+            get_artifact_file_name(training_pipeline.TRAIN_FILE_NAME, artifact_format),
         )
         self.testing_file_path: str = os.path.join(
             self.data_ingestion_dir,
             training_pipeline.DATA_INGESTION_INGESTED_DIR,
-            training_pipeline.TEST_FILE_NAME,
+            get_artifact_file_name(training_pipeline.TEST_FILE_NAME, artifact_format),
         )
         self.train_test_split_ratio: float = (
             training_pipeline.DATA_INGESTION_TRAIN_TEST_SPLIT_RATION
         )
+        self.random_state: Optional[int] = training_pipeline.DATA_INGESTION_RANDOM_STATE
         self.collection_name: str = training_pipeline.DATA_INGESTION_COLLECTION_NAME
         self.database_name: str = training_pipeline.DATA_INGESTION_DATABASE_NAME
+        self.fallback_file_path: str = (
+            training_pipeline.DATA_INGESTION_FALLBACK_FILE_PATH
+        )
+        self.export_mode: str = training_pipeline.DATA_INGESTION_EXPORT_MODE
+        self.batch_size: int = training_pipeline.DATA_INGESTION_BATCH_SIZE
+        self.sample_size: Optional[int] = training_pipeline.DATA_INGESTION_SAMPLE_SIZE
+        self.num_workers: int = training_pipeline.DATA_INGESTION_NUM_WORKERS
+        self.partition_key: str = training_pipeline.DATA_INGESTION_PARTITION_KEY
+        self.fingerprint_timeout: float = (
+            training_pipeline.DATA_INGESTION_FINGERPRINT_TIMEOUT
+        )
+        self.incremental: bool = training_pipeline.DATA_INGESTION_INCREMENTAL
+        self.watermark_key: str = training_pipeline.DATA_INGESTION_WATERMARK_KEY
+        self.persistent_feature_store_dir: str = (
+            training_pipeline.DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR
+        )
+        self.watermark_file_path: str = os.path.join(
+            self.persistent_feature_store_dir,
+            training_pipeline.DATA_INGESTION_WATERMARK_FILE_NAME,
+        )
+        self.feature_store_partition_file_path: str = os.path.join(
+            self.persistent_feature_store_dir,
+            get_artifact_file_name(
+                f"part_{training_pipeline_config.timestamp}", artifact_format
+            ),
+        )
 
 
 class DataValidationConfig:
     def __init__(self, training_pipeline_config: TrainingPipelineConfig):
+        artifact_format = training_pipeline_config.artifact_format
         self.data_validation_dir: str = os.path.join(
             training_pipeline_config.artifact_dir,
             training_pipeline.DATA_VALIDATION_DIR_NAME,
@@ -55,22 +106,47 @@ class DataValidationConfig:
             self.data_validation_dir, training_pipeline.DATA_VALIDATION_INVALID_DIR
         )
         self.valid_train_file_path: str = os.path.join(
-            self.valid_data_dir, training_pipeline.TRAIN_FILE_NAME
+            self.valid_data_dir,
+            get_artifact_file_name(training_pipeline.TRAIN_FILE_NAME, artifact_format),
         )
         self.valid_test_file_path: str = os.path.join(
-            self.valid_data_dir, training_pipeline.TEST_FILE_NAME
+            self.valid_data_dir,
+            get_artifact_file_name(training_pipeline.TEST_FILE_NAME, artifact_format),
         )
         self.invalid_train_file_path: str = os.path.join(
-            self.invalid_data_dir, training_pipeline.TRAIN_FILE_NAME
+            self.invalid_data_dir,
+            get_artifact_file_name(training_pipeline.TRAIN_FILE_NAME, artifact_format),
         )
         self.invalid_test_file_path: str = os.path.join(
-            self.invalid_data_dir, training_pipeline.TEST_FILE_NAME
+            self.invalid_data_dir,
+            get_artifact_file_name(training_pipeline.TEST_FILE_NAME, artifact_format),
         )
         self.drift_report_file_path: str = os.path.join(
             self.data_validation_dir,
             training_pipeline.DATA_VALIDATION_DRIFT_REPORT_DIR,
             training_pipeline.DATA_VALIDATION_DRIFT_REPORT_FILE_NAME,
         )
+        self.drift_params: dict = training_pipeline.DATA_VALIDATION_DRIFT_PARAMS
+        self.reference_sketch_file_path: str = os.path.join(
+            self.data_validation_dir,
+            training_pipeline.DATA_VALIDATION_DRIFT_REPORT_DIR,
+            training_pipeline.DATA_VALIDATION_REFERENCE_SKETCH_FILE_NAME,
+        )
+        self.reference_drift_report_file_path: str = os.path.join(
+            self.data_validation_dir,
+            training_pipeline.DATA_VALIDATION_DRIFT_REPORT_DIR,
+            training_pipeline.DATA_VALIDATION_REFERENCE_DRIFT_REPORT_FILE_NAME,
+        )
+        # sketch of the data the deployed model was trained on
+        self.production_reference_sketch_file_path: str = os.path.join(
+            training_pipeline_config.model_dir,
+            training_pipeline.DATA_VALIDATION_REFERENCE_SKETCH_FILE_NAME,
+        )
+        self.sketch_params: dict = training_pipeline.DATA_VALIDATION_SKETCH_PARAMS
+        self.sketch_min_rows: int = training_pipeline.DATA_VALIDATION_SKETCH_MIN_ROWS
+        self.sketch_exclude_columns: list = (
+            training_pipeline.DATA_VALIDATION_SKETCH_EXCLUDE_COLUMNS
+        )
 
 
 class DataTransformationConfig:
@@ -89,11 +165,54 @@ class DataTransformationConfig:
             training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
             training_pipeline.TEST_FILE_NAME.replace("csv", "npy"),
         )
+        self.transformed_train_target_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TRAIN_FILE_NAME.replace(".csv", "_target.npy"),
+        )
+        self.transformed_test_target_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TEST_FILE_NAME.replace(".csv", "_target.npy"),
+        )
+        self.transformed_train_row_id_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TRAIN_FILE_NAME.replace(".csv", "_row_id.npy"),
+        )
+        self.transformed_train_sample_weight_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TRAIN_FILE_NAME.replace(".csv", "_sample_weight.npy"),
+        )
+        self.transformed_test_row_id_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TEST_FILE_NAME.replace(".csv", "_row_id.npy"),
+        )
+        self.transformed_test_sample_weight_file_path: str = os.path.join(
+            self.data_transformation_dir,
+            training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+            training_pipeline.TEST_FILE_NAME.replace(".csv", "_sample_weight.npy"),
+        )
         self.transformed_object_file_path: str = os.path.join(
             self.data_transformation_dir,
             training_pipeline.DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
             training_pipeline.PREPROCESSING_OBJECT_FILE_NAME,
         )
+        self.out_of_core: bool = training_pipeline.DATA_TRANSFORMATION_OUT_OF_CORE
+        self.chunk_size: int = training_pipeline.DATA_TRANSFORMATION_CHUNK_SIZE
+        self.fit_sample_size: int = (
+            training_pipeline.DATA_TRANSFORMATION_FIT_SAMPLE_SIZE
+        )
+        self.feature_dtype: str = training_pipeline.DATA_TRANSFORMATION_FEATURE_DTYPE
+        self.target_dtype: str = training_pipeline.DATA_TRANSFORMATION_TARGET_DTYPE
+        self.row_id_column: Optional[str] = (
+            training_pipeline.DATA_TRANSFORMATION_ROW_ID_COLUMN
+        )
+        self.sample_weight: Optional[str] = (
+            training_pipeline.DATA_TRANSFORMATION_SAMPLE_WEIGHT
+        )
 
 
 class ModelTrainerConfig:
@@ -111,3 +230,38 @@ class ModelTrainerConfig:
         self.overfitting_underfitting_threshold = (
             training_pipeline.MODEL_TRAINER_OVER_FIITING_UNDER_FITTING_THRESHOLD
         )
+        self.search_params: dict = training_pipeline.MODEL_TRAINER_SEARCH_PARAMS
+        self.reference_sketch_file_path: str = os.path.join(
+            self.model_trainer_dir,
+            training_pipeline.MODEL_TRAINER_TRAINED_MODEL_DIR,
+            training_pipeline.DATA_VALIDATION_REFERENCE_SKETCH_FILE_NAME,
+        )
+        self.final_reference_sketch_file_path: str = os.path.join(
+            training_pipeline_config.model_dir,
+            training_pipeline.DATA_VALIDATION_REFERENCE_SKETCH_FILE_NAME,
+        )
+        self.final_model_file_path: str = os.path.join(
+            training_pipeline_config.model_dir,
+            training_pipeline.MODEL_TRAINER_FINAL_MODEL_NAME,
+        )
+        self.artifact_compression: Optional[str] = (
+            training_pipeline.MODEL_TRAINER_ARTIFACT_COMPRESSION
+        )
+        self.selection_metric: str = training_pipeline.MODEL_TRAINER_SELECTION_METRIC
+        self.min_precision: float = training_pipeline.MODEL_TRAINER_MIN_PRECISION
+        self.threshold_params: dict = training_pipeline.MODEL_TRAINER_THRESHOLD_PARAMS
+        self.fit_cache_dir: Optional[str] = training_pipeline.MODEL_TRAINER_FIT_CACHE_DIR
+        self.fit_cache_max_bytes: int = (
+            training_pipeline.MODEL_TRAINER_FIT_CACHE_MAX_BYTES
+        )
+        self.search_checkpoint_dir: str = os.path.join(
+            self.model_trainer_dir,
+            training_pipeline.MODEL_TRAINER_SEARCH_CHECKPOINT_DIR_NAME,
+        )
+        self.out_of_core: bool = training_pipeline.MODEL_TRAINER_OUT_OF_CORE
+        self.search_sample_size: int = training_pipeline.MODEL_TRAINER_SEARCH_SAMPLE_SIZE
+        self.chunk_size: int = training_pipeline.MODEL_TRAINER_CHUNK_SIZE
+        self.external_memory_dir: str = os.path.join(
+            self.model_trainer_dir,
+            training_pipeline.MODEL_TRAINER_EXTERNAL_MEMORY_DIR_NAME,
+        )
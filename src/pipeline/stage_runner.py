@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sys
+from dataclasses import dataclass, fields
+from typing import Callable, Optional
+
+from src.constant import training_pipeline
+from src.entity.artifact_entity import artifact_from_dict, artifact_to_dict
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.instrumentation import record_span
+
+# Constants and files every stage depends on
+COMMON_CONSTANTS = ("TARGET_COLUMN", "DATA_ARTIFACT_FORMAT", "SCHEMA_FILE_PATH")
+COMMON_MODULES = ("src.utils.main_utils.utils", "src.entity.artifact_entity")
+
+
+def write_json_atomic(file_path: str, content) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_file_path, "w") as file_obj:
+        json.dump(content, file_obj, indent=2)
+    os.replace(tmp_file_path, file_path)
+
+
+@dataclass
+class Stage:
+    name: str
+    # run(*upstream_artifacts) -> artifact
+    run: Callable
+    artifact_class: type
+    depends_on: tuple = ()
+    # prefixes of the training_pipeline constants configuring the stage
+    constant_prefixes: tuple = ()
+    # modules whose source is part of the fingerprint
+    modules: tuple = ()
+    # fingerprint of inputs outside the pipeline, None makes the stage run
+    source_fingerprint: Optional[Callable] = None
+    cacheable: bool = True
+
+
+class StageRunner:
+    """
+    Run a DAG of stages in order, skipping the stages whose fingerprint is unchanged.
+
+    The fingerprint of a stage hashes its constants, the schema file, the source of
+    its modules, the fingerprints of its upstream stages and, for source stages,
+    the fingerprint of the external data. Stages without a fingerprint, and every
+    stage downstream of them, always run. The artifact of a finished stage is
+    stored as JSON under cache_dir/<stage>/<fingerprint>.json, and reused as long
+    as every file it points to exists. Entries are only written by commit(), once
+    the background writes of the run have landed. cache_dir None runs every stage.
+
+    With a checkpoint_dir, every completed stage writes its artifact as
+    <stage>.json and then a <stage>.done marker there, both atomically and through
+    the writer, so they land after the files of the stage. Stages with a marker
+    are not run again, which resumes a failed run after its last completed stage.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str],
+        checkpoint_dir: Optional[str] = None,
+        writer: BackgroundWriter = None,
+    ):
+        self.cache_dir = cache_dir
+        self.checkpoint_dir = checkpoint_dir
+        self.writer = writer if writer is not None else BackgroundWriter(False)
+        self.fingerprints = {}
+        self.skipped = []
+        self.resumed = []
+        self._pending = []
+
+    @staticmethod
+    def hash_sources(modules) -> str:
+        digest = hashlib.sha256()
+        for name in modules:
+            module = sys.modules.get(name) or __import__(name, fromlist=["_"])
+            with open(module.__file__, "rb") as file_obj:
+                digest.update(file_obj.read())
+        return digest.hexdigest()
+
+    def fingerprint(self, stage: Stage) -> Optional[str]:
+        """Fingerprint of a stage, None if the one of an upstream stage is unknown"""
+        upstream = [self.fingerprints.get(name) for name in stage.depends_on]
+        if None in upstream:
+            return None
+        prefixes = COMMON_CONSTANTS + tuple(stage.constant_prefixes)
+        constants = sorted(
+            (name, repr(value))
+            for name, value in vars(training_pipeline).items()
+            if name.isupper() and name.startswith(prefixes)
+        )
+        parts = [
+            stage.name,
+            repr(constants),
+            self.hash_sources(COMMON_MODULES + tuple(stage.modules)),
+            *upstream,
+        ]
+        if os.path.exists(training_pipeline.SCHEMA_FILE_PATH):
+            with open(training_pipeline.SCHEMA_FILE_PATH, "rb") as file_obj:
+                parts.append(hashlib.sha256(file_obj.read()).hexdigest())
+        if stage.source_fingerprint is not None:
+            source = stage.source_fingerprint()
+            if source is None:
+                return None
+            parts.append(source)
+        return hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()
+
+    def get_entry_path(self, stage: Stage, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, stage.name, f"{fingerprint}.json")
+
+    def read_artifact(self, stage: Stage, entry_path: str):
+        """Artifact stored at entry_path, None if missing or its files are gone"""
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path) as file_obj:
+            artifact = artifact_from_dict(stage.artifact_class, json.load(file_obj))
+        for artifact_field in fields(artifact):
+            file_path = getattr(artifact, artifact_field.name)
+            if artifact_field.name.endswith("_path") and file_path is not None:
+                if not os.path.exists(file_path):
+                    logging.info(f"{stage.name}: stored {file_path} is gone")
+                    return None
+        return artifact
+
+    def load(self, stage: Stage, fingerprint: str):
+        """Cached artifact of a fingerprint"""
+        return self.read_artifact(stage, self.get_entry_path(stage, fingerprint))
+
+    def get_checkpoint_paths(self, stage: Stage):
+        """Paths of the artifact JSON and of the completion marker of a stage"""
+        return (
+            os.path.join(self.checkpoint_dir, f"{stage.name}.json"),
+            os.path.join(self.checkpoint_dir, f"{stage.name}.done"),
+        )
+
+    def load_checkpoint(self, stage: Stage):
+        """Artifact of a stage completed in the run dir, None if not completed"""
+        if self.checkpoint_dir is None:
+            return None
+        artifact_path, marker_path = self.get_checkpoint_paths(stage)
+        if not os.path.exists(marker_path):
+            return None
+        return self.read_artifact(stage, artifact_path)
+
+    def write_checkpoint(self, stage: Stage, content: dict) -> None:
+        artifact_path, marker_path = self.get_checkpoint_paths(stage)
+        write_json_atomic(artifact_path, content)
+        write_json_atomic(marker_path, {"stage": stage.name})
+
+    def run(self, stages: list):
+        """
+        Run or reuse every stage in order.
+
+        Returns:
+          artifact of the last stage
+        """
+        try:
+            artifacts = {}
+            for i, stage in enumerate(stages):
+                upstream = [artifacts[name] for name in stage.depends_on]
+                fingerprint = None
+                if self.cache_dir is not None and stage.cacheable:
+                    fingerprint = self.fingerprint(stage)
+                self.fingerprints[stage.name] = fingerprint
+
+                artifact = self.load_checkpoint(stage)
+                if artifact is not None:
+                    logging.info(f"{stage.name} was completed, resuming with {artifact}")
+                    self.resumed.append(stage.name)
+                    record_span(stage.name, resumed=True)
+                    artifacts[stage.name] = artifact
+                else:
+                    if fingerprint is not None:
+                        artifact = self.load(stage, fingerprint)
+                    if artifact is not None:
+                        logging.info(f"{stage.name} is unchanged, reusing {artifact}")
+                        self.skipped.append(stage.name)
+                        record_span(stage.name, cached=True)
+                    else:
+                        artifact = stage.run(*upstream)
+                        if fingerprint is not None:
+                            self._pending.append(
+                                (stage, fingerprint, artifact_to_dict(artifact))
+                            )
+                    if self.checkpoint_dir is not None:
+                        self.writer.submit(
+                            self.write_checkpoint, stage, artifact_to_dict(artifact)
+                        )
+                artifacts[stage.name] = artifact
+
+                # release the artifacts, and their in-process frames, no longer needed
+                needed = {name for later in stages[i + 1 :] for name in later.depends_on}
+                for name in list(artifacts):
+                    if name not in needed and name != stages[-1].name:
+                        del artifacts[name]
+            return artifacts[stages[-1].name]
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def commit(self) -> None:
+        """Store the artifacts of the stages run, after their files are written"""
+        try:
+            for stage, fingerprint, content in self._pending:
+                write_json_atomic(self.get_entry_path(stage, fingerprint), content)
+            self._pending = []
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
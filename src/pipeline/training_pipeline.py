@@ -26,6 +26,17 @@ from src.entity.artifact_entity import (
 
 from src.constant.training_pipeline import TRAINING_BUCKET_NAME
 from src.constant.training_pipeline import SAVED_MODEL_DIR
+from src.constant.training_pipeline import (
+    TRAINING_PIPELINE_IN_PROCESS,
+    TRAINING_PIPELINE_PROFILE_EXPORTS,
+    TRAINING_PIPELINE_PROFILE_SAMPLE_INTERVAL,
+    TRAINING_PIPELINE_PROMETHEUS_FILE_NAME,
+    TRAINING_PIPELINE_RUN_REPORT_FILE_NAME,
+    TRAINING_PIPELINE_STAGE_CACHE_DIR,
+)
+from src.pipeline.stage_runner import Stage, StageRunner
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.instrumentation import RunProfiler
 from src.cloud.azure_setup import AzureMLSetup
 import sys
 
@@ -33,6 +44,8 @@ import sys
 class TrainingPipeline:
     def __init__(self):
         self.training_pipeline_config = TrainingPipelineConfig()
+        # set by run_pipeline to hand the frames over in process
+        self.writer = None
 
     def start_data_ingestion(self):
         try:
@@ -41,7 +54,7 @@ class TrainingPipeline:
             )
             logging.info("Start data Ingestion")
             data_ingestion = DataIngestion(
-                data_ingestion_config=self.data_ingestion_config
+                data_ingestion_config=self.data_ingestion_config, writer=self.writer
             )
             data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
             logging.info(
@@ -60,6 +73,7 @@ class TrainingPipeline:
             data_validation = DataValidation(
                 data_ingestion_artifact=data_ingestion_artifact,
                 data_validation_config=data_validation_config,
+                writer=self.writer,
             )
             logging.info("Initiate the data Validation")
             data_validation_artifact = data_validation.initiate_data_validation()
@@ -77,6 +91,7 @@ class TrainingPipeline:
             data_transformation = DataTransformation(
                 data_validation_artifact=data_validation_artifact,
                 data_transformation_config=data_transformation_config,
+                writer=self.writer,
             )
 
             data_transformation_artifact = (
@@ -106,6 +121,76 @@ class TrainingPipeline:
         except Exception as e:
             raise CreditCardException(e, sys)
 
+    def get_data_source_fingerprint(self):
+        data_ingestion = DataIngestion(
+            DataIngestionConfig(self.training_pipeline_config)
+        )
+        try:
+            return data_ingestion.get_source_fingerprint()
+        finally:
+            data_ingestion.mongo_client.close()
+
+    def get_stages(self) -> list:
+        """Stages of the pipeline, each depending on the one before"""
+        return [
+            Stage(
+                name="data_ingestion",
+                run=self.start_data_ingestion,
+                artifact_class=DataIngestionArtifact,
+                constant_prefixes=("DATA_INGESTION", "FILE_NAME"),
+                modules=("src.components.data_ingestion",),
+                source_fingerprint=self.get_data_source_fingerprint,
+            ),
+            Stage(
+                name="data_validation",
+                run=self.start_data_validation,
+                artifact_class=DataValidationArtifact,
+                depends_on=("data_ingestion",),
+                constant_prefixes=("DATA_VALIDATION",),
+                modules=(
+                    "src.components.data_validation",
+                    "src.utils.ml_utils.validation.drift",
+                    "src.utils.ml_utils.validation.schema",
+                ),
+            ),
+            Stage(
+                name="data_transformation",
+                run=self.start_data_transformation,
+                artifact_class=DataTransformationArtifact,
+                depends_on=("data_validation",),
+                constant_prefixes=("DATA_TRANSFORMATION",),
+                modules=(
+                    "src.components.data_transformation",
+                    "src.utils.ml_utils.preprocessing.imputer",
+                ),
+            ),
+            # the fits of the trainer are cached by its FitCache, and it publishes
+            # the final model, so it always runs
+            Stage(
+                name="model_trainer",
+                run=self.start_model_trainer,
+                artifact_class=ModelTrainerArtifact,
+                depends_on=("data_transformation",),
+                cacheable=False,
+            ),
+        ]
+
+    def write_run_report(self, profiler: RunProfiler, exports=()) -> None:
+        """Write the JSON run report to the artifact dir and export its metrics"""
+        try:
+            artifact_dir = self.training_pipeline_config.artifact_dir
+            profiler.write_json(
+                os.path.join(artifact_dir, TRAINING_PIPELINE_RUN_REPORT_FILE_NAME)
+            )
+            if "prometheus" in exports:
+                profiler.write_prometheus(
+                    os.path.join(artifact_dir, TRAINING_PIPELINE_PROMETHEUS_FILE_NAME)
+                )
+            if "mlflow" in exports:
+                profiler.log_to_mlflow()
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
     ## local artifact is going to s3 bucket
     def sync_artifact_dir_to_s3(self):
         try:
@@ -129,37 +214,67 @@ class TrainingPipeline:
         except Exception as e:
             raise CreditCardException(e, sys)
 
-    def run_pipeline(self):
-        try:
-            training_pipeline_config = TrainingPipelineConfig()
-            data_ingestion_config = DataIngestionConfig(training_pipeline_config)
-            data_ingestion = DataIngestion(data_ingestion_config)
-            data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
-
-            data_validation_config = DataValidationConfig(training_pipeline_config)
-            data_validation = DataValidation(
-                data_ingestion_artifact=data_ingestion_artifact,
-                data_validation_config=data_validation_config,
-            )
-            data_validation_artifact = data_validation.initiate_data_validation()
+    def run_pipeline(
+        self,
+        in_process: bool = TRAINING_PIPELINE_IN_PROCESS,
+        stage_cache_dir: str = TRAINING_PIPELINE_STAGE_CACHE_DIR,
+        profile_exports: tuple = TRAINING_PIPELINE_PROFILE_EXPORTS,
+        resume_dir: str = None,
+        deploy: bool = True,
+    ):
+        """
+        Run every stage, reusing the artifacts of the stages unchanged since a
+        previous run. In process, the train/test frames are handed from stage to
+        stage in the artifacts and the stage files are written in the background.
+        The stages are profiled into a run report in the artifact dir.
 
-            data_transformation_config = DataTransformationConfig(
-                training_pipeline_config
-            )
-            data_transformation = DataTransformation(
-                data_validation_artifact=data_validation_artifact,
-                data_transformation_config=data_transformation_config,
-            )
-            data_transformation_artifact = (
-                data_transformation.initiate_data_transformation()
+        Every completed stage is checkpointed in the artifact dir of the run. With
+        resume_dir, the artifact dir of a failed run, the run continues there after
+        its last completed stage, and the trainer reuses the model families it had
+        already searched.
+        """
+        try:
+            if resume_dir is not None:
+                if not os.path.isdir(resume_dir):
+                    raise FileNotFoundError(f"No run to resume at {resume_dir}")
+                logging.info(f"Resuming the run at {resume_dir}")
+                self.training_pipeline_config = TrainingPipelineConfig(
+                    artifact_dir=resume_dir
+                )
+            else:
+                self.training_pipeline_config = TrainingPipelineConfig()
+            self.writer = BackgroundWriter() if in_process else None
+            stage_runner = StageRunner(
+                stage_cache_dir,
+                checkpoint_dir=self.training_pipeline_config.checkpoint_dir,
+                writer=self.writer,
             )
+            profiler = RunProfiler(TRAINING_PIPELINE_PROFILE_SAMPLE_INTERVAL)
+            with profiler.activate():
+                try:
+                    model_trainer_artifact = stage_runner.run(self.get_stages())
+                except Exception:
+                    # land the files and checkpoints of the completed stages
+                    if self.writer is not None:
+                        try:
+                            self.writer.close()
+                        except Exception as write_error:
+                            logging.error(f"Background write failed: {write_error}")
+                        self.writer = None
+                    raise
+                if self.writer is not None:
+                    with profiler.span("background_writes"):
+                        self.writer.close()
+                    self.writer = None
+            stage_runner.commit()
+            if stage_runner.resumed:
+                logging.info(f"Resumed after {stage_runner.resumed}")
+            if stage_runner.skipped:
+                logging.info(f"Reused the artifacts of {stage_runner.skipped}")
+            self.write_run_report(profiler, profile_exports)
 
-            model_trainer_config = ModelTrainerConfig(training_pipeline_config)
-            model_trainer = ModelTrainer(
-                model_trainer_config=model_trainer_config,
-                data_transformation_artifact=data_transformation_artifact,
-            )
-            model_trainer_artifact = model_trainer.initiate_model_trainer()
+            if not deploy:
+                return model_trainer_artifact
 
             # Deploy to Azure ML
             try:
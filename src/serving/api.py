@@ -0,0 +1,118 @@
+import sys
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from src.constant.training_pipeline import (
+    SERVING_MAX_BATCH_SIZE,
+    SERVING_MAX_WAIT,
+    SERVING_MODEL_FILE_PATH,
+    SERVING_N_WORKERS,
+)
+from src.exception.exception import CreditCardException
+from src.serving.micro_batcher import MicroBatcher
+from src.serving.model_registry import get_model_registry
+
+# a transaction maps every training feature to its value, null for a missing value
+Transaction = Dict[str, Optional[float]]
+
+
+class BatchRequest(BaseModel):
+    records: List[Transaction]
+
+
+class Prediction(BaseModel):
+    prediction: int
+    score: float
+    model_version: str
+
+
+class BatchPrediction(BaseModel):
+    predictions: List[int]
+    scores: List[float]
+    model_version: str
+
+
+def to_row(scorer, record: Transaction) -> np.ndarray:
+    """Feature row of a transaction, HTTP 422 for a missing feature"""
+    try:
+        return scorer.to_array(
+            {name: np.nan if value is None else value for name, value in record.items()}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def create_app(
+    model_file_path: str = SERVING_MODEL_FILE_PATH,
+    max_batch_size: int = SERVING_MAX_BATCH_SIZE,
+    max_wait: float = SERVING_MAX_WAIT,
+    n_workers: int = SERVING_N_WORKERS,
+) -> FastAPI:
+    """
+    FastAPI service scoring transactions with the CreditCardModel at
+    model_file_path, taken from the process-wide ModelRegistry: loaded and
+    compiled once at startup, and swapped for the new versions of the file.
+
+    /predict scores one transaction, coalesced with the concurrent ones into
+    micro-batches; /predict/batch scores a list of transactions at once.
+    """
+
+    def predict_rows(rows: np.ndarray) -> list:
+        # the version is read once per batch, so a swap never splits a batch
+        version = app.state.registry.get_current()
+        return [(version.version, row) for row in version.predict(rows)]
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        try:
+            app.state.registry = get_model_registry(model_file_path)
+            app.state.registry.get_current()
+        except Exception as e:
+            raise CreditCardException(e, sys)
+        app.state.batcher = MicroBatcher(
+            predict_rows,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            n_workers=n_workers,
+        )
+        await app.state.batcher.start()
+        try:
+            yield
+        finally:
+            await app.state.batcher.stop()
+            app.state.registry.stop()
+
+    app = FastAPI(title="Credit card fraud scoring", lifespan=lifespan)
+
+    @app.post("/predict", response_model=Prediction)
+    async def predict(record: Transaction) -> Prediction:
+        scorer = app.state.registry.get_current().scorer
+        version, (score, prediction) = await app.state.batcher.submit(
+            to_row(scorer, record)
+        )
+        return Prediction(
+            prediction=int(prediction), score=float(score), model_version=version
+        )
+
+    @app.post("/predict/batch", response_model=BatchPrediction)
+    async def predict_batch(request: BatchRequest) -> BatchPrediction:
+        scorer = app.state.registry.get_current().scorer
+        rows = [to_row(scorer, record) for record in request.records]
+        if not rows:
+            return BatchPrediction(
+                predictions=[],
+                scores=[],
+                model_version=app.state.registry.get_current().version,
+            )
+        results = await app.state.batcher.score_many(np.vstack(rows))
+        return BatchPrediction(
+            predictions=[int(prediction) for _, (_, prediction) in results],
+            scores=[float(score) for _, (score, _) in results],
+            model_version=results[0][0],
+        )
+
+    return app
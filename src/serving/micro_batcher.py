@@ -0,0 +1,148 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-row requests into micro-batches.
+
+    submit() queues a row and waits for its score. A collector task takes the
+    first queued row, waits for a free worker, then gathers the rows queued until
+    max_wait seconds after the first one arrived or max_batch_size rows, and scores
+    them with one score_batch call on a pool of n_workers threads. While every
+    worker is busy the queue fills up, so the batches grow with the load and a
+    request never waits more than max_wait for company.
+
+    score_batch takes a 2-D float64 matrix and returns one result per row.
+    """
+
+    def __init__(
+        self,
+        score_batch: Callable,
+        max_batch_size: int = 64,
+        max_wait: float = 0.002,
+        n_workers: int = 2,
+    ):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.n_workers = n_workers
+        # rows and batches scored, their ratio is the mean batch size
+        self.n_rows = 0
+        self.n_batches = 0
+        self._queue = None
+        self._arrived = None
+        self._slots = None
+        self._executor = None
+        self._collector = None
+        self._running = set()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.n_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.n_workers, thread_name_prefix="micro-batch"
+        )
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        """Stop collecting, finish the batches being scored and free the workers"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._queue is not None:
+            batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._cancel(batch)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, row: np.ndarray):
+        """Result of one row, a 1-D array or a matrix of one row"""
+        if self._collector is None:
+            raise RuntimeError("The batcher is not started")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((loop.time(), row, future))
+        self._arrived.set()
+        return await future
+
+    async def score_many(self, rows: np.ndarray) -> np.ndarray:
+        """Results of a batch sent whole, on the same workers"""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.score_batch, rows)
+
+    @staticmethod
+    def _cancel(batch: list) -> None:
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("The batcher was stopped"))
+
+    def _drain(self, batch: list) -> None:
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][0] + self.max_wait
+            try:
+                await self._slots.acquire()
+                self._drain(batch)
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    self._arrived.clear()
+                    try:
+                        # waiting on the event, not on the queue, loses no row on timeout
+                        await asyncio.wait_for(self._arrived.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._drain(batch)
+            except asyncio.CancelledError:
+                self._cancel(batch)
+                raise
+            task = asyncio.create_task(self._score(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _score(self, batch: list) -> None:
+        try:
+            rows = np.vstack([row for _, row, _ in batch])
+            self.n_rows += len(batch)
+            self.n_batches += 1
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self._executor, self.score_batch, rows)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logging.error(f"Scoring a batch of {len(batch)} rows failed: {e}")
+            error = CreditCardException(e, sys)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self._slots.release()
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from src.constant.training_pipeline import (
+    SERVING_MODEL_POLL_INTERVAL,
+    SERVING_MODEL_VERSIONS_KEPT,
+)
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.main_utils.utils import load_object
+
+
+@dataclass
+class ModelVersion:
+    # sha256 of the model file
+    version: str
+    file_path: str
+    mtime_ns: int
+    model: object = field(repr=False)
+    scorer: object = field(repr=False)
+    loaded_at: float = field(default_factory=time.time)
+
+    def predict(self, rows: np.ndarray) -> np.ndarray:
+        """Rows of [score, prediction] of a feature matrix, from this one version"""
+        scores = np.asarray(self.scorer.score(rows), dtype=np.float64)
+        return np.column_stack([scores, scores >= self.scorer.threshold])
+
+
+class ModelRegistry:
+    """
+    Keep the CreditCardModel of a file loaded and compiled, and follow its updates.
+
+    Versions are keyed by the sha256 of the file and loaded once: refresh() only
+    hashes the file when its mtime or size changed, and loads it only for an
+    unseen hash. A new version is swapped in by replacing one reference, so a
+    request scores with the old or the new version, never a mix. The last
+    max_versions versions stay loaded, so rollback() and a republished previous
+    version swap back without unpickling. start() polls the file every
+    poll_interval seconds on a daemon thread.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        poll_interval: float = SERVING_MODEL_POLL_INTERVAL,
+        max_versions: int = SERVING_MODEL_VERSIONS_KEPT,
+    ):
+        self.file_path = file_path
+        self.poll_interval = poll_interval
+        self.max_versions = max(max_versions, 1)
+        self._versions = OrderedDict()
+        self._current: Optional[ModelVersion] = None
+        self._previous: Optional[ModelVersion] = None
+        # (mtime_ns, size) of the file last loaded, or last failed to load
+        self._seen_stat = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def current(self) -> Optional[ModelVersion]:
+        """Version serving the requests, None until a model file was loaded"""
+        return self._current
+
+    @property
+    def versions(self) -> list:
+        return list(self._versions)
+
+    def get_current(self) -> ModelVersion:
+        version = self._current
+        if version is None:
+            raise FileNotFoundError(f"No model loaded from {self.file_path}")
+        return version
+
+    def predict(self, rows: np.ndarray) -> np.ndarray:
+        return self.get_current().predict(rows)
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def swap(self, version: ModelVersion) -> None:
+        if self._current is not None and self._current.version != version.version:
+            self._previous = self._current
+        self._current = version
+        self._versions[version.version] = version
+        self._versions.move_to_end(version.version)
+        # keep the versions in use, evict the least recently used of the others
+        in_use = {
+            kept.version for kept in (self._current, self._previous) if kept is not None
+        }
+        for key in list(self._versions):
+            if len(self._versions) <= self.max_versions:
+                break
+            if key not in in_use:
+                del self._versions[key]
+
+    def refresh(self) -> bool:
+        """Load and swap in the model file if it changed. Returns True on a swap"""
+        with self._lock:
+            try:
+                stat = os.stat(self.file_path)
+            except FileNotFoundError:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) == self._seen_stat:
+                return False
+            try:
+                key = self.hash_file(self.file_path)
+                if self._current is not None and key == self._current.version:
+                    self._seen_stat = (stat.st_mtime_ns, stat.st_size)
+                    return False
+                version = self._versions.get(key)
+                if version is None:
+                    model = load_object(self.file_path)
+                    version = ModelVersion(
+                        version=key,
+                        file_path=self.file_path,
+                        mtime_ns=stat.st_mtime_ns,
+                        model=model,
+                        scorer=model.compile(),
+                    )
+                self.swap(version)
+                self._seen_stat = (stat.st_mtime_ns, stat.st_size)
+                logging.info(f"Serving model version {key[:12]} of {self.file_path}")
+                return True
+            except Exception as e:
+                # keep serving the loaded version, retry once the file changes again
+                self._seen_stat = (stat.st_mtime_ns, stat.st_size)
+                logging.error(f"Failed to load {self.file_path}: {e}")
+                return False
+
+    def rollback(self) -> ModelVersion:
+        """Swap the previous version back in, kept loaded for this"""
+        try:
+            with self._lock:
+                if self._previous is None:
+                    raise ValueError("No previous model version to roll back to")
+                self.swap(self._previous)
+                logging.info(f"Rolled back to version {self._current.version[:12]}")
+                return self._current
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def start(self) -> "ModelRegistry":
+        """Load the model file and watch it for new versions, once"""
+        self.refresh()
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="model-registry", daemon=True
+            )
+            self._watcher.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_model_registry(file_path: str, **kwargs) -> ModelRegistry:
+    """The started registry of a model file, shared by the whole process"""
+    key = os.path.abspath(file_path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = ModelRegistry(file_path, **kwargs)
+        return registry.start()
@@ -0,0 +1,61 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.main_utils.utils import write_dataframe
+
+
+class BackgroundWriter:
+    """
+    Persist stage outputs off the critical path of the pipeline.
+
+    Writes run in submission order on one background thread, which parquet and
+    Arrow writers release the GIL for. flush() waits for the pending writes and
+    raises the first error. With background=False every write runs inline, so
+    components can write through a writer unconditionally.
+    """
+
+    def __init__(self, background: bool = True):
+        self.background = background
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+            if background
+            else None
+        )
+        self._futures = []
+
+    def submit(self, fn, *args, **kwargs) -> None:
+        try:
+            if self._executor is None:
+                fn(*args, **kwargs)
+            else:
+                self._futures.append(self._executor.submit(fn, *args, **kwargs))
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def write_dataframe(self, file_path: str, dataframe) -> None:
+        self.submit(write_dataframe, file_path, dataframe)
+
+    def flush(self) -> None:
+        """Wait for the pending writes, raising the first error as it was raised"""
+        futures, self._futures = self._futures, []
+        errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error is not None]
+        for error in errors[1:]:
+            logging.error(f"Background write failed: {error}")
+        if errors:
+            raise errors[0]
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
@@ -0,0 +1,312 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - psutil ships with mlflow
+    psutil = None
+
+_active_profiler: ContextVar = ContextVar("active_profiler", default=None)
+
+# Numeric fields of a span exported as metrics, with their Prometheus unit suffix
+SPAN_METRICS = {
+    "wall_time": "seconds",
+    "cpu_time": "seconds",
+    "children_cpu_time": "seconds",
+    "peak_rss": "bytes",
+    "peak_children_rss": "bytes",
+    "rows": "total",
+    "bytes_read": "bytes",
+    "bytes_written": "bytes",
+}
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    parent: Optional[str] = None
+    wall_time: Optional[float] = None
+    # CPU time of all threads of the process, and of its worker processes
+    cpu_time: Optional[float] = None
+    children_cpu_time: Optional[float] = None
+    peak_rss: Optional[int] = None
+    peak_children_rss: Optional[int] = None
+    rows: Optional[int] = None
+    # bytes passed to read/write calls, page cache hits included
+    bytes_read: Optional[int] = None
+    bytes_written: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+
+
+class RunProfiler:
+    """
+    Record the wall and CPU time, peak RSS, rows and bytes read/written of the
+    spans of a run. A sampler thread polls the RSS of the process and of its worker
+    processes every sample_interval seconds while a span is open, so nested spans
+    get their own peaks. Spans are opened through profile() and profiled() while
+    the profiler is active; without psutil only the time and the lifetime peak RSS
+    of the process are recorded, and no memory at all where the resource module is
+    missing (Windows).
+    """
+
+    def __init__(self, sample_interval: float = 0.05):
+        self.sample_interval = sample_interval
+        self.spans = []
+        self._open = []
+        self._process = psutil.Process() if psutil is not None else None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def get_children(self) -> list:
+        try:
+            return self._process.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def sample_memory(self):
+        """RSS of the process and of its worker processes"""
+        if self._process is None:
+            try:
+                import resource
+            except ImportError:  # Windows
+                return None, None
+            # ru_maxrss is in kilobytes on Linux
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, None
+        children_rss = 0
+        for child in self.get_children():
+            try:
+                children_rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return self._process.memory_info().rss, children_rss
+
+    def sample_children_cpu(self) -> dict:
+        times = {}
+        if self._process is not None:
+            for child in self.get_children():
+                try:
+                    cpu_times = child.cpu_times()
+                    times[child.pid] = cpu_times.user + cpu_times.system
+                except psutil.Error:
+                    pass
+        return times
+
+    def sample_io(self):
+        if self._process is None:
+            return None, None
+        try:
+            counters = self._process.io_counters()
+            return (
+                getattr(counters, "read_chars", counters.read_bytes),
+                getattr(counters, "write_chars", counters.write_bytes),
+            )
+        except (psutil.Error, AttributeError):
+            return None, None
+
+    def update_peaks(self) -> None:
+        rss, children_rss = self.sample_memory()
+        for span in list(self._open):
+            if rss is not None:
+                span.peak_rss = max(span.peak_rss or 0, rss)
+            if children_rss is not None:
+                span.peak_children_rss = max(span.peak_children_rss or 0, children_rss)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            if self._open:
+                self.update_peaks()
+
+    @contextmanager
+    def activate(self):
+        """Make this the profiler of profile() and profiled() in this context"""
+        token = _active_profiler.set(self)
+        self._stop.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, name="run-profiler", daemon=True
+        )
+        self._sampler.start()
+        try:
+            yield self
+        finally:
+            self._stop.set()
+            self._sampler.join()
+            _active_profiler.reset(token)
+
+    @contextmanager
+    def span(self, name: str, rows: Optional[int] = None, **attributes):
+        record = SpanRecord(
+            name=name,
+            parent=self._open[-1].name if self._open else None,
+            rows=rows,
+            attributes=attributes,
+        )
+        self.spans.append(record)
+        self._open.append(record)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_children_cpu = self.sample_children_cpu()
+        start_read, start_written = self.sample_io()
+        self.update_peaks()
+        try:
+            yield record
+        finally:
+            self.update_peaks()
+            record.wall_time = time.perf_counter() - start_wall
+            record.cpu_time = time.process_time() - start_cpu
+            if self._process is not None:
+                record.children_cpu_time = sum(
+                    cpu - start_children_cpu.get(pid, 0.0)
+                    for pid, cpu in self.sample_children_cpu().items()
+                )
+            end_read, end_written = self.sample_io()
+            if start_read is not None and end_read is not None:
+                record.bytes_read = end_read - start_read
+                record.bytes_written = end_written - start_written
+            self._open.remove(record)
+            logging.info(
+                f"{name}: {record.wall_time:.2f}s wall, {record.cpu_time:.2f}s cpu, "
+                f"peak rss {record.peak_rss}, rows {record.rows}"
+            )
+
+    def record(self, name: str, **values) -> SpanRecord:
+        """Record a span measured elsewhere, values are SpanRecord fields or attributes"""
+        known = {key: value for key, value in values.items() if key in SPAN_METRICS}
+        attributes = {
+            key: value for key, value in values.items() if key not in SPAN_METRICS
+        }
+        record = SpanRecord(
+            name=name,
+            parent=self._open[-1].name if self._open else None,
+            attributes=attributes,
+            **known,
+        )
+        self.spans.append(record)
+        return record
+
+    def add_rows(self, rows: int) -> None:
+        """Count rows processed by the innermost open span"""
+        if self._open:
+            span = self._open[-1]
+            span.rows = (span.rows or 0) + int(rows)
+
+    def get_metrics(self, span: SpanRecord) -> dict:
+        """Numeric metrics of a span, its numeric attributes included"""
+        metrics = {
+            metric: getattr(span, metric)
+            for metric in SPAN_METRICS
+            if getattr(span, metric) is not None
+        }
+        for key, value in span.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics.setdefault(key, value)
+        return metrics
+
+    def to_dict(self) -> dict:
+        return {"spans": [asdict(span) for span in self.spans]}
+
+    def write_json(self, file_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as file_obj:
+                json.dump(self.to_dict(), file_obj, indent=2, default=str)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def to_prometheus(self, prefix: str = "creditcard_pipeline") -> str:
+        """The span metrics in the Prometheus text exposition format"""
+        samples = {}
+        for span in self.spans:
+            labels = f'span="{span.name}"'
+            if span.parent is not None:
+                labels += f',parent="{span.parent}"'
+            for metric, value in self.get_metrics(span).items():
+                metric_name = f"{prefix}_{metric}"
+                unit = SPAN_METRICS.get(metric)
+                if unit is not None and not metric_name.endswith(unit):
+                    metric_name = f"{metric_name}_{unit}"
+                samples.setdefault(metric_name, []).append(f"{metric_name}{{{labels}}} {value}")
+        lines = []
+        for metric_name, metric_samples in samples.items():
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.extend(metric_samples)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as file_obj:
+                file_obj.write(self.to_prometheus())
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def log_to_mlflow(self) -> None:
+        """Log the span metrics to the active MLflow run, or to a new one"""
+        try:
+            import mlflow
+
+            metrics = {
+                f"{span.name}.{metric}": float(value)
+                for span in self.spans
+                for metric, value in self.get_metrics(span).items()
+            }
+            if mlflow.active_run() is not None:
+                mlflow.log_metrics(metrics)
+            else:
+                with mlflow.start_run(run_name="pipeline_profile"):
+                    mlflow.log_metrics(metrics)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+
+def get_profiler() -> Optional[RunProfiler]:
+    return _active_profiler.get()
+
+
+@contextmanager
+def profile(name: str, rows: Optional[int] = None, **attributes):
+    """Span of the active profiler, a detached record without one"""
+    profiler = get_profiler()
+    if profiler is None:
+        yield SpanRecord(name=name, rows=rows, attributes=attributes)
+    else:
+        with profiler.span(name, rows=rows, **attributes) as record:
+            yield record
+
+
+def profiled(name: str):
+    """Decorator running a function in a span of the active profiler"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_rows(rows: int) -> None:
+    """Count rows processed by the innermost open span"""
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.add_rows(rows)
+
+
+def record_span(name: str, **values) -> None:
+    """Record a span measured elsewhere on the active profiler"""
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.record(name, **values)
@@ -0,0 +1,176 @@
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+from typing import Optional
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+# magic, offset and length of the JSON header at the end of the file
+MAGIC = b"CCMODEL\x00"
+PREFIX = struct.Struct("<8sQQ")
+FORMAT_VERSION = 1
+# buffers start at multiples of the alignment, so arrays mapped from them are aligned
+ALIGNMENT = 64
+
+
+def get_codec(compression: Optional[str]):
+    """(compress, decompress) functions of a compression, None for no compression"""
+    if compression is None:
+        return None
+    if compression == "zlib":
+        import zlib
+
+        return zlib.compress, zlib.decompress
+    if compression == "lz4":
+        try:
+            import lz4.frame
+        except ImportError as e:
+            raise ImportError("lz4 compression needs the lz4 package") from e
+        return lz4.frame.compress, lz4.frame.decompress
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd compression needs the zstandard package") from e
+        return (
+            zstandard.ZstdCompressor().compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+    raise ValueError(f"Unknown compression {compression}, use lz4, zstd or zlib")
+
+
+def is_xgboost_booster(obj) -> bool:
+    # checked by name, so pickling a model without XGBoost never imports it
+    obj_type = type(obj)
+    return obj_type.__name__ == "Booster" and obj_type.__module__.startswith("xgboost")
+
+
+def load_booster(raw) -> object:
+    """XGBoost booster of its native UBJ model"""
+    import xgboost
+
+    return xgboost.Booster(model_file=bytearray(raw))
+
+
+class ArtifactPickler(pickle.Pickler):
+    """
+    Pickler storing XGBoost boosters as their native UBJ model, and objects whose
+    class defines reduce_for_artifact() with the reduce value it returns
+    """
+
+    def reducer_override(self, obj):
+        if is_xgboost_booster(obj):
+            raw = bytearray(obj.save_raw(raw_format="ubj"))
+            return load_booster, (pickle.PickleBuffer(raw),)
+        reduce_for_artifact = getattr(type(obj), "reduce_for_artifact", None)
+        if reduce_for_artifact is not None:
+            return reduce_for_artifact(obj)
+        return NotImplemented
+
+
+def is_model_artifact(file_path: str) -> bool:
+    with open(file_path, "rb") as file_obj:
+        return file_obj.read(len(MAGIC)) == MAGIC
+
+
+def save_model_artifact(
+    file_path: str, obj: object, compression: Optional[str] = None
+) -> None:
+    """
+    Save an object as a model artifact: a protocol 5 pickle whose NumPy arrays and
+    XGBoost models (native UBJ) are stored out of band, as aligned raw buffers.
+
+    Uncompressed, load_model_artifact memory-maps the buffers, so loading copies
+    no array and processes loading the same file share its pages. compression
+    "lz4", "zstd" or "zlib" compresses the pickle and every buffer instead.
+    """
+    try:
+        codec = get_codec(compression)
+        buffers = []
+        stream = io.BytesIO()
+        ArtifactPickler(stream, protocol=5, buffer_callback=buffers.append).dump(obj)
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, "wb") as file_obj:
+            file_obj.write(PREFIX.pack(MAGIC, 0, 0))
+
+            def write_section(raw) -> list:
+                raw_length = len(raw)
+                if codec is not None:
+                    raw = codec[0](raw)
+                padding = -file_obj.tell() % ALIGNMENT
+                file_obj.write(b"\x00" * padding)
+                offset = file_obj.tell()
+                file_obj.write(raw)
+                return [offset, len(raw), raw_length]
+
+            header = {
+                "version": FORMAT_VERSION,
+                "compression": compression,
+                "pickle": write_section(stream.getbuffer()),
+                "buffers": [write_section(buffer.raw()) for buffer in buffers],
+            }
+            header_raw = json.dumps(header).encode()
+            header_offset = file_obj.tell()
+            file_obj.write(header_raw)
+            file_obj.seek(0)
+            file_obj.write(PREFIX.pack(MAGIC, header_offset, len(header_raw)))
+        os.replace(tmp_file_path, file_path)
+        logging.info(
+            f"Saved {file_path} with {len(buffers)} out-of-band buffers, "
+            f"compression {compression}"
+        )
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def load_model_artifact(file_path: str, mmap_mode: bool = True) -> object:
+    """
+    Load a model artifact. Uncompressed buffers are memory-mapped read-only with
+    mmap_mode, and read into memory otherwise; the arrays loaded from them are
+    read-only.
+    """
+    try:
+        with open(file_path, "rb") as file_obj:
+            magic, header_offset, header_length = PREFIX.unpack(
+                file_obj.read(PREFIX.size)
+            )
+            if magic != MAGIC:
+                raise ValueError(f"{file_path} is not a model artifact")
+            file_obj.seek(header_offset)
+            header = json.loads(file_obj.read(header_length))
+            if header["version"] > FORMAT_VERSION:
+                raise ValueError(
+                    f"{file_path} has format version {header['version']}, "
+                    f"newer than {FORMAT_VERSION}"
+                )
+            codec = get_codec(header["compression"])
+            if codec is None and mmap_mode:
+                # the map outlives the file object, as long as arrays use it
+                content = memoryview(
+                    mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+            else:
+                file_obj.seek(0)
+                content = memoryview(file_obj.read())
+
+        def read_section(section):
+            offset, length, _ = section
+            raw = content[offset : offset + length]
+            if codec is not None:
+                raw = codec[1](raw)
+            return raw
+
+        return pickle.loads(
+            read_section(header["pickle"]),
+            buffers=[read_section(section) for section in header["buffers"]],
+        )
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
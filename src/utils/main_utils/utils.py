@@ -3,12 +3,15 @@ from src.exception.exception import CreditCardException
 from src.logging.logger import logging
 import os, sys
 import numpy as np
+import pandas as pd
 
 # import dill
 import pickle
 
-from sklearn.metrics import r2_score
-from sklearn.model_selection import GridSearchCV
+from src.utils.main_utils.model_artifact import is_model_artifact, load_model_artifact
+from src.utils.main_utils.instrumentation import profile, record_span
+from src.utils.ml_utils.model.model_search import ModelSearch
+from src.utils.ml_utils.model.model_selection import ModelSelector
 
 
 def read_yaml_file(file_path: str) -> dict:
@@ -31,17 +34,144 @@ def write_yaml_file(file_path: str, content: object, replace: bool = False) -> N
         raise CreditCardException(e, sys)
 
 
-def save_numpy_array_data(file_path: str, array: np.array):
+def get_schema_dtypes(schema_config: dict) -> dict:
+    """
+    Get the column dtypes of the schema file
+    schema_config: dict content of the schema file
+    return: dict column name -> dtype name
+    """
+    dtypes = {}
+    for column in schema_config.get("columns", []):
+        dtypes.update(column)
+    return dtypes
+
+
+def apply_schema_dtypes(dataframe: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Cast the columns of the dataframe to the dtypes of the schema file.
+    Integer columns containing nan values are left as they are.
+    """
+    try:
+        casts = {}
+        for column, dtype in dtypes.items():
+            if column not in dataframe.columns or dataframe[column].dtype == dtype:
+                continue
+            if np.dtype(dtype).kind in "iu" and dataframe[column].isna().any():
+                logging.warning(f"Column {column} has nan values, kept as {dataframe[column].dtype}")
+                continue
+            casts[column] = dtype
+        return dataframe.astype(casts) if casts else dataframe
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def write_dataframe(file_path: str, dataframe: pd.DataFrame) -> None:
+    """
+    Write a dataframe in the format given by the file extension
+    (.parquet, .arrow for Arrow IPC or .csv)
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        extension = os.path.splitext(file_path)[1]
+        if extension == ".parquet":
+            dataframe.to_parquet(file_path, index=False)
+        elif extension in (".arrow", ".feather"):
+            dataframe.reset_index(drop=True).to_feather(file_path)
+        else:
+            dataframe.to_csv(file_path, index=False, header=True)
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def read_dataframe(file_path: str, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Read a dataframe in the format given by the file extension
+    file_path: str location of file to load
+    dtypes: dict column dtypes to apply, used to parse csv files
+    """
+    try:
+        extension = os.path.splitext(file_path)[1]
+        if extension == ".parquet":
+            dataframe = pd.read_parquet(file_path)
+        elif extension in (".arrow", ".feather"):
+            dataframe = pd.read_feather(file_path)
+        else:
+            dataframe = pd.read_csv(file_path)
+        if dtypes:
+            dataframe = apply_schema_dtypes(dataframe, dtypes)
+        return dataframe
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def iter_dataframe_chunks(file_path: str, chunk_size: int):
+    """
+    Iterate over a dataframe file in chunks of at most chunk_size rows,
+    without loading the whole file
+    """
+    try:
+        extension = os.path.splitext(file_path)[1]
+        if extension == ".parquet":
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        elif extension in (".arrow", ".feather"):
+            import pyarrow as pa
+
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    for offset in range(0, batch.num_rows, chunk_size):
+                        yield batch.slice(offset, chunk_size).to_pandas()
+        else:
+            yield from pd.read_csv(file_path, chunksize=chunk_size)
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def count_dataframe_rows(file_path: str) -> int:
+    """
+    Count the rows of a dataframe file, from the metadata for parquet and arrow files
+    """
+    try:
+        extension = os.path.splitext(file_path)[1]
+        if extension == ".parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetFile(file_path).metadata.num_rows
+        if extension in (".arrow", ".feather"):
+            import pyarrow as pa
+
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                return sum(
+                    reader.get_batch(i).num_rows
+                    for i in range(reader.num_record_batches)
+                )
+        n_lines = 0
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(1 << 20), b""):
+                n_lines += block.count(b"\n")
+        # Minus the header line
+        return max(n_lines - 1, 0)
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def save_numpy_array_data(file_path: str, array: np.array, dtype: str = None):
     """
     Save numpy array data to file
     file_path: str location of file to save
     array: np.array data to save
+    dtype: str dtype to store the array as, defaults to the dtype of the array
     """
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
         with open(file_path, "wb") as file_obj:
-            np.save(file_obj, array)
+            np.save(file_obj, np.ascontiguousarray(array, dtype=dtype))
     except Exception as e:
         raise CreditCardException(e, sys) from e
 
@@ -50,8 +180,11 @@ def save_object(file_path: str, obj: object) -> None:
     try:
         logging.info("Entered the save_object method of MainUtils class")
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as file_obj:
+        # written aside and renamed, so readers never load a partial file
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, "wb") as file_obj:
             pickle.dump(obj, file_obj)
+        os.replace(tmp_file_path, file_path)
         logging.info("Exited the save_object method of MainUtils class")
     except Exception as e:
         raise CreditCardException(e, sys) from e
@@ -59,58 +192,95 @@ def save_object(file_path: str, obj: object) -> None:
 
 def load_object(
     file_path: str,
+    mmap_mode: bool = True,
 ) -> object:
+    """
+    Load an object saved by save_object, or a model artifact saved by
+    save_model_artifact, whose arrays are memory-mapped with mmap_mode
+    """
     try:
         if not os.path.exists(file_path):
             raise Exception(f"The file: {file_path} is not exists")
+        if is_model_artifact(file_path):
+            return load_model_artifact(file_path, mmap_mode=mmap_mode)
         with open(file_path, "rb") as file_obj:
-            print(file_obj)
             return pickle.load(file_obj)
     except Exception as e:
         raise CreditCardException(e, sys) from e
 
 
-def load_numpy_array_data(file_path: str) -> np.array:
+def load_numpy_array_data(file_path: str, mmap_mode: str = None) -> np.array:
     """
     load numpy array data from file
     file_path: str location of file to load
+    mmap_mode: str memory-map the file instead of reading it, e.g. "r"
     return: np.array data loaded
     """
     try:
+        if mmap_mode:
+            return np.load(file_path, mmap_mode=mmap_mode)
         with open(file_path, "rb") as file_obj:
             return np.load(file_obj)
     except Exception as e:
         raise CreditCardException(e, sys) from e
 
 
-def evaluate_models(X_train, y_train, X_test, y_test, models, param):
-    try:
-        report = {}
-
-        for i, model_name in enumerate(list(models)):
-            print(f"Evaluating {model_name}...")
-            model = list(models.values())[i]
-            para = param[list(models.keys())[i]]
-
-            gs = GridSearchCV(model, para, cv=3)
-            gs.fit(X_train, y_train)
-
-            model.set_params(**gs.best_params_)
-            model.fit(X_train, y_train)
-
-            # model.fit(X_train, y_train)  # Train model
-
-            y_train_pred = model.predict(X_train)
-
-            y_test_pred = model.predict(X_test)
-
-            train_model_score = r2_score(y_train, y_train_pred)
+def evaluate_models(
+    X_train,
+    y_train,
+    X_test,
+    y_test,
+    models,
+    param,
+    sample_weight=None,
+    search_params: dict = None,
+    fit_cache=None,
+    selector: ModelSelector = None,
+    checkpoint_dir: str = None,
+):
+    """
+    Search the hyperparameters of every model family with a ModelSearch and score
+    the best candidate of each family on the test data with one predict_proba pass,
+    cached in the selector. The fitted best candidates replace the unfitted models
+    in the models dict.
 
-            test_model_score = r2_score(y_test, y_test_pred)
+    Args:
+      models: dict of name to estimator
+      param: dict of name to parameter grid
+      sample_weight: optional sample weights of the training rows
+      search_params: keyword arguments of the ModelSearch
+      fit_cache: optional FitCache of fold scores and fitted estimators
+      selector: ModelSelector holding the selection metric and the cached scores
+      checkpoint_dir: optional dir of the per-family search checkpoints
 
-            report[list(models.keys())[i]] = test_model_score
+    Returns:
+      dict of name to the selection metric on the test data
+    """
+    try:
+        model_search = ModelSearch(
+            **(search_params or {}), fit_cache=fit_cache, checkpoint_dir=checkpoint_dir
+        )
+        with profile("model_search", rows=len(X_train)) as span:
+            results = model_search.run(
+                X_train, y_train, models, param, sample_weight=sample_weight
+            )
+            if fit_cache is not None:
+                span.attributes.update(
+                    fit_cache_hits=fit_cache.hits, fit_cache_misses=fit_cache.misses
+                )
+            # the families share one worker pool, so each gets its summed fit time
+            for model_name, result in results.items():
+                models[model_name] = result.estimator
+                record_span(
+                    f"model_search.{model_name}",
+                    n_trials=result.n_trials,
+                    fit_time=float(result.fit_time),
+                    best_score=float(result.best_score),
+                )
 
-        return report
+        if selector is None:
+            selector = ModelSelector()
+        return selector.score(models, X_test, y_test)
 
     except Exception as e:
         raise CreditCardException(e, sys)
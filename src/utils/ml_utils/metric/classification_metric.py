@@ -1,19 +1,177 @@
 from src.entity.artifact_entity import ClassificationMetricArtifact
 from src.exception.exception import CreditCardException
+from src.logging.logger import logging
 from sklearn.metrics import f1_score, precision_score, recall_score
+import numpy as np
 import sys
 
 
-def get_classification_score(y_true, y_pred) -> ClassificationMetricArtifact:
+def get_positive_scores(model, X) -> np.ndarray:
+    """
+    Scores of the positive class from one inference pass: predict_proba where
+    available, then decision_function, then the hard predictions.
+    """
     try:
+        if hasattr(model, "predict_proba"):
+            return np.asarray(model.predict_proba(X))[:, 1]
+        if hasattr(model, "decision_function"):
+            return np.asarray(model.decision_function(X))
+        return np.asarray(model.predict(X), dtype=np.float64)
+    except Exception as e:
+        raise CreditCardException(e, sys)
+
+
+def threshold_sweep(y_true, y_score):
+    """
+    True and predicted positives of predicting the positive class for
+    y_score >= threshold, at every distinct score as threshold, from one sort and
+    a cumulative sum.
+
+    Returns:
+      thresholds in decreasing order, true positives and predicted positives
+    """
+    y_true = np.asarray(y_true) == 1
+    y_score = np.asarray(y_score)
+    order = np.argsort(y_score, kind="mergesort")[::-1]
+    y_score = y_score[order]
+    y_true = y_true[order]
+
+    distinct = np.r_[np.flatnonzero(np.diff(y_score)), len(y_score) - 1]
+    true_positives = np.cumsum(y_true)[distinct]
+    return y_score[distinct], true_positives, distinct + 1
+
+
+def precision_recall_sweep(y_true, y_score):
+    """
+    Precision and recall at every distinct score as threshold.
+
+    Returns:
+      thresholds in decreasing order, precision and recall at each threshold
+    """
+    thresholds, true_positives, predicted_positives = threshold_sweep(y_true, y_score)
+    precision = true_positives / predicted_positives
+    if true_positives[-1]:
+        recall = true_positives / true_positives[-1]
+    else:
+        recall = np.zeros(len(true_positives))
+    return thresholds, precision, recall
+
+
+def get_threshold_metrics(y_true, y_score, min_precision: float = 0.9) -> dict:
+    """
+    Threshold-free metrics of positive-class scores from one vectorized sweep.
+
+    Returns:
+      dict with the best f1 over all thresholds and its threshold, the area under
+      the precision-recall curve (average precision) and the best recall with a
+      precision of at least min_precision
+    """
+    try:
+        thresholds, precision, recall = precision_recall_sweep(y_true, y_score)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f1 = np.where(
+                precision + recall > 0,
+                2 * precision * recall / (precision + recall),
+                0.0,
+            )
+        best = int(np.argmax(f1))
+        pr_auc = float(np.sum(np.diff(np.r_[0.0, recall]) * precision))
+        precise = precision >= min_precision
+        return {
+            "best_f1": float(f1[best]),
+            "best_threshold": float(thresholds[best]),
+            "pr_auc": pr_auc,
+            "recall_at_precision": float(recall[precise].max()) if precise.any() else 0.0,
+        }
+    except Exception as e:
+        raise CreditCardException(e, sys)
+
+
+def select_threshold(
+    y_true,
+    y_score,
+    method: str = "precision",
+    target_precision: float = 0.9,
+    cost_ratio: float = 10.0,
+) -> float:
+    """
+    Decision threshold on positive-class scores from one precision-recall sweep.
+
+    Args:
+      method: "precision" for the best recall with a precision of at least
+        target_precision (falling back to "f1" if no threshold reaches it), "cost"
+        for the least false positives + cost_ratio * false negatives, "f1" for
+        the best f1
+      target_precision: precision the "precision" method has to reach
+      cost_ratio: cost of a missed positive relative to a false alarm
+
+    Returns:
+      threshold, positives are predicted for scores >= threshold
+    """
+    try:
+        if method == "cost":
+            thresholds, true_positives, predicted_positives = threshold_sweep(
+                y_true, y_score
+            )
+            n_positives = true_positives[-1]
+            cost = (predicted_positives - true_positives) + cost_ratio * (
+                n_positives - true_positives
+            )
+            best = int(np.argmin(cost))
+            # predicting no positive at all costs cost_ratio * n_positives
+            if cost[best] >= cost_ratio * n_positives:
+                return float(np.nextafter(thresholds[0], np.inf))
+            return float(thresholds[best])
+
+        thresholds, precision, recall = precision_recall_sweep(y_true, y_score)
+        if method == "precision":
+            precise = np.flatnonzero(precision >= target_precision)
+            if len(precise):
+                # the lowest threshold has the highest recall
+                return float(thresholds[precise[np.argmax(recall[precise])]])
+            logging.warning(
+                f"No threshold reaches a precision of {target_precision}, "
+                "using the best f1 threshold"
+            )
+            method = "f1"
+        if method == "f1":
+            return get_threshold_metrics(y_true, y_score)["best_threshold"]
+        raise ValueError(f"Unknown threshold method: {method}")
+    except Exception as e:
+        raise CreditCardException(e, sys)
+
+
+def get_classification_score(
+    y_true,
+    y_pred=None,
+    y_score=None,
+    threshold: float = 0.5,
+    min_precision: float = 0.9,
+) -> ClassificationMetricArtifact:
+    """
+    Score hard predictions, or cached positive-class scores thresholded at
+    threshold. With scores, the PR-AUC and recall at min_precision are added.
+    """
+    try:
+        if y_pred is None:
+            if y_score is None:
+                raise ValueError("Either y_pred or y_score is required")
+            y_pred = (np.asarray(y_score) >= threshold).astype(np.int8)
+
         model_f1_score = f1_score(y_true, y_pred)
         model_recall_score = recall_score(y_true, y_pred)
         model_precision_score = precision_score(y_true, y_pred)
 
+        threshold_metrics = {}
+        if y_score is not None:
+            threshold_metrics = get_threshold_metrics(y_true, y_score, min_precision)
+
         classification_metric = ClassificationMetricArtifact(
             f1_score=model_f1_score,
             precision_score=model_precision_score,
             recall_score=model_recall_score,
+            pr_auc=threshold_metrics.get("pr_auc"),
+            recall_at_precision=threshold_metrics.get("recall_at_precision"),
         )
         return classification_metric
     except Exception as e:
@@ -1,23 +1,148 @@
 from src.constant.training_pipeline import SAVED_MODEL_DIR, MODEL_FILE_NAME
+import copy
+import copyreg
 import os
 import sys
 import pandas as pd
 import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.tree._tree import Tree
 from src.exception.exception import CreditCardException
 from src.logging.logger import logging
-from src.constant.training_pipeline import TARGET_COLUMN
+from src.constant.training_pipeline import ID_COLUMN, TARGET_COLUMN
+from src.utils.ml_utils.metric.classification_metric import get_positive_scores
+from src.utils.ml_utils.preprocessing.imputer import FastPathImputer
 
 
 class CreditCardModel:
-    def __init__(self, preprocessor, model):
+    def __init__(
+        self,
+        preprocessor,
+        model,
+        threshold: float = 0.5,
+        reference_sketch=None,
+        schema_validator=None,
+    ):
         try:
             self.preprocessor = preprocessor
             self.model = model
+            # positives are predicted for positive-class scores >= threshold
+            self.threshold = threshold
+            # ReferenceSketch of the train data to check input batches for drift
+            self.reference_sketch = reference_sketch
+            # SchemaValidator of the input features to check input batches
+            self.schema_validator = schema_validator
             # Initialize azure_predictor only when needed
             self._azure_predictor = None
+            self.reset_plan()
         except Exception as e:
             raise CreditCardException(e, sys)
 
+    @property
+    def model(self):
+        """
+        The fitted model. A tree model loaded from a model artifact gets its sklearn
+        trees back from the flat tree arrays on first use.
+        """
+        if self._model is None and self._stripped_model is not None:
+            self._model = CompiledScorer.rebuild_trees(
+                self._stripped_model, self._flat_trees
+            )
+            self._stripped_model = None
+        return self._model
+
+    @model.setter
+    def model(self, model) -> None:
+        self._model = model
+        # fitted model without its sklearn trees, see reduce_for_artifact
+        self._stripped_model = None
+        # tree arrays flattened by compile(), the only copy of the trees in a
+        # model artifact
+        self._flat_trees = None
+
+    def reset_plan(self) -> None:
+        """Drop the column plan, rebuilt on the next call after a refit"""
+        self._feature_names = None
+        self._n_features = None
+        self._transform_steps = None
+        self._array_input = True
+        # column tuple of an input frame -> positions of the training features
+        self._column_plans = {}
+
+    def build_plan(self) -> None:
+        """
+        Precompute, once per fitted preprocessor, the training features and the
+        transformers applied in turn, so scoring a batch skips the Pipeline dispatch
+        """
+        steps = [self.preprocessor]
+        if isinstance(self.preprocessor, Pipeline):
+            steps = [
+                step
+                for _, step in self.preprocessor.steps
+                if step is not None and step != "passthrough"
+            ]
+        feature_names = getattr(self.preprocessor, "feature_names_in_", None)
+        if feature_names is None and steps:
+            feature_names = getattr(steps[0], "feature_names_in_", None)
+        n_features = getattr(self.preprocessor, "n_features_in_", None)
+        if n_features is None and steps:
+            n_features = getattr(steps[0], "n_features_in_", None)
+
+        self._feature_names = None if feature_names is None else list(feature_names)
+        self._n_features = (
+            len(self._feature_names) if feature_names is not None else n_features
+        )
+        # sklearn transformers fitted on a frame warn on arrays, FastPathImputer
+        # takes both
+        self._array_input = all(
+            isinstance(step, FastPathImputer)
+            or getattr(step, "feature_names_in_", None) is None
+            for step in steps
+        )
+        self._column_plans = {}
+        self._transform_steps = steps
+
+    def get_column_plan(self, columns: pd.Index):
+        """Positions of the training features in the columns, None if in order"""
+        key = tuple(columns)
+        if key in self._column_plans:
+            return self._column_plans[key]
+
+        if self._feature_names is None:
+            # preprocessor fitted on arrays: every column but the target, in order
+            positions = np.flatnonzero(columns != TARGET_COLUMN)
+        else:
+            positions = columns.get_indexer(self._feature_names)
+            if (positions < 0).any():
+                missing = [
+                    name
+                    for name, position in zip(self._feature_names, positions)
+                    if position < 0
+                ]
+                raise ValueError(f"Missing required features: {missing}")
+            extra_cols = (
+                set(columns) - set(self._feature_names) - {TARGET_COLUMN, ID_COLUMN}
+            )
+            if extra_cols:
+                logging.warning(f"Extra features will be ignored: {extra_cols}")
+
+        plan = None
+        if len(positions) != len(columns) or (positions != np.arange(len(columns))).any():
+            plan = positions
+        self._column_plans[key] = plan
+        return plan
+
+    def apply_preprocessor(self, x: np.ndarray):
+        """Run the feature matrix, in training column order, through the transformers"""
+        if not self._array_input:
+            x = pd.DataFrame(x, columns=self._feature_names)
+        for step in self._transform_steps:
+            x = step.transform(x)
+        return x
+
     @property
     def azure_predictor(self):
         if self._azure_predictor is None:
@@ -25,44 +150,106 @@ class CreditCardModel:
             self._azure_predictor = AzurePredictor()
         return self._azure_predictor
 
-    def predict(self, x):
+    def transform(self, x):
+        """Align the input with the training features and preprocess it"""
         try:
-            # Get the feature names the preprocessor was trained on
-            if hasattr(self.preprocessor, "feature_names_in_"):
-                required_features = self.preprocessor.feature_names_in_
-            else:
-                # If using the first step of the pipeline
-                required_features = self.preprocessor.steps[0][1].feature_names_in_
-
-            # Convert input to DataFrame if it's not already
+            if self._transform_steps is None:
+                self.build_plan()
+
+            if isinstance(x, np.ndarray):
+                return self.apply_preprocessor(self.check_array(x))
             if not isinstance(x, pd.DataFrame):
-                if isinstance(x, np.ndarray):
-                    x = pd.DataFrame(x, columns=required_features)
-                else:
-                    x = pd.DataFrame(x)
+                x = pd.DataFrame(x)
+
+            # Select the training features in order, dropping the target column
+            plan = self.get_column_plan(x.columns)
+            if plan is not None:
+                x = x.take(plan, axis=1)
+            return self.apply_preprocessor(x.to_numpy(dtype=np.float64))
 
-            # Remove the target column if it exists in the input
-            if TARGET_COLUMN in x.columns:
-                x = x.drop(columns=[TARGET_COLUMN])
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
-            # Reorder columns to match training data
-            missing_cols = set(required_features) - set(x.columns)
-            extra_cols = set(x.columns) - set(required_features)
+    def check_array(self, x: np.ndarray) -> np.ndarray:
+        # float32 values widen exactly, every transformer then sees float64
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim != 2 or (self._n_features is not None and x.shape[1] != self._n_features):
+            raise ValueError(
+                f"X has shape {x.shape}, expected {self._n_features} features"
+            )
+        return x
 
-            if missing_cols:
-                raise ValueError(f"Missing required features: {missing_cols}")
+    def predict_proba(self, x):
+        """Class probabilities of the model"""
+        try:
+            return self.model.predict_proba(self.transform(x))
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
-            if extra_cols:
-                logging.warning(f"Extra features will be ignored: {extra_cols}")
-                x = x[required_features]
+    def predict(self, x, threshold: float = None):
+        """
+        Predict the positive class for positive-class scores >= threshold, the
+        threshold tuned at training time by default
+        """
+        try:
+            if threshold is None:
+                threshold = self.threshold
+            scores = get_positive_scores(self.model, self.transform(x))
+            return (scores >= threshold).astype(int)
+
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def predict_array(self, x: np.ndarray, threshold: float = None) -> np.ndarray:
+        """
+        Predict from a feature matrix already in training column order, a
+        contiguous float32 or float64 array, with no DataFrame in the way
+        """
+        try:
+            if self._transform_steps is None:
+                self.build_plan()
+            if threshold is None:
+                threshold = self.threshold
+            features = self.apply_preprocessor(self.check_array(x))
+            scores = get_positive_scores(self.model, features)
+            return (scores >= threshold).astype(int)
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
-            # Ensure column order matches training data
-            x = x[required_features]
+    def compile(self) -> "CompiledScorer":
+        """Low-latency scorer of single records with the results of predict"""
+        try:
+            return CompiledScorer(self)
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
-            transformed_features = self.preprocessor.transform(x)
-            predictions = self.model.predict(transformed_features)
-            return predictions
+    def validate(self, x):
+        """
+        Check an input batch against the schema constraints.
+        Returns the SchemaValidationResult, None without a schema validator.
+        """
+        try:
+            if self.schema_validator is None:
+                return None
+            if not isinstance(x, pd.DataFrame):
+                x = pd.DataFrame(x)
+            return self.schema_validator.validate(x)
+        except Exception as e:
+            raise CreditCardException(e, sys)
 
+    def check_drift(self, x, psi_threshold: float = 0.2, min_rows: int = 100) -> dict:
+        """
+        Check an input batch against the reference sketch of the train data.
+        Returns the per-column report, empty without a reference sketch.
+        """
+        try:
+            if self.reference_sketch is None:
+                return {}
+            if not isinstance(x, pd.DataFrame):
+                x = pd.DataFrame(x)
+            return self.reference_sketch.check(
+                x, psi_threshold=psi_threshold, min_rows=min_rows
+            )
         except Exception as e:
             raise CreditCardException(e, sys)
 
@@ -71,8 +258,265 @@ class CreditCardModel:
         state = self.__dict__.copy()
         # Don't pickle the azure_predictor
         state['_azure_predictor'] = None
+        state["model"] = self.model
+        # the flat trees are cheap to rebuild, a plain pickle stores the trees once
+        for key in ("_model", "_stripped_model", "_flat_trees"):
+            state.pop(key, None)
+        # the column plan is rebuilt on load
+        for key in (
+            "_feature_names",
+            "_n_features",
+            "_transform_steps",
+            "_array_input",
+            "_column_plans",
+        ):
+            state.pop(key, None)
         return state
 
     def __setstate__(self, state):
         """Custom deserialization method"""
+        # models pickled before the threshold was tuned use the default cut-off
+        state.setdefault("threshold", 0.5)
+        state.setdefault("reference_sketch", None)
+        state.setdefault("schema_validator", None)
+        flat_trees = state.get("_flat_trees")
+        if flat_trees is not None and "nodes" not in flat_trees:
+            # flat trees of an older layout, compile() flattens the trees again
+            state["_flat_trees"] = None
+        state.setdefault("_flat_trees", None)
+        state["_model"] = state.pop("model", None)
+        state.setdefault("_stripped_model", None)
         self.__dict__.update(state)
+        self.reset_plan()
+
+    def reduce_for_artifact(self):
+        """
+        Reduce for save_model_artifact. A tree model compiled into flat tree arrays
+        is stored without its sklearn trees: the arrays are memory-mapped from the
+        file and shared by the processes serving it, and the trees are rebuilt
+        from them only when the fitted model itself is used.
+        """
+        state = self.__getstate__()
+        if self._flat_trees is not None:
+            state["_flat_trees"] = self._flat_trees
+            state["_stripped_model"] = CompiledScorer.strip_trees(state.pop("model"))
+        return copyreg.__newobj__, (type(self),), state
+
+
+class CompiledScorer:
+    """
+    Score one record, or a small batch, with the fixed per-call overhead of
+    CreditCardModel.predict compiled away.
+
+    Records are dicts of the training features or arrays in training column order.
+    The imputation is fused: clean rows skip it, and the NaNs of a SimpleImputer
+    are filled from its constants, other imputers only run for the rows with
+    NaNs. XGBoost models score through the native booster's inplace_predict, and
+    sklearn trees and forests through their nodes flattened into NumPy arrays,
+    walked for every tree at once. Other models use get_positive_scores. The
+    scores match CreditCardModel.predict_proba bit for bit for XGBoost and the
+    sklearn trees, and up to float rounding for other models.
+    """
+
+    def __init__(self, credit_card_model: CreditCardModel):
+        if credit_card_model._transform_steps is None:
+            credit_card_model.build_plan()
+        self.credit_card_model = credit_card_model
+        self.threshold = credit_card_model.threshold
+        self.feature_names = credit_card_model._feature_names
+        self.n_features = credit_card_model._n_features
+        self.compile_preprocessor(credit_card_model._transform_steps)
+        self.compile_model(credit_card_model)
+
+    def compile_preprocessor(self, steps: list) -> None:
+        self.imputer = None
+        self.fill_values = None
+        # the preprocessor is not a lone FastPathImputer: run it as is
+        self.fused = len(steps) == 1 and isinstance(steps[0], FastPathImputer)
+        if self.fused:
+            self.imputer = steps[0].imputer_
+            if isinstance(self.imputer, SimpleImputer) and np.isnan(
+                float(self.imputer.missing_values)
+            ):
+                self.fill_values = np.asarray(self.imputer.statistics_, dtype=np.float64)
+
+    def compile_model(self, credit_card_model: CreditCardModel) -> None:
+        self.booster = None
+        self.trees = None
+        # flat trees of a model artifact are used without loading the model
+        if credit_card_model._flat_trees is None:
+            model = credit_card_model.model
+            if hasattr(model, "get_booster") and model.objective == "binary:logistic":
+                self.booster = model.get_booster()
+                # the iteration range XGBClassifier.predict_proba resolves on every call
+                try:
+                    self.iteration_range = (0, model.best_iteration + 1)
+                except AttributeError:
+                    self.iteration_range = (0, 0)
+                if model.booster == "gblinear":
+                    self.iteration_range = (0, 0)
+                self.missing = model.missing
+                return
+            tree_models = (
+                DecisionTreeClassifier,
+                RandomForestClassifier,
+                ExtraTreesClassifier,
+            )
+            if not (
+                isinstance(model, tree_models)
+                and model.n_outputs_ == 1
+                and model.n_classes_ == 2
+            ):
+                return
+            estimators = getattr(model, "estimators_", [model])
+            credit_card_model._flat_trees = self.flatten_trees(
+                [estimator.tree_ for estimator in estimators],
+                is_forest=hasattr(model, "estimators_"),
+            )
+        self.trees = credit_card_model._flat_trees
+        nodes = self.trees["nodes"]
+        # views of the node records, no copy of the mapped arrays
+        self.node_left = nodes["left_child"]
+        self.node_right = nodes["right_child"]
+        self.node_feature = nodes["feature"]
+        self.node_threshold = nodes["threshold"]
+        self.roots = self.trees["offsets"][:-1]
+        # the positive-class value of the leaves, as tree_.predict returns it
+        self.leaf_score = self.trees["values"][:, 0, 1]
+
+    @staticmethod
+    def flatten_trees(trees: list, is_forest: bool) -> dict:
+        """
+        Node records and values of the trees, from their sklearn state, in shared
+        arrays. The children are indices into the shared arrays and the leaves
+        point to themselves, compare feature 0 with +inf; rebuild_trees undoes it.
+        """
+        states = [tree.__getstate__() for tree in trees]
+        node_counts = [state["node_count"] for state in states]
+        offsets = np.cumsum([0] + node_counts)
+        # concatenate would pack the records, unaligned fields are slow to gather
+        nodes = np.empty(offsets[-1], dtype=states[0]["nodes"].dtype)
+        for offset, state in zip(offsets, states):
+            nodes[offset : offset + state["node_count"]] = state["nodes"]
+        index = np.arange(len(nodes))
+        node_offsets = np.repeat(offsets[:-1], node_counts)
+        is_leaf = nodes["left_child"] < 0
+        for child in ("left_child", "right_child"):
+            nodes[child] = np.where(is_leaf, index, nodes[child] + node_offsets)
+        nodes["feature"] = np.where(is_leaf, 0, nodes["feature"])
+        nodes["threshold"] = np.where(is_leaf, np.inf, nodes["threshold"])
+        return {
+            "offsets": offsets,
+            "nodes": nodes,
+            "values": np.concatenate([state["values"] for state in states]),
+            "max_depths": np.array([state["max_depth"] for state in states]),
+            "max_depth": max(state["max_depth"] for state in states),
+            "is_forest": is_forest,
+        }
+
+    @staticmethod
+    def strip_trees(model):
+        """Copy of a tree model without the sklearn trees of its estimators"""
+        stripped = copy.copy(model)
+        if hasattr(model, "estimators_"):
+            stripped.estimators_ = [copy.copy(e) for e in model.estimators_]
+        for estimator in getattr(stripped, "estimators_", [stripped]):
+            del estimator.tree_
+        return stripped
+
+    @staticmethod
+    def rebuild_trees(stripped_model, trees: dict):
+        """Give a stripped tree model its sklearn trees back, from the flat trees"""
+        offsets = trees["offsets"]
+        estimators = getattr(stripped_model, "estimators_", [stripped_model])
+        for i, estimator in enumerate(estimators):
+            start, end = offsets[i], offsets[i + 1]
+            nodes = trees["nodes"][start:end].copy()
+            is_leaf = nodes["left_child"] == np.arange(start, end)
+            # sklearn's leaf markers, TREE_LEAF children and TREE_UNDEFINED split
+            for child in ("left_child", "right_child"):
+                nodes[child] = np.where(is_leaf, -1, nodes[child] - start)
+            nodes["feature"] = np.where(is_leaf, -2, nodes["feature"])
+            nodes["threshold"] = np.where(is_leaf, -2.0, nodes["threshold"])
+            tree = Tree(
+                estimator.n_features_in_,
+                np.atleast_1d(estimator.n_classes_).astype(np.intp),
+                estimator.n_outputs_,
+            )
+            # the rebuilt trees are private copies
+            tree.__setstate__(
+                {
+                    "max_depth": int(trees["max_depths"][i]),
+                    "node_count": int(end - start),
+                    "nodes": nodes,
+                    "values": trees["values"][start:end],
+                }
+            )
+            estimator.tree_ = tree
+        return stripped_model
+
+    def to_array(self, record) -> np.ndarray:
+        """2-D float64 matrix of a record or a batch, in training column order"""
+        if isinstance(record, dict):
+            if self.feature_names is None:
+                raise ValueError("The preprocessor was fitted without feature names")
+            missing = [name for name in self.feature_names if name not in record]
+            if missing:
+                raise ValueError(f"Missing required features: {missing}")
+            return np.fromiter(
+                (record[name] for name in self.feature_names),
+                dtype=np.float64,
+                count=len(self.feature_names),
+            ).reshape(1, -1)
+        x = np.asarray(record, dtype=np.float64)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        return self.credit_card_model.check_array(x)
+
+    def preprocess(self, x: np.ndarray) -> np.ndarray:
+        if not self.fused:
+            return self.credit_card_model.apply_preprocessor(x)
+        missing = np.isnan(x)
+        if not missing.any():
+            return x
+        if self.fill_values is not None:
+            return np.where(missing, self.fill_values, x)
+        return self.imputer.transform(x)
+
+    def score_trees(self, x: np.ndarray) -> np.ndarray:
+        # trees compare float32 features with their float64 thresholds
+        x = x.astype(np.float32)
+        rows = np.arange(len(x))[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (len(x), len(self.roots)))
+        for _ in range(self.trees["max_depth"]):
+            go_left = x[rows, self.node_feature[node]] <= self.node_threshold[node]
+            node = np.where(go_left, self.node_left[node], self.node_right[node])
+        scores = self.leaf_score[node]
+        if not self.trees["is_forest"]:
+            return scores[:, 0]
+        # summed tree by tree in order, as the forest accumulates them
+        return np.cumsum(scores, axis=1)[:, -1] / scores.shape[1]
+
+    def score(self, record) -> np.ndarray:
+        """Positive-class scores of a record or a batch"""
+        try:
+            features = self.preprocess(self.to_array(record))
+            if self.booster is not None:
+                return self.booster.inplace_predict(
+                    features,
+                    iteration_range=self.iteration_range,
+                    missing=self.missing,
+                    validate_features=False,
+                )
+            # trees send NaNs their own way, left to the model
+            if self.trees is not None and not np.isnan(features).any():
+                return self.score_trees(features)
+            return get_positive_scores(self.credit_card_model.model, features)
+        except Exception as e:
+            raise CreditCardException(e, sys)
+
+    def predict(self, record, threshold: float = None) -> np.ndarray:
+        """Predict the positive class for scores >= threshold, the tuned one by default"""
+        if threshold is None:
+            threshold = self.threshold
+        return (self.score(record) >= threshold).astype(int)
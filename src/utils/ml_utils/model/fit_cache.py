@@ -0,0 +1,161 @@
+import hashlib
+import os
+import pickle
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+# Rows hashed at a time, so memory-mapped arrays are never read at once
+HASH_CHUNK_BYTES = 64 * 1024 * 1024
+# Eviction frees the cache down to this fraction of max_bytes, so a full cache is
+# not scanned again on the next set
+EVICT_TARGET_RATIO = 0.8
+
+
+class FitCache:
+    """
+    Content-addressed on-disk cache of cross-validation fold scores and fitted
+    estimators. Keys hash the training arrays, the estimator class and params and
+    the rows of the split, so unchanged trials are never fitted twice across runs.
+    The least recently used entries are evicted once the cache grows beyond
+    max_bytes. The size of the cache is scanned once and then tracked in memory,
+    the directory is only scanned again to evict; entries written by other
+    processes are counted from that scan on.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # size of every entry, None until the cache dir was scanned
+        self._sizes: Optional[dict] = None
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_arrays(*arrays) -> str:
+        """Hash the dtype, shape and content of arrays, None included"""
+        digest = hashlib.blake2b(digest_size=20)
+        for array in arrays:
+            if array is None:
+                digest.update(b"none")
+                continue
+            array = np.asanyarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            if array.ndim == 0 or not len(array):
+                digest.update(np.ascontiguousarray(array).tobytes())
+                continue
+            row_bytes = max(array.nbytes // len(array), 1)
+            step = max(HASH_CHUNK_BYTES // row_bytes, 1)
+            for start in range(0, len(array), step):
+                digest.update(np.ascontiguousarray(array[start : start + step]).data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def describe_estimator(estimator, params: dict) -> str:
+        """Class, library version and params of an estimator set to params"""
+        estimator_class = type(estimator)
+        package = sys.modules.get(estimator_class.__module__.split(".")[0])
+        version = getattr(package, "__version__", "")
+        all_params = {**estimator.get_params(deep=False), **params}
+        return (
+            f"{estimator_class.__module__}.{estimator_class.__qualname__}"
+            f"@{version}{sorted(all_params.items())!r}"
+        )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    @staticmethod
+    def touch(file_path: str) -> None:
+        """Mark an entry as used now, finer than the coarse file system clock"""
+        now = time.time_ns()
+        os.utime(file_path, ns=(now, now))
+
+    def get(self, key: str, default=None):
+        """Return the cached value of a key and mark it as recently used"""
+        file_path = self.get_path(key)
+        try:
+            with open(file_path, "rb") as file_obj:
+                value = pickle.load(file_obj)
+            self.touch(file_path)
+            self.hits += 1
+            return value
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except Exception as e:
+            logging.warning(f"Dropping unreadable cache entry {file_path}: {e}")
+            self.misses += 1
+            try:
+                os.remove(file_path)
+                self.untrack(file_path)
+            except OSError:
+                pass
+            return default
+
+    def set(self, key: str, value) -> None:
+        """Store the value of a key and evict the least recently used entries"""
+        try:
+            file_path = self.get_path(key)
+            tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_file_path, "wb") as file_obj:
+                pickle.dump(value, file_obj, protocol=pickle.HIGHEST_PROTOCOL)
+                size = file_obj.tell()
+            os.replace(tmp_file_path, file_path)
+            self.touch(file_path)
+            if self.max_bytes is None:
+                return
+            if self._sizes is None:
+                self.scan()
+            else:
+                self.untrack(file_path)
+                self._sizes[file_path] = size
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self.evict()
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def untrack(self, file_path: str) -> None:
+        if self._sizes is not None:
+            self._total_bytes -= self._sizes.pop(file_path, 0)
+
+    def scan(self) -> list:
+        """Track the size of every entry. Returns (mtime, size, path) of the entries"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".pkl"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        self._sizes = {file_path: size for _, size, file_path in entries}
+        self._total_bytes = sum(self._sizes.values())
+        return entries
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits
+        EVICT_TARGET_RATIO of max_bytes
+        """
+        if self.max_bytes is None:
+            return
+        target_bytes = self.max_bytes * EVICT_TARGET_RATIO
+        for _, _, file_path in sorted(self.scan()):
+            if self._total_bytes <= target_bytes:
+                break
+            try:
+                os.remove(file_path)
+                self.untrack(file_path)
+            except OSError:
+                pass
@@ -0,0 +1,491 @@
+import math
+import os
+import pickle
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import (
+    KFold,
+    ParameterGrid,
+    ParameterSampler,
+    StratifiedKFold,
+    train_test_split,
+)
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.ml_utils.model.fit_cache import FitCache
+
+
+@dataclass
+class FamilySearchResult:
+    name: str
+    best_params: dict
+    # mean cross-validation score of the best params, nan if only one candidate
+    best_score: float = float("nan")
+    n_trials: int = 0
+    # seconds spent fitting the family, summed over the workers
+    fit_time: float = 0.0
+    # (params, n_resources, score) of every trial
+    history: list = field(default_factory=list)
+    estimator: object = field(default=None, repr=False)
+
+
+def _fit_and_score(
+    trial, estimator, params, X, y, sample_weight, train_rows, test_rows, scoring
+):
+    """Fit a candidate on one cross-validation fold and score it on the held-out rows"""
+    start = time.perf_counter()
+    try:
+        model = clone(estimator).set_params(**params)
+        fit_params = {}
+        if sample_weight is not None:
+            fit_params["sample_weight"] = np.asarray(sample_weight[train_rows])
+        model.fit(np.asarray(X[train_rows]), np.asarray(y[train_rows]), **fit_params)
+        score = get_scorer(scoring)(
+            model, np.asarray(X[test_rows]), np.asarray(y[test_rows])
+        )
+        error = None
+    except Exception as e:
+        score, error = np.nan, str(e)
+    return trial, float(score), time.perf_counter() - start, error
+
+
+def _fit(name, estimator, params, X, y, sample_weight):
+    """Fit a candidate on all rows"""
+    start = time.perf_counter()
+    model = clone(estimator).set_params(**params)
+    fit_params = {} if sample_weight is None else {"sample_weight": sample_weight}
+    model.fit(X, y, **fit_params)
+    return name, model, time.perf_counter() - start
+
+
+class ModelSearch:
+    """
+    Hyperparameter search over several model families sharing one process pool.
+
+    All cross-validation fits of a round, across every family, are submitted to
+    the same joblib (loky) pool so the search scales with the cores instead of
+    running one family after the other. Memory-mapped arrays are shared with the
+    workers by reference.
+
+    method="halving" runs successive halving: every candidate of a family is
+    cross-validated on a small stratified subsample, the best 1/factor are kept
+    and re-evaluated on factor times more rows until one is left. method="random"
+    cross-validates up to n_candidates sampled candidates per family on all rows,
+    batch_size at a time, and stops a family early once its best score did not
+    improve for patience rounds. Families with a single candidate are not
+    cross-validated at all.
+
+    time_budget (seconds) and max_trials (candidate evaluations) bound the
+    search; when either runs out the best candidates scored so far are kept. The
+    best candidate of every family is then fitted once on all rows.
+
+    With a fit_cache, fold scores and fitted estimators of trials already run on
+    the same data are read from the cache instead of being fitted again. With a
+    checkpoint_dir, the result of every family is saved once its best candidate is
+    fitted, and families with a checkpoint of the same candidates and data are not
+    searched again, so a search resumed after a crash only runs the rest.
+    """
+
+    def __init__(
+        self,
+        method: str = "halving",
+        scoring: str = "f1",
+        cv: int = 3,
+        n_jobs: int = -1,
+        n_candidates: int = 20,
+        factor: int = 3,
+        min_resources: int = 1000,
+        batch_size: int = 4,
+        patience: int = 2,
+        time_budget: Optional[float] = None,
+        max_trials: Optional[int] = None,
+        random_state: int = 42,
+        fit_cache: Optional[FitCache] = None,
+        checkpoint_dir: Optional[str] = None,
+    ):
+        if method not in ("halving", "random"):
+            raise ValueError(f"Unknown search method: {method}")
+        self.method = method
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.n_candidates = n_candidates
+        self.factor = factor
+        self.min_resources = min_resources
+        self.batch_size = batch_size
+        self.patience = patience
+        self.time_budget = time_budget
+        self.max_trials = max_trials
+        self.random_state = random_state
+        self.fit_cache = fit_cache
+        self.checkpoint_dir = checkpoint_dir
+
+    def get_checkpoint_key(self, estimator, candidates: list, data_key: str) -> str:
+        return FitCache.make_key(
+            FitCache.describe_estimator(estimator, {}),
+            candidates,
+            data_key,
+            self.method,
+            self.scoring,
+            self.cv,
+        )
+
+    def get_checkpoint_path(self, name: str) -> str:
+        file_name = "".join(c if c.isalnum() else "_" for c in name.lower())
+        return os.path.join(self.checkpoint_dir, f"{file_name}.pkl")
+
+    def save_checkpoint(self, result: FamilySearchResult, key: str) -> None:
+        """Atomically save the result of a family with its fitted estimator"""
+        file_path = self.get_checkpoint_path(result.name)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, "wb") as file_obj:
+            pickle.dump({"key": key, "result": result}, file_obj)
+        os.replace(tmp_file_path, file_path)
+
+    def load_checkpoint(self, name: str, key: str) -> Optional[FamilySearchResult]:
+        """Result of a family saved by an earlier run of the same search"""
+        file_path = self.get_checkpoint_path(name)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, "rb") as file_obj:
+                checkpoint = pickle.load(file_obj)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable search checkpoint {file_path}: {e}")
+            return None
+        if checkpoint["key"] != key:
+            logging.info(f"Search checkpoint of {name} is stale, searching again")
+            return None
+        return checkpoint["result"]
+
+    def get_candidates(self, param_grid: dict) -> list:
+        """Parameter candidates of a family, sampled down to n_candidates"""
+        grid = ParameterGrid(param_grid)
+        if len(grid) <= self.n_candidates:
+            return list(grid)
+        return list(
+            ParameterSampler(
+                param_grid, self.n_candidates, random_state=self.random_state
+            )
+        )
+
+    def get_rows(self, y: np.ndarray, n_resources: int) -> np.ndarray:
+        """Stratified subsample of n_resources rows"""
+        if n_resources >= len(y):
+            return np.arange(len(y))
+        try:
+            rows = train_test_split(
+                np.arange(len(y)),
+                train_size=n_resources,
+                stratify=y,
+                random_state=self.random_state,
+            )[0]
+        except ValueError:
+            rows = np.random.default_rng(self.random_state).choice(
+                len(y), n_resources, replace=False
+            )
+        return np.sort(rows)
+
+    def get_folds(self, y: np.ndarray, rows: np.ndarray) -> list:
+        """Cross-validation folds of the rows as (train rows, test rows)"""
+        _, counts = np.unique(y[rows], return_counts=True)
+        if len(counts) > 1 and counts.min() >= self.cv:
+            splitter = StratifiedKFold(
+                self.cv, shuffle=True, random_state=self.random_state
+            )
+        else:
+            splitter = KFold(self.cv, shuffle=True, random_state=self.random_state)
+        return [
+            (rows[train], rows[test]) for train, test in splitter.split(rows, y[rows])
+        ]
+
+    def evaluate(
+        self, parallel, X, y, sample_weight, trials: list, n_resources: int, deadline
+    ) -> list:
+        """
+        Cross-validate the (name, estimator, params) trials on n_resources rows in the
+        shared pool. Returns the mean score of every trial, None for trials whose
+        folds did not all finish before the deadline.
+        """
+        y_array = np.asarray(y)
+        folds = self.get_folds(y_array, self.get_rows(y_array, n_resources))
+        fold_scores = [[] for _ in trials]
+        tasks = []
+        if self.fit_cache is not None:
+            fold_keys = [FitCache.hash_arrays(train, test) for train, test in folds]
+        for trial, (_, estimator, params) in enumerate(trials):
+            for fold, (train, test) in enumerate(folds):
+                key = None
+                if self.fit_cache is not None:
+                    key = FitCache.make_key(
+                        self._data_key,
+                        FitCache.describe_estimator(estimator, params),
+                        fold_keys[fold],
+                        self.scoring,
+                    )
+                    score = self.fit_cache.get(key)
+                    if score is not None:
+                        fold_scores[trial].append(score)
+                        continue
+                tasks.append((trial, key, train, test))
+
+        outputs = parallel(
+            delayed(_fit_and_score)(
+                (trial, key),
+                trials[trial][1],
+                trials[trial][2],
+                X,
+                y,
+                sample_weight,
+                train,
+                test,
+                self.scoring,
+            )
+            for trial, key, train, test in tasks
+        )
+        try:
+            for (trial, key), score, elapsed, error in outputs:
+                name, _, params = trials[trial]
+                if error is not None:
+                    logging.warning(f"Fitting {name} with {params} failed: {error}")
+                elif key is not None:
+                    self.fit_cache.set(key, score)
+                fold_scores[trial].append(score)
+                self.results_[name].fit_time += elapsed
+                if deadline is not None and time.perf_counter() > deadline:
+                    logging.info("Model search time budget exhausted")
+                    break
+        finally:
+            outputs.close()
+
+        scores = []
+        for (name, _, params), trial_scores in zip(trials, fold_scores):
+            if len(trial_scores) < len(folds):
+                scores.append(None)
+                continue
+            score = float(np.mean(trial_scores))
+            result = self.results_[name]
+            result.n_trials += 1
+            result.history.append((params, n_resources, score))
+            scores.append(score)
+        return scores
+
+    def take_trials(self, trials: list) -> list:
+        """Truncate the trials of a round to the remaining max_trials budget"""
+        if self.max_trials is None:
+            return trials
+        used = sum(result.n_trials for result in self.results_.values())
+        return trials[: max(self.max_trials - used, 0)]
+
+    @staticmethod
+    def interleave(candidates: dict, models: dict) -> list:
+        """(name, estimator, params) trials taking the families in turn"""
+        trials = []
+        for i in range(max((len(c) for c in candidates.values()), default=0)):
+            for name, family_candidates in candidates.items():
+                if i < len(family_candidates):
+                    trials.append((name, models[name], family_candidates[i]))
+        return trials
+
+    def search_halving(self, parallel, X, y, sample_weight, models, candidates, deadline):
+        survivors = {name: list(c) for name, c in candidates.items()}
+        scores = {name: [np.nan] * len(c) for name, c in candidates.items()}
+
+        n_rounds = 0
+        k = max((len(c) for c in candidates.values()), default=0)
+        while k > 1:
+            k = math.ceil(k / self.factor)
+            n_rounds += 1
+
+        for i in range(n_rounds):
+            n_resources = max(
+                self.min_resources, len(y) // self.factor ** (n_rounds - 1 - i)
+            )
+            racing = {name: c for name, c in survivors.items() if len(c) > 1}
+            trials = self.take_trials(self.interleave(racing, models))
+            if not trials:
+                break
+            round_scores = self.evaluate(
+                parallel, X, y, sample_weight, trials, n_resources, deadline
+            )
+            finished = len(trials) == sum(len(c) for c in racing.values()) and all(
+                score is not None for score in round_scores
+            )
+            for (name, _, params), score in zip(trials, round_scores):
+                if score is not None:
+                    scores[name][survivors[name].index(params)] = score
+
+            for name in racing:
+                order = sorted(
+                    range(len(survivors[name])),
+                    key=lambda j: -np.inf if np.isnan(scores[name][j]) else -scores[name][j],
+                )
+                n_keep = math.ceil(len(order) / self.factor) if finished else 1
+                survivors[name] = [survivors[name][j] for j in order[:n_keep]]
+                scores[name] = [scores[name][j] for j in order[:n_keep]]
+            logging.info(
+                f"Halving round {i + 1}/{n_rounds} on {n_resources} rows, "
+                f"{len(trials)} trials"
+            )
+            if not finished:
+                break
+
+        for name in candidates:
+            self.results_[name].best_params = survivors[name][0]
+            self.results_[name].best_score = scores[name][0]
+
+    def search_random(self, parallel, X, y, sample_weight, models, candidates, deadline):
+        best = {name: (np.nan, c[0]) for name, c in candidates.items()}
+        stale = {name: 0 for name in candidates}
+        position = {name: 0 for name in candidates}
+        active = [name for name, c in candidates.items() if len(c) > 1]
+
+        while active:
+            batch = {
+                name: candidates[name][position[name] : position[name] + self.batch_size]
+                for name in active
+            }
+            trials = self.take_trials(self.interleave(batch, models))
+            if not trials:
+                break
+            round_scores = self.evaluate(
+                parallel, X, y, sample_weight, trials, len(y), deadline
+            )
+            improved = set()
+            for (name, _, params), score in zip(trials, round_scores):
+                if score is None or np.isnan(score):
+                    continue
+                if np.isnan(best[name][0]) or score > best[name][0]:
+                    best[name] = (score, params)
+                    improved.add(name)
+            for name in active:
+                position[name] += self.batch_size
+                stale[name] = 0 if name in improved else stale[name] + 1
+            if any(score is None for score in round_scores) or len(trials) < sum(
+                len(b) for b in batch.values()
+            ):
+                break
+            active = [
+                name
+                for name in active
+                if position[name] < len(candidates[name])
+                and stale[name] < self.patience
+            ]
+
+        for name, (score, params) in best.items():
+            self.results_[name].best_params = params
+            self.results_[name].best_score = score
+
+    def run(self, X, y, models: dict, param: dict, sample_weight=None) -> dict:
+        """
+        Search every family of models and fit its best candidate on all rows.
+
+        Args:
+          X: training features, may be memory-mapped
+          y: training labels
+          models: dict of name to unfitted estimator
+          param: dict of name to parameter grid
+          sample_weight: optional sample weights of the training rows
+
+        Returns:
+          dict of name to FamilySearchResult holding the fitted estimator
+        """
+        try:
+            start = time.perf_counter()
+            deadline = None if self.time_budget is None else start + self.time_budget
+            candidates = {
+                name: self.get_candidates(param.get(name, {})) for name in models
+            }
+            self.results_ = {
+                name: FamilySearchResult(name=name, best_params=c[0])
+                for name, c in candidates.items()
+            }
+            checkpoint_keys = {}
+            if self.checkpoint_dir is not None or self.fit_cache is not None:
+                self._data_key = FitCache.hash_arrays(X, y, sample_weight)
+            if self.checkpoint_dir is not None:
+                for name in models:
+                    checkpoint_keys[name] = self.get_checkpoint_key(
+                        models[name], candidates[name], self._data_key
+                    )
+                    result = self.load_checkpoint(name, checkpoint_keys[name])
+                    if result is not None:
+                        logging.info(f"Resuming {name} from its search checkpoint")
+                        self.results_[name] = result
+            models = {
+                name: model
+                for name, model in models.items()
+                if self.results_[name].estimator is None
+            }
+            candidates = {name: candidates[name] for name in models}
+            with Parallel(
+                n_jobs=self.n_jobs, backend="loky", return_as="generator_unordered"
+            ) as parallel:
+                search = (
+                    self.search_halving
+                    if self.method == "halving"
+                    else self.search_random
+                )
+                search(parallel, X, y, sample_weight, models, candidates, deadline)
+
+                fit_keys = {}
+                for name in models:
+                    if self.fit_cache is None:
+                        continue
+                    fit_keys[name] = FitCache.make_key(
+                        self._data_key,
+                        FitCache.describe_estimator(
+                            models[name], self.results_[name].best_params
+                        ),
+                        "fit",
+                    )
+                    self.results_[name].estimator = self.fit_cache.get(fit_keys[name])
+                    if name in checkpoint_keys and self.results_[name].estimator is not None:
+                        self.save_checkpoint(self.results_[name], checkpoint_keys[name])
+
+                weight = None if sample_weight is None else np.asarray(sample_weight)
+                for name, model, elapsed in parallel(
+                    delayed(_fit)(
+                        name,
+                        models[name],
+                        self.results_[name].best_params,
+                        X,
+                        y,
+                        weight,
+                    )
+                    for name in models
+                    if self.results_[name].estimator is None
+                ):
+                    self.results_[name].estimator = model
+                    self.results_[name].fit_time += elapsed
+                    if name in fit_keys:
+                        self.fit_cache.set(fit_keys[name], model)
+                    if name in checkpoint_keys:
+                        self.save_checkpoint(self.results_[name], checkpoint_keys[name])
+
+            for result in self.results_.values():
+                logging.info(
+                    f"{result.name}: best params {result.best_params}, "
+                    f"cv {self.scoring} {result.best_score:.4f}, "
+                    f"{result.n_trials} trials, {result.fit_time:.1f}s fitting"
+                )
+            if self.fit_cache is not None:
+                logging.info(
+                    f"Fit cache: {self.fit_cache.hits} hits, "
+                    f"{self.fit_cache.misses} misses"
+                )
+            logging.info(
+                f"Model search finished in {time.perf_counter() - start:.1f}s"
+            )
+            return self.results_
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
@@ -0,0 +1,69 @@
+import sys
+from dataclasses import dataclass, field
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.main_utils.instrumentation import profile
+from src.utils.ml_utils.metric.classification_metric import (
+    get_positive_scores,
+    get_threshold_metrics,
+)
+
+
+@dataclass
+class CandidateScores:
+    name: str
+    metrics: dict
+    # positive-class scores of the split, cached for the metrics of the best model
+    y_score: np.ndarray = field(repr=False)
+
+
+class ModelSelector:
+    """
+    Score fitted candidates on a split with one predict_proba pass each and rank
+    them by an imbalance-aware metric computed from the cached probabilities:
+    "pr_auc" (average precision), "recall_at_precision" (best recall with a
+    precision of at least min_precision), "best_f1" (f1 at its best threshold) or
+    "f1" (f1 at threshold).
+    """
+
+    metrics = ("pr_auc", "recall_at_precision", "best_f1", "f1")
+
+    def __init__(
+        self, metric: str = "pr_auc", threshold: float = 0.5, min_precision: float = 0.9
+    ):
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown selection metric: {metric}")
+        self.metric = metric
+        self.threshold = threshold
+        self.min_precision = min_precision
+        self.scores_ = {}
+
+    def score_model(self, name: str, model, X, y) -> CandidateScores:
+        """Metrics of one model from a single inference pass over the split"""
+        try:
+            y_score = get_positive_scores(model, X)
+            metrics = get_threshold_metrics(y, y_score, self.min_precision)
+            metrics["f1"] = float(f1_score(y, y_score >= self.threshold))
+            return CandidateScores(name=name, metrics=metrics, y_score=y_score)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def score(self, models: dict, X, y) -> dict:
+        """
+        Score every fitted model on a split and cache its scores.
+
+        Returns:
+          dict of name to the selection metric
+        """
+        y = np.asarray(y)
+        report = {}
+        for name, model in models.items():
+            with profile(f"score.{name}", rows=len(y)):
+                self.scores_[name] = self.score_model(name, model, X, y)
+            report[name] = self.scores_[name].metrics[self.metric]
+            logging.info(f"{name}: {self.scores_[name].metrics}")
+        return report
@@ -0,0 +1,114 @@
+import os
+import sys
+
+import numpy as np
+import xgboost
+from xgboost import XGBClassifier
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+
+class ArrayChunkIter(xgboost.DataIter):
+    """
+    Feed (memory-mapped) feature, label and optional sample weight arrays to XGBoost
+    chunk by chunk
+    """
+
+    def __init__(self, X, y, chunk_size: int, cache_prefix: str, sample_weight=None):
+        self.X = X
+        self.y = y
+        self.sample_weight = sample_weight
+        self.chunk_size = chunk_size
+        self._offset = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self._offset >= len(self.X):
+            return False
+        end = self._offset + self.chunk_size
+        weight = None
+        if self.sample_weight is not None:
+            weight = np.asarray(self.sample_weight[self._offset : end], dtype=np.float32)
+        input_data(
+            data=np.asarray(self.X[self._offset : end], dtype=np.float32),
+            label=np.asarray(self.y[self._offset : end], dtype=np.float32),
+            weight=weight,
+        )
+        self._offset = end
+        return True
+
+    def reset(self) -> None:
+        self._offset = 0
+
+
+def fit_xgboost_external_memory(
+    model: XGBClassifier, X, y, chunk_size: int, cache_dir: str, sample_weight=None
+) -> XGBClassifier:
+    """
+    Fit an XGBClassifier through an external-memory DMatrix, so only one chunk of
+    the training data and the quantised pages cached on disk are used at a time.
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        data_iter = ArrayChunkIter(
+            X,
+            y,
+            chunk_size,
+            cache_prefix=os.path.join(cache_dir, "cache"),
+            sample_weight=sample_weight,
+        )
+        params = {k: v for k, v in model.get_xgb_params().items() if v is not None}
+        if hasattr(xgboost, "ExtMemQuantileDMatrix"):
+            dtrain = xgboost.ExtMemQuantileDMatrix(data_iter)
+        else:
+            dtrain = xgboost.DMatrix(data_iter)
+        booster = xgboost.train(
+            params, dtrain, num_boost_round=model.n_estimators or 100
+        )
+        model.load_model(bytearray(booster.save_raw("ubj")))
+        return model
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def fit_in_chunks(model, X, y, chunk_size: int, sample_weight=None):
+    """Fit an estimator supporting partial_fit chunk by chunk"""
+    try:
+        classes = np.unique(np.asarray(y))
+        for start in range(0, len(X), chunk_size):
+            fit_params = {}
+            if sample_weight is not None:
+                fit_params["sample_weight"] = np.asarray(
+                    sample_weight[start : start + chunk_size]
+                )
+            model.partial_fit(
+                np.asarray(X[start : start + chunk_size]),
+                np.asarray(y[start : start + chunk_size]),
+                classes=classes,
+                **fit_params,
+            )
+        return model
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
+
+
+def fit_out_of_core(model, X, y, chunk_size: int, cache_dir: str, sample_weight=None):
+    """
+    Refit a model on all rows of memory-mapped training data. XGBoost models use an
+    external-memory DMatrix, estimators with partial_fit are fed in chunks and all
+    other models are returned as fitted on the search sample.
+    """
+    if isinstance(model, XGBClassifier):
+        logging.info("Refitting XGBoost through an external-memory DMatrix")
+        return fit_xgboost_external_memory(
+            model, X, y, chunk_size, cache_dir, sample_weight=sample_weight
+        )
+    if hasattr(model, "partial_fit"):
+        logging.info(f"Refitting {type(model).__name__} in chunks of {chunk_size}")
+        return fit_in_chunks(model, X, y, chunk_size, sample_weight=sample_weight)
+    logging.warning(
+        f"{type(model).__name__} cannot be fitted out-of-core, "
+        "keeping the model fitted on the search sample"
+    )
+    return model
@@ -0,0 +1,188 @@
+import sys
+
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.impute import KNNImputer, SimpleImputer
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils.validation import check_is_fitted
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+
+class FastPathImputer(BaseEstimator, TransformerMixin):
+    """
+    Wrap an imputer and return batches without missing values untouched,
+    so clean batches never pay for the imputation.
+    """
+
+    def __init__(self, imputer):
+        self.imputer = imputer
+
+    def fit(self, X, y=None):
+        if hasattr(X, "columns"):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        X = np.asarray(X, dtype=np.float64)
+        self.n_features_in_ = X.shape[1]
+        self.imputer_ = clone(self.imputer).fit(X)
+        return self
+
+    def transform(self, X):
+        check_is_fitted(self, "imputer_")
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has shape {X.shape}, expected {self.n_features_in_} features"
+            )
+        if not np.isnan(X).any():
+            return X
+        return self.imputer_.transform(X)
+
+
+class TreeKNNImputer(BaseEstimator, TransformerMixin):
+    """
+    KNN imputation over a KD-tree/ball-tree index of a capped sample of the
+    complete training rows. A query costs O(log n) per row instead of the
+    O(n_train) pairwise distances of sklearn's KNNImputer. One index is built
+    per pattern of observed columns and reused across batches.
+    """
+
+    def __init__(
+        self,
+        n_neighbors: int = 3,
+        weights: str = "uniform",
+        max_reference_samples: int = 50000,
+        algorithm: str = "kd_tree",
+        random_state: int = 42,
+    ):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.max_reference_samples = max_reference_samples
+        self.algorithm = algorithm
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        X = np.asarray(X, dtype=np.float64)
+        self.n_features_in_ = X.shape[1]
+        reference = X[~np.isnan(X).any(axis=1)]
+        if self.max_reference_samples and len(reference) > self.max_reference_samples:
+            rng = np.random.default_rng(self.random_state)
+            rows = np.sort(
+                rng.choice(len(reference), self.max_reference_samples, replace=False)
+            )
+            reference = reference[rows]
+        self.reference_ = reference
+        # Column means are the fallback of rows without observed columns
+        with np.errstate(all="ignore"):
+            statistics = np.nanmean(X, axis=0) if len(X) else np.zeros(X.shape[1])
+        self.statistics_ = np.where(np.isnan(statistics), 0.0, statistics)
+        self._indexes = {}
+        return self
+
+    def _get_index(self, observed: np.ndarray) -> NearestNeighbors:
+        key = observed.tobytes()
+        index = self._indexes.get(key)
+        if index is None:
+            index = NearestNeighbors(algorithm=self.algorithm).fit(
+                self.reference_[:, observed]
+            )
+            self._indexes[key] = index
+        return index
+
+    def transform(self, X):
+        check_is_fitted(self, "reference_")
+        X = np.array(X, dtype=np.float64)
+        missing = np.isnan(X)
+        rows = np.flatnonzero(missing.any(axis=1))
+        if not len(rows):
+            return X
+
+        patterns, inverse = np.unique(missing[rows], axis=0, return_inverse=True)
+        n_neighbors = min(self.n_neighbors, len(self.reference_))
+        for i, pattern in enumerate(patterns):
+            pattern_rows = rows[inverse.ravel() == i]
+            observed = ~pattern
+            if not observed.any() or not n_neighbors:
+                X[np.ix_(pattern_rows, pattern)] = self.statistics_[pattern]
+                continue
+
+            distances, neighbors = self._get_index(observed).kneighbors(
+                X[np.ix_(pattern_rows, observed)], n_neighbors=n_neighbors
+            )
+            donors = self.reference_[:, pattern][neighbors]
+            if self.weights == "distance":
+                with np.errstate(divide="ignore"):
+                    weights = 1.0 / distances
+                # Exact matches take all the weight, as in sklearn
+                exact = np.isinf(weights)
+                weights = np.where(exact.any(axis=1, keepdims=True), exact, weights)
+                values = np.einsum("rk,rkc->rc", weights, donors) / weights.sum(
+                    axis=1, keepdims=True
+                )
+            else:
+                values = donors.mean(axis=1)
+            X[np.ix_(pattern_rows, pattern)] = values
+        return X
+
+    def __getstate__(self):
+        """Custom serialization method"""
+        state = super().__getstate__()
+        # The indexes are rebuilt on demand
+        state["_indexes"] = {}
+        return state
+
+
+def get_imputer(imputer_params: dict) -> FastPathImputer:
+    """
+    Build the imputer selected by the "method" of the imputer params.
+
+    Args:
+      imputer_params: dict with "method" one of "knn", "knn_tree", "median",
+        "mean", "most_frequent" or "iterative" and the parameters of the method
+
+    Returns:
+      The imputer wrapped in a FastPathImputer
+    """
+    try:
+        params = dict(imputer_params)
+        method = params.pop("method", "knn")
+        missing_values = params.get("missing_values", np.nan)
+
+        if method in ("median", "mean", "most_frequent"):
+            imputer = SimpleImputer(
+                missing_values=missing_values,
+                strategy=method,
+                keep_empty_features=True,
+            )
+        elif method == "iterative":
+            from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+            from sklearn.impute import IterativeImputer
+
+            imputer = IterativeImputer(
+                missing_values=missing_values,
+                max_iter=params.get("max_iter", 10),
+                random_state=params.get("random_state", 42),
+                keep_empty_features=True,
+            )
+        elif method == "knn":
+            imputer = KNNImputer(
+                missing_values=missing_values,
+                n_neighbors=params.get("n_neighbors", 5),
+                weights=params.get("weights", "uniform"),
+                keep_empty_features=True,
+            )
+        elif method == "knn_tree":
+            imputer = TreeKNNImputer(
+                n_neighbors=params.get("n_neighbors", 5),
+                weights=params.get("weights", "uniform"),
+                max_reference_samples=params.get("max_reference_samples", 50000),
+                algorithm=params.get("algorithm", "kd_tree"),
+                random_state=params.get("random_state", 42),
+            )
+        else:
+            raise ValueError(f"Unknown imputer method: {method}")
+
+        logging.info(f"Initialise {type(imputer).__name__} with {imputer_params}")
+        return FastPathImputer(imputer)
+    except Exception as e:
+        raise CreditCardException(e, sys) from e
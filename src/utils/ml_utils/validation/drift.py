@@ -0,0 +1,326 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.stats import kstwo
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+
+
+def _as_float_columns(data) -> np.ndarray:
+    """Columns of a 2-d sample as contiguous rows, float32 data is not upcast"""
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    return np.ascontiguousarray(data.reshape(len(data), -1).T)
+
+
+def ks_2samp_columns(base: np.ndarray, current: np.ndarray):
+    """
+    Two-sample Kolmogorov-Smirnov test of every column of two matrices at once.
+
+    Each sample is sorted per column, then the two sorted runs are merged by one
+    stable argsort, which is linear for presorted runs. The difference of the
+    empirical CDFs is a cumulative sum of +1/n1 for base rows and -1/n2 for current
+    rows, read at the last row of every group of tied values. Nan values are
+    ignored. The p-values are the asymptotic ones of scipy's
+    ks_2samp(method="asymp").
+
+    Returns:
+      KS statistic and p-value of every column, nan for columns without values
+    """
+    base = np.sort(_as_float_columns(base), axis=1)
+    current = np.sort(_as_float_columns(current), axis=1)
+    n1 = np.count_nonzero(~np.isnan(base), axis=1)
+    n2 = np.count_nonzero(~np.isnan(current), axis=1)
+
+    values = np.concatenate([base, current], axis=1)
+    order = np.argsort(values, axis=1, kind="stable")
+    values = np.take_along_axis(values, order, axis=1)
+    missing = np.isnan(values)
+    with np.errstate(divide="ignore"):
+        steps = np.where(
+            order < base.shape[1], 1.0 / n1[:, None], -1.0 / n2[:, None]
+        )
+    steps[missing] = 0.0
+    cdf_difference = np.cumsum(steps, axis=1)
+
+    last_of_ties = np.ones(values.shape, dtype=bool)
+    last_of_ties[:, :-1] = values[:, 1:] != values[:, :-1]
+    last_of_ties &= ~missing
+    statistic = np.where(last_of_ties, np.abs(cdf_difference), 0.0).max(axis=1)
+
+    empty = (n1 == 0) | (n2 == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_n = np.round(n1 * n2 / (n1 + n2))
+        pvalue = np.clip(kstwo.sf(statistic, np.where(empty, 1, effective_n)), 0, 1)
+    statistic = np.where(empty, np.nan, statistic)
+    pvalue = np.where(empty, np.nan, pvalue)
+    return statistic, pvalue
+
+
+def quantile_bin_edges(
+    base: np.ndarray, n_bins: int = 10, max_samples: int = 100000, random_state: int = 42
+) -> np.ndarray:
+    """
+    Inner edges of n_bins quantile bins of every column, shape (n_columns, n_bins - 1),
+    estimated on at most max_samples rows
+    """
+    base = _as_float_columns(base)
+    if max_samples and base.shape[1] > max_samples:
+        rng = np.random.default_rng(random_state)
+        base = base[:, rng.choice(base.shape[1], max_samples, replace=False)]
+    quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+    return np.nanquantile(base, quantiles, axis=1).T.reshape(len(base), -1)
+
+
+def bin_fractions(data: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Fraction of the values of every column in each bin, shape (n_columns, n_bins)"""
+    data = _as_float_columns(data)
+    n_bins = edges.shape[1] + 1
+    fractions = np.zeros((len(data), n_bins))
+    for j, column in enumerate(data):
+        column = column[~np.isnan(column)]
+        if len(column):
+            bins = np.searchsorted(
+                edges[j].astype(column.dtype), column, side="right"
+            )
+            fractions[j] = np.bincount(bins, minlength=n_bins) / len(column)
+    return fractions
+
+
+def population_stability_index(
+    base_fractions: np.ndarray, current_fractions: np.ndarray, epsilon: float = 1e-4
+) -> np.ndarray:
+    """PSI of every column from the bin fractions of the base and current data"""
+    base_fractions = np.clip(base_fractions, epsilon, None)
+    current_fractions = np.clip(current_fractions, epsilon, None)
+    return np.sum(
+        (current_fractions - base_fractions)
+        * np.log(current_fractions / base_fractions),
+        axis=1,
+    )
+
+
+def _psi_block(base: np.ndarray, current: np.ndarray, n_bins: int) -> np.ndarray:
+    edges = quantile_bin_edges(base, n_bins)
+    return population_stability_index(
+        bin_fractions(base, edges), bin_fractions(current, edges)
+    )
+
+
+class DriftDetector:
+    """
+    Column-wise drift detection between a base and a current frame.
+
+    method="ks" runs the vectorized two-sample KS test and flags columns with a
+    p-value below threshold. method="psi" is a cheaper approximate test for large
+    data: the population stability index over n_bins quantile bins of the base
+    data, flagging columns above psi_threshold. Columns are processed in blocks of
+    block_size, in a process pool of n_jobs workers when there is more than one
+    block and the frames hold at least min_parallel_cells values; below that the
+    start-up of the pool costs more than the tests.
+    """
+
+    def __init__(
+        self,
+        method: str = "ks",
+        threshold: float = 0.05,
+        psi_threshold: float = 0.2,
+        n_bins: int = 10,
+        n_jobs: int = 1,
+        block_size: int = 8,
+        min_parallel_cells: int = 20_000_000,
+    ):
+        if method not in ("ks", "psi"):
+            raise ValueError(f"Unknown drift method: {method}")
+        self.method = method
+        self.threshold = threshold
+        self.psi_threshold = psi_threshold
+        self.n_bins = n_bins
+        self.n_jobs = n_jobs
+        self.block_size = block_size
+        self.min_parallel_cells = min_parallel_cells
+
+    def get_columns(self, base_df: pd.DataFrame, current_df: pd.DataFrame) -> list:
+        """Numeric columns of the base frame that are in the current frame"""
+        columns = []
+        for column in base_df.columns:
+            if column not in current_df.columns:
+                logging.warning(f"Column {column} is missing from the current data")
+            elif pd.api.types.is_numeric_dtype(base_df[column]):
+                columns.append(column)
+        return columns
+
+    def detect(self, base_df: pd.DataFrame, current_df: pd.DataFrame) -> dict:
+        """
+        Test every column for drift.
+
+        Returns:
+          dict of column to its test result and "drift_status"
+        """
+        try:
+            columns = self.get_columns(base_df, current_df)
+            blocks = [
+                columns[start : start + self.block_size]
+                for start in range(0, len(columns), self.block_size)
+            ]
+            tasks = (
+                delayed(ks_2samp_columns if self.method == "ks" else _psi_block)(
+                    base_df[block].to_numpy(),
+                    current_df[block].to_numpy(),
+                    *(() if self.method == "ks" else (self.n_bins,)),
+                )
+                for block in blocks
+            )
+            n_cells = (len(base_df) + len(current_df)) * len(columns)
+            n_jobs = 1
+            if len(blocks) > 1 and n_cells >= self.min_parallel_cells:
+                n_jobs = self.n_jobs
+            results = Parallel(n_jobs=n_jobs, backend="loky")(tasks)
+
+            report = {}
+            for block, result in zip(blocks, results):
+                if self.method == "ks":
+                    statistic, pvalue = result
+                    for j, column in enumerate(block):
+                        report[column] = {
+                            "statistic": float(statistic[j]),
+                            "p_value": float(pvalue[j]),
+                            # columns without values cannot be tested
+                            "drift_status": bool(pvalue[j] < self.threshold),
+                        }
+                else:
+                    for j, column in enumerate(block):
+                        report[column] = {
+                            "psi": float(result[j]),
+                            "drift_status": bool(result[j] > self.psi_threshold),
+                        }
+            return report
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+
+class ReferenceSketch:
+    """
+    Compact per-column summary of a reference frame: row and null counts, min and
+    max, a quantile digest and the fractions of n_bins quantile bins. New batches
+    are checked against it without the reference data, in O(batch log batch) time
+    for the sort of every column the KS statistic walks.
+
+    check() reports per column the PSI over the reference bins, an approximate KS
+    statistic against the CDF interpolated from the quantile digest, the null
+    fraction and the fraction of values outside the reference range. A column
+    drifts when its PSI is above psi_threshold; batches with fewer than min_rows
+    values are reported but never flagged.
+    """
+
+    def __init__(self, columns: dict):
+        self.columns = columns
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        n_bins: int = 10,
+        n_quantiles: int = 101,
+        max_samples: int = 100000,
+        random_state: int = 42,
+    ) -> "ReferenceSketch":
+        try:
+            names = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+            data = _as_float_columns(df[names].to_numpy())
+            sample = data
+            if max_samples and data.shape[1] > max_samples:
+                rng = np.random.default_rng(random_state)
+                sample = data[:, rng.choice(data.shape[1], max_samples, replace=False)]
+            probabilities = np.linspace(0, 1, n_quantiles)
+            quantiles = np.nanquantile(sample, probabilities, axis=1).T
+            edges = quantile_bin_edges(sample.T, n_bins, max_samples=None)
+            fractions = bin_fractions(data.T, edges)
+
+            columns = {}
+            for j, name in enumerate(names):
+                values = data[j]
+                observed = values[~np.isnan(values)]
+                columns[name] = {
+                    "count": int(len(values)),
+                    "null_count": int(len(values) - len(observed)),
+                    "min": float(observed.min()) if len(observed) else None,
+                    "max": float(observed.max()) if len(observed) else None,
+                    "quantiles": quantiles[j].tolist(),
+                    "bin_edges": edges[j].tolist(),
+                    "bin_fractions": fractions[j].tolist(),
+                }
+            return cls(columns)
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def to_dict(self) -> dict:
+        return {"columns": self.columns}
+
+    @classmethod
+    def from_dict(cls, content: dict) -> "ReferenceSketch":
+        return cls(content["columns"])
+
+    def check(
+        self, df: pd.DataFrame, psi_threshold: float = 0.2, min_rows: int = 100
+    ) -> dict:
+        """
+        Check a batch against the reference.
+
+        Returns:
+          dict of column to its drift statistics and "drift_status"
+        """
+        try:
+            report = {}
+            names = [name for name in self.columns if name in df.columns]
+            if not names:
+                return report
+            data = _as_float_columns(df[names].to_numpy(dtype=np.float64))
+            for name, values in zip(names, data):
+                sketch = self.columns[name]
+                observed = np.sort(values[~np.isnan(values)])
+                result = {
+                    "rows": int(len(values)),
+                    "null_fraction": float(1 - len(observed) / max(len(values), 1)),
+                    "drift_status": False,
+                }
+                if len(observed) and sketch["min"] is not None:
+                    edges = np.asarray(sketch["bin_edges"])
+                    fractions = bin_fractions(observed[:, None], edges[None, :])[0]
+                    psi = population_stability_index(
+                        np.asarray(sketch["bin_fractions"])[None, :], fractions[None, :]
+                    )[0]
+                    quantiles = np.asarray(sketch["quantiles"])
+                    reference_cdf = np.interp(
+                        observed,
+                        quantiles,
+                        np.linspace(0, 1, len(quantiles)),
+                        left=0.0,
+                        right=1.0,
+                    )
+                    n = len(observed)
+                    statistic = max(
+                        np.max(np.arange(1, n + 1) / n - reference_cdf),
+                        np.max(reference_cdf - np.arange(n) / n),
+                    )
+                    result.update(
+                        {
+                            "psi": float(psi),
+                            "ks_statistic": float(statistic),
+                            "out_of_range_fraction": float(
+                                np.mean(
+                                    (observed < sketch["min"])
+                                    | (observed > sketch["max"])
+                                )
+                            ),
+                            "drift_status": bool(n >= min_rows and psi > psi_threshold),
+                        }
+                    )
+                report[name] = result
+            return report
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
@@ -0,0 +1,136 @@
+import sys
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from src.exception.exception import CreditCardException
+from src.logging.logger import logging
+from src.utils.main_utils.utils import get_schema_dtypes
+
+
+@dataclass
+class SchemaValidationResult:
+    # False if a column is missing, has the wrong dtype or too many nulls
+    status: bool
+    # True for the rows passing every row-level constraint
+    valid_rows: np.ndarray = field(repr=False)
+    errors: list = field(default_factory=list)
+    null_ratios: dict = field(default_factory=dict)
+
+    @property
+    def n_invalid_rows(self) -> int:
+        return int(len(self.valid_rows) - np.count_nonzero(self.valid_rows))
+
+
+class SchemaValidator:
+    """
+    Validator compiled once from the schema file.
+
+    The "columns" of the schema give the required columns and their dtypes and the
+    optional "constraints" map a column to its "min", "max", "allowed" values,
+    "nullable" flag and "max_null_ratio", with "default_constraints" applying to
+    every column. A batch is checked in one vectorized pass over a float matrix:
+
+    - batch level: missing columns, non-numeric dtypes and null ratios above
+      max_null_ratio
+    - row level: values out of range or not allowed, nulls in non-nullable
+      columns, fractional values in integer columns and unparsable values
+
+    Columns in exclude, such as the target of prediction batches, are skipped.
+    """
+
+    def __init__(self, schema_config: dict, exclude: list = None):
+        try:
+            exclude = set(exclude or [])
+            dtypes = get_schema_dtypes(schema_config)
+            default_constraints = schema_config.get("default_constraints") or {}
+            constraints = schema_config.get("constraints") or {}
+
+            self.columns = [column for column in dtypes if column not in exclude]
+            column_constraints = [
+                {**default_constraints, **(constraints.get(column) or {})}
+                for column in self.columns
+            ]
+            self.dtypes = [np.dtype(dtypes[column]) for column in self.columns]
+            self.integral = np.array([dtype.kind in "iu" for dtype in self.dtypes])
+            self.minimum = np.array(
+                [c.get("min", -np.inf) for c in column_constraints], dtype=np.float64
+            )
+            self.maximum = np.array(
+                [c.get("max", np.inf) for c in column_constraints], dtype=np.float64
+            )
+            self.nullable = np.array(
+                [c.get("nullable", True) for c in column_constraints]
+            )
+            self.max_null_ratio = np.array(
+                [c.get("max_null_ratio", 1.0) for c in column_constraints],
+                dtype=np.float64,
+            )
+            self.allowed = {
+                j: np.asarray(c["allowed"], dtype=np.float64)
+                for j, c in enumerate(column_constraints)
+                if c.get("allowed") is not None
+            }
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
+
+    def validate(self, dataframe: pd.DataFrame) -> SchemaValidationResult:
+        """Check the columns and every row of a batch against the schema"""
+        try:
+            errors = []
+            present = np.array([column in dataframe.columns for column in self.columns])
+            for j in np.flatnonzero(~present):
+                errors.append(f"Required column:{self.columns[j]} is missing")
+
+            columns = [self.columns[j] for j in np.flatnonzero(present)]
+            values = np.empty((len(dataframe), len(columns)), dtype=np.float64)
+            unparsable = np.zeros(values.shape, dtype=bool)
+            for k, column in enumerate(columns):
+                series = dataframe[column]
+                if not pd.api.types.is_numeric_dtype(series):
+                    errors.append(
+                        f"Column:{column} has dtype {series.dtype}, "
+                        f"expected {self.dtypes[self.columns.index(column)]}"
+                    )
+                    parsed = pd.to_numeric(series, errors="coerce")
+                    unparsable[:, k] = parsed.isna().to_numpy() & series.notna().to_numpy()
+                    series = parsed
+                values[:, k] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+            index = np.flatnonzero(present)
+            missing = np.isnan(values)
+            invalid = unparsable.copy()
+            invalid |= values < self.minimum[index]
+            invalid |= values > self.maximum[index]
+            invalid |= missing & ~self.nullable[index]
+            integral = self.integral[index]
+            invalid[:, integral] |= ~missing[:, integral] & (
+                values[:, integral] != np.floor(values[:, integral])
+            )
+            for k, j in enumerate(index):
+                if j in self.allowed:
+                    invalid[:, k] |= ~missing[:, k] & ~np.isin(
+                        values[:, k], self.allowed[j]
+                    )
+
+            nulls = missing & ~unparsable
+            null_ratios = nulls.mean(axis=0) if len(values) else np.zeros(len(columns))
+            for k in np.flatnonzero(null_ratios > self.max_null_ratio[index]):
+                errors.append(
+                    f"Column:{columns[k]} has a null ratio of {null_ratios[k]:.4f}, "
+                    f"above {self.max_null_ratio[index][k]}"
+                )
+
+            for error in errors:
+                logging.warning(error)
+            return SchemaValidationResult(
+                status=not errors,
+                valid_rows=~invalid.any(axis=1),
+                errors=errors,
+                null_ratios={
+                    column: float(ratio) for column, ratio in zip(columns, null_ratios)
+                },
+            )
+        except Exception as e:
+            raise CreditCardException(e, sys) from e
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from sklearn.metrics import (
+    average_precision_score,
+    f1_score,
+    precision_recall_curve,
+    precision_score,
+)
+
+from src.utils.ml_utils.metric.classification_metric import (
+    get_classification_score,
+    get_threshold_metrics,
+    precision_recall_sweep,
+    select_threshold,
+)
+
+
+@pytest.fixture
+def scored_labels():
+    """Create imbalanced labels and rounded scores with ties"""
+    rng = np.random.default_rng(0)
+    y_true = (rng.random(2000) < 0.1).astype(np.int8)
+    y_score = np.round(np.clip(0.3 * y_true + rng.random(2000) * 0.7, 0, 1), 2)
+    return y_true, y_score
+
+
+def test_sweep_matches_precision_recall_curve(scored_labels):
+    """Test that the sweep gives sklearn's precision-recall curve"""
+    y_true, y_score = scored_labels
+    thresholds, precision, recall = precision_recall_sweep(y_true, y_score)
+
+    expected_precision, expected_recall, expected_thresholds = precision_recall_curve(
+        y_true, y_score
+    )
+
+    np.testing.assert_allclose(thresholds[::-1], expected_thresholds)
+    np.testing.assert_allclose(precision[::-1], expected_precision[:-1])
+    np.testing.assert_allclose(recall[::-1], expected_recall[:-1])
+
+
+def test_threshold_metrics(scored_labels):
+    """Test the PR-AUC, best f1 and recall at precision against sklearn"""
+    y_true, y_score = scored_labels
+    metrics = get_threshold_metrics(y_true, y_score, min_precision=0.5)
+
+    assert metrics["pr_auc"] == pytest.approx(average_precision_score(y_true, y_score))
+    assert metrics["best_f1"] == pytest.approx(
+        f1_score(y_true, y_score >= metrics["best_threshold"])
+    )
+    _, precision, recall = precision_recall_sweep(y_true, y_score)
+    assert metrics["recall_at_precision"] == recall[precision >= 0.5].max()
+
+
+def test_classification_score_from_cached_scores(scored_labels):
+    """Test that cached scores give the metrics of the thresholded predictions"""
+    y_true, y_score = scored_labels
+    metric = get_classification_score(y_true, y_score=y_score, threshold=0.5)
+
+    assert metric.f1_score == pytest.approx(f1_score(y_true, y_score >= 0.5))
+    assert metric.pr_auc == pytest.approx(average_precision_score(y_true, y_score))
+
+
+@pytest.mark.parametrize("method", ["precision", "cost", "f1"])
+def test_select_threshold(scored_labels, method):
+    """Test that the threshold meets the target of each method"""
+    y_true, y_score = scored_labels
+    threshold = select_threshold(
+        y_true, y_score, method=method, target_precision=0.5, cost_ratio=5.0
+    )
+    y_pred = y_score >= threshold
+
+    if method == "precision":
+        assert precision_score(y_true, y_pred) >= 0.5
+    elif method == "cost":
+        costs = [
+            np.sum((y_score >= t) & (y_true == 0)) + 5.0 * np.sum((y_score < t) & (y_true == 1))
+            for t in np.unique(y_score)
+        ]
+        cost = np.sum(y_pred & (y_true == 0)) + 5.0 * np.sum(~y_pred & (y_true == 1))
+        assert cost == min(costs)
+    else:
+        assert f1_score(y_true, y_pred) == pytest.approx(
+            get_threshold_metrics(y_true, y_score)["best_f1"]
+        )
@@ -0,0 +1,169 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from src.components.data_ingestion import DataIngestion, split_key_range
+from src.entity.config_entity import DataIngestionConfig, TrainingPipelineConfig
+
+
+@pytest.fixture
+def documents():
+    """Create sample MongoDB documents for testing"""
+    return [
+        {"id": i, "V1": float(i) / 10, "Amount": "na" if i == 3 else i * 2.5}
+        for i in range(7)
+    ]
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Write a fallback data file of ten transactions"""
+    file_path = str(tmp_path / "creditcard.csv")
+    write_source(file_path, range(10))
+    return file_path
+
+
+def write_source(file_path: str, ids, v1: float = 0.5) -> None:
+    pd.DataFrame({"id": list(ids), "V1": v1, "Amount": 10.0, "Class": 0}).to_csv(
+        file_path, index=False
+    )
+
+
+def incremental_ingestion(tmp_path, source: str, run: str) -> DataIngestion:
+    """DataIngestion of a run reading the fallback file into a shared feature store"""
+    config = DataIngestionConfig(
+        TrainingPipelineConfig(artifact_dir=str(tmp_path / run))
+    )
+    config.fallback_file_path = source
+    config.sample_size = None
+    feature_store_dir = tmp_path / "feature_store"
+    config.persistent_feature_store_dir = str(feature_store_dir)
+    config.watermark_file_path = str(feature_store_dir / "watermark.yaml")
+    config.feature_store_partition_file_path = str(
+        feature_store_dir / os.path.basename(config.feature_store_partition_file_path)
+    )
+    data_ingestion = DataIngestion(config)
+    # no MongoDB collection, every export falls back to the local file
+    data_ingestion.mongo_client = {}
+    return data_ingestion
+
+
+def get_partitions(tmp_path) -> list:
+    return glob.glob(str(tmp_path / "feature_store" / "part_*"))
+
+
+def test_cursor_to_dataframe_types(documents):
+    """Test that the streamed columns are typed numpy buffers"""
+    df = DataIngestion.cursor_to_dataframe(iter(documents), batch_size=3)
+
+    assert list(df.columns) == ["id", "V1", "Amount"]
+    assert len(df) == len(documents)
+    assert df["id"].dtype == np.int64
+    assert df["V1"].dtype == np.float64
+    assert np.isnan(df.loc[3, "Amount"])
+    assert df.loc[4, "Amount"] == 10.0
+
+
+def test_cursor_to_dataframe_new_field(documents):
+    """Test that fields appearing in a later chunk are padded with nan"""
+    documents[5]["extra"] = 1.0
+    df = DataIngestion.cursor_to_dataframe(iter(documents), batch_size=2)
+
+    assert df["extra"].isna().sum() == len(documents) - 1
+    assert df.loc[5, "extra"] == 1.0
+
+
+def test_cursor_to_dataframe_empty():
+    """Test that an empty cursor returns an empty frame"""
+    df = DataIngestion.cursor_to_dataframe(iter([]), batch_size=10)
+    assert df.empty
+
+
+@pytest.mark.parametrize(
+    "lower, upper, n_partitions",
+    [(0, 10, 4), (0, 2, 4), (5, 5, 3), (0.0, 1.0, 3)],
+)
+def test_split_key_range_is_contiguous(lower, upper, n_partitions):
+    """Test that the key ranges cover the whole range without gaps"""
+    ranges = split_key_range(lower, upper, n_partitions)
+
+    assert ranges[0][0] == lower
+    assert ranges[-1][1] == upper
+    assert len(ranges) <= n_partitions
+    assert all(prev[1] == cur[0] for prev, cur in zip(ranges, ranges[1:]))
+
+
+def test_split_key_range_object_id():
+    """Test that ObjectId ranges are split on their integer value"""
+    lower = ObjectId("000000000000000000000000")
+    upper = ObjectId("0000000000000000000000ff")
+    ranges = split_key_range(lower, upper, 2)
+
+    assert ranges == [
+        (lower, ObjectId("00000000000000000000007f")),
+        (ObjectId("00000000000000000000007f"), upper),
+    ]
+
+
+def test_export_incremental_first_run(tmp_path, source):
+    """Test that the first run stores every row and the highest key as watermark"""
+    data_ingestion = incremental_ingestion(tmp_path, source, "run_1")
+    df = data_ingestion.export_incremental()
+
+    assert df["id"].tolist() == list(range(10))
+    assert data_ingestion.read_watermark() == 9
+    assert len(get_partitions(tmp_path)) == 1
+
+
+def test_export_incremental_appends_rows_above_watermark(tmp_path, source):
+    """Test that a second run appends only the rows above the watermark"""
+    incremental_ingestion(tmp_path, source, "run_1").export_incremental()
+    # rows below the watermark are not fetched again, even when they changed
+    write_source(source, range(15), v1=1.5)
+
+    data_ingestion = incremental_ingestion(tmp_path, source, "run_2")
+    df = data_ingestion.export_incremental()
+
+    assert df["id"].tolist() == list(range(15))
+    assert (df["V1"] == 0.5).sum() == 10
+    assert data_ingestion.read_watermark() == 14
+    assert len(get_partitions(tmp_path)) == 2
+    assert data_ingestion.export_new_documents(14).empty
+
+
+def test_export_incremental_recovers_from_interrupted_run(
+    tmp_path, source, monkeypatch
+):
+    """Test that a crash before the watermark write leaves no duplicated rows"""
+    data_ingestion = incremental_ingestion(tmp_path, source, "run_1")
+
+    def crash(value):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(data_ingestion, "write_watermark", crash)
+    with pytest.raises(Exception):
+        data_ingestion.export_incremental()
+    assert data_ingestion.read_watermark() is None
+    assert len(get_partitions(tmp_path)) == 1
+
+    # a rerun of the same run dir gets a new partition name
+    data_ingestion = incremental_ingestion(tmp_path, source, "run_1")
+    df = data_ingestion.export_incremental()
+
+    assert len(get_partitions(tmp_path)) == 2
+    assert df["id"].tolist() == list(range(10))
+    assert data_ingestion.read_watermark() == 9
+
+
+def test_read_watermark_ignores_changed_key(tmp_path, source):
+    """Test that a watermark written for another key is ignored"""
+    data_ingestion = incremental_ingestion(tmp_path, source, "run_1")
+    data_ingestion.write_watermark(np.int64(9))
+    assert data_ingestion.read_watermark() == 9
+
+    data_ingestion.data_ingestion_config.watermark_key = "Amount"
+    assert data_ingestion.read_watermark() is None
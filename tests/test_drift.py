@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import ks_2samp
+
+from src.components.data_validation import DataValidation
+from src.entity.config_entity import DataValidationConfig, TrainingPipelineConfig
+from src.utils.ml_utils.validation.drift import (
+    DriftDetector,
+    ReferenceSketch,
+    ks_2samp_columns,
+)
+
+
+@pytest.fixture
+def samples():
+    """Create base and current samples with ties, nan values and one shifted column"""
+    rng = np.random.default_rng(0)
+    base = np.round(rng.normal(size=(500, 4)), 1)
+    current = np.round(rng.normal(size=(300, 4)), 1)
+    current[:, 2] += 0.5
+    base[:10, 1] = np.nan
+    return base, current
+
+
+def test_ks_matches_scipy(samples):
+    """Test that the vectorized KS test gives scipy's asymptotic results"""
+    base, current = samples
+    statistic, pvalue = ks_2samp_columns(base, current)
+
+    for j in range(base.shape[1]):
+        expected = ks_2samp(
+            base[:, j][~np.isnan(base[:, j])], current[:, j], method="asymp"
+        )
+        assert statistic[j] == pytest.approx(expected.statistic)
+        assert pvalue[j] == pytest.approx(expected.pvalue)
+
+
+@pytest.mark.parametrize("method", ["ks", "psi"])
+def test_detector_flags_shifted_column(samples, method):
+    """Test that only the shifted column is flagged, with blocks in a pool"""
+    base, current = samples
+    columns = ["a", "b", "c", "d"]
+    detector = DriftDetector(
+        method=method, n_jobs=2, block_size=2, min_parallel_cells=0
+    )
+
+    report = detector.detect(
+        pd.DataFrame(base, columns=columns), pd.DataFrame(current, columns=columns)
+    )
+
+    assert [column for column in columns if report[column]["drift_status"]] == ["c"]
+
+
+def test_reference_sketch_flags_shifted_batch(samples):
+    """Test that a sketch round-tripped through a dict flags the shifted column"""
+    base, current = samples
+    columns = ["a", "b", "c", "d"]
+    sketch = ReferenceSketch.from_frame(
+        pd.DataFrame(base, columns=columns), max_samples=200
+    )
+    sketch = ReferenceSketch.from_dict(sketch.to_dict())
+
+    report = sketch.check(pd.DataFrame(current, columns=columns))
+
+    assert [column for column in columns if report[column]["drift_status"]] == ["c"]
+    assert report["c"]["ks_statistic"] > report["a"]["ks_statistic"]
+    assert sketch.columns["b"]["null_count"] == 10
+    assert not sketch.check(pd.DataFrame(current[:5], columns=columns))["c"][
+        "drift_status"
+    ]
+
+
+def test_reference_sketch_leaves_out_ids_and_target(tmp_path):
+    """Test that a same-distribution batch with new ids reports no drift"""
+    rng = np.random.default_rng(1)
+
+    def batch(first_id: int, n_rows: int) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "id": np.arange(first_id, first_id + n_rows),
+                "V1": rng.normal(size=n_rows),
+                "Amount": rng.exponential(50.0, size=n_rows),
+                "Class": rng.integers(0, 2, size=n_rows),
+            }
+        )
+
+    config = DataValidationConfig(
+        TrainingPipelineConfig(artifact_dir=str(tmp_path / "run"))
+    )
+    config.production_reference_sketch_file_path = str(tmp_path / "missing.yaml")
+    sketch = DataValidation(None, config).save_reference_sketch(batch(0, 2000))
+
+    report = sketch.check(batch(10**6, 500).drop(columns=["Class"]))
+
+    assert sorted(report) == ["Amount", "V1"]
+    assert not any(result["drift_status"] for result in report.values())
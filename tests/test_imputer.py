@@ -0,0 +1,74 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import KNNImputer
+
+from src.utils.ml_utils.preprocessing.imputer import (
+    FastPathImputer,
+    TreeKNNImputer,
+    get_imputer,
+)
+
+
+@pytest.fixture
+def train_data():
+    """Create complete training data"""
+    rng = np.random.default_rng(42)
+    return rng.normal(size=(300, 5))
+
+
+@pytest.fixture
+def query_data():
+    """Create query data with missing values in several patterns"""
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(40, 5))
+    X[rng.random(X.shape) < 0.2] = np.nan
+    X[0] = np.nan
+    return X
+
+
+@pytest.mark.parametrize("weights", ["uniform", "distance"])
+def test_tree_knn_matches_knn_imputer(train_data, query_data, weights):
+    """Test that the tree index gives the same result as sklearn's KNNImputer"""
+    expected = KNNImputer(n_neighbors=3, weights=weights).fit(train_data)
+    imputer = TreeKNNImputer(n_neighbors=3, weights=weights).fit(train_data)
+
+    np.testing.assert_allclose(
+        imputer.transform(query_data), expected.transform(query_data)
+    )
+
+
+def test_tree_knn_caps_reference(train_data):
+    """Test that the reference sample is capped"""
+    imputer = TreeKNNImputer(max_reference_samples=50).fit(train_data)
+    assert imputer.reference_.shape == (50, train_data.shape[1])
+
+
+def test_fast_path_skips_clean_batches(train_data):
+    """Test that batches without nan values are returned untouched"""
+    imputer = get_imputer({"method": "knn_tree", "n_neighbors": 3})
+    imputer.fit(pd.DataFrame(train_data, columns=list("abcde")))
+
+    assert isinstance(imputer, FastPathImputer)
+    assert list(imputer.feature_names_in_) == list("abcde")
+    assert imputer.transform(train_data) is train_data
+
+
+@pytest.mark.parametrize("method", ["knn", "knn_tree", "median", "mean", "iterative"])
+def test_imputer_methods(train_data, query_data, method):
+    """Test that every method fills all missing values and survives pickling"""
+    imputer = get_imputer({"method": method, "n_neighbors": 3}).fit(train_data)
+    imputer = pickle.loads(pickle.dumps(imputer))
+
+    transformed = imputer.transform(query_data)
+
+    assert transformed.shape == query_data.shape
+    assert not np.isnan(transformed).any()
+
+
+def test_unknown_imputer_method():
+    """Test that an unknown method is rejected"""
+    with pytest.raises(Exception):
+        get_imputer({"method": "unknown"})
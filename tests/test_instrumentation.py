@@ -0,0 +1,62 @@
+import json
+import sys
+
+from src.utils.main_utils.instrumentation import (
+    RunProfiler,
+    add_rows,
+    get_profiler,
+    profile,
+    profiled,
+    record_span,
+)
+
+
+@profiled("stage")
+def run_stage():
+    add_rows(10)
+    with profile("step", rows=5):
+        sum(range(100000))
+    record_span("stage.model", fit_time=1.5, n_trials=3)
+
+
+def test_nested_spans(tmp_path):
+    """Test that nested spans are timed and exported as JSON and Prometheus text"""
+    profiler = RunProfiler(sample_interval=0.01)
+    with profiler.activate():
+        run_stage()
+    assert get_profiler() is None
+
+    stage, step, model = profiler.spans
+    assert (stage.parent, step.parent, model.parent) == (None, "stage", "stage")
+    assert (stage.rows, step.rows) == (10, 5)
+    assert stage.wall_time >= step.wall_time > 0
+    assert stage.peak_rss > 0
+
+    profiler.write_json(str(tmp_path / "run_report.json"))
+    report = json.loads((tmp_path / "run_report.json").read_text())
+    assert [span["name"] for span in report["spans"]] == ["stage", "step", "stage.model"]
+
+    text = profiler.to_prometheus()
+    assert 'creditcard_pipeline_rows_total{span="step",parent="stage"} 5' in text
+    assert 'creditcard_pipeline_fit_time{span="stage.model",parent="stage"} 1.5' in text
+
+
+def test_profile_without_profiler():
+    """Test that instrumented code runs without an active profiler"""
+    run_stage()
+    with profile("step") as span:
+        pass
+    assert span.wall_time is None
+
+
+def test_spans_without_memory_sampling(monkeypatch):
+    """Test that spans are timed without psutil and the resource module"""
+    monkeypatch.setitem(sys.modules, "resource", None)
+    profiler = RunProfiler(sample_interval=0.01)
+    profiler._process = None
+    with profiler.activate():
+        run_stage()
+
+    stage = profiler.spans[0]
+    assert stage.wall_time > 0
+    assert stage.peak_rss is None
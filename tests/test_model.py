@@ -2,8 +2,11 @@ import pytest
 import pandas as pd
 import numpy as np
 from src.utils.ml_utils.model.estimator import CreditCardModel
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 from xgboost import XGBClassifier
+from src.utils.ml_utils.preprocessing.imputer import get_imputer
 
 
 @pytest.fixture
@@ -94,3 +97,65 @@ def test_model_invalid_input(invalid_data, preprocessor, model):
             credit_card_model.predict(None)
         else:
             credit_card_model.predict(invalid_data)
+
+
+def test_model_threshold(sample_data, preprocessor, model):
+    """Test that predict applies the stored threshold unless one is passed"""
+    X = sample_data.drop("target", axis=1)
+    y = sample_data["target"]
+    model.fit(preprocessor.fit_transform(X), y)
+
+    credit_card_model = CreditCardModel(
+        preprocessor=preprocessor, model=model, threshold=0.3
+    )
+    scores = credit_card_model.predict_proba(X.to_numpy())[:, 1]
+
+    np.testing.assert_array_equal(credit_card_model.predict(X), scores >= 0.3)
+    np.testing.assert_array_equal(
+        credit_card_model.predict(X, threshold=0.8), scores >= 0.8
+    )
+
+
+def test_predict_array_matches_predict(sample_data, preprocessor, model):
+    """Test that the array fast path matches predict on reordered frames"""
+    X = sample_data.drop("target", axis=1).astype(np.float32)
+    model.fit(preprocessor.fit_transform(X), sample_data["target"])
+    credit_card_model = CreditCardModel(preprocessor=preprocessor, model=model)
+
+    expected = credit_card_model.predict(X)
+    reordered = X[["feature2", "feature1"]].assign(Class=0)
+    np.testing.assert_array_equal(credit_card_model.predict(reordered), expected)
+    np.testing.assert_array_equal(
+        credit_card_model.predict_array(np.ascontiguousarray(X, dtype=np.float32)),
+        expected,
+    )
+    with pytest.raises(Exception):
+        credit_card_model.predict_array(X.to_numpy()[:, :1])
+
+
+@pytest.mark.parametrize(
+    "classifier",
+    [
+        XGBClassifier(n_estimators=20, random_state=42),
+        RandomForestClassifier(n_estimators=10, random_state=42),
+    ],
+)
+@pytest.mark.parametrize("method", ["median", "knn_tree"])
+def test_compiled_scorer_matches_predict(sample_data, classifier, method):
+    """Test that the compiled scorer gives the scores of predict_proba, NaNs included"""
+    X = sample_data.drop("target", axis=1)
+    preprocessor = Pipeline([("imputer", get_imputer({"method": method}))]).fit(X)
+    classifier.fit(preprocessor.transform(X), sample_data["target"])
+    credit_card_model = CreditCardModel(preprocessor=preprocessor, model=classifier)
+    scorer = credit_card_model.compile()
+
+    X_missing = X.copy()
+    X_missing.iloc[::5, 0] = np.nan
+    np.testing.assert_array_equal(
+        scorer.score(X_missing.to_numpy()),
+        credit_card_model.predict_proba(X_missing)[:, 1],
+    )
+    record = X_missing.iloc[0].to_dict()
+    np.testing.assert_array_equal(
+        scorer.predict(record), credit_card_model.predict(X_missing.iloc[[0]])
+    )
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from src.utils.ml_utils.model.fit_cache import FitCache
+from src.utils.ml_utils.model.model_search import ModelSearch
+
+
+@pytest.fixture
+def classification_data():
+    """Create an imbalanced binary classification problem"""
+    X, y = make_classification(
+        n_samples=600, n_features=8, weights=[0.8], random_state=42
+    )
+    return X.astype(np.float32), y.astype(np.int8)
+
+
+@pytest.fixture
+def families():
+    """Create two model families and their parameter grids"""
+    models = {
+        "Decision Tree": DecisionTreeClassifier(random_state=0),
+        "Logistic Regression": LogisticRegression(),
+    }
+    params = {
+        "Decision Tree": {"max_depth": [1, 2, 4, 8], "criterion": ["gini", "entropy"]},
+        "Logistic Regression": {},
+    }
+    return models, params
+
+
+@pytest.mark.parametrize("method", ["halving", "random"])
+def test_search_fits_best_candidates(classification_data, families, method):
+    """Test that every family gets its best candidate fitted on all rows"""
+    X, y = classification_data
+    models, params = families
+
+    results = ModelSearch(method=method, n_jobs=2, min_resources=100).run(
+        X, y, models, params
+    )
+
+    tree = results["Decision Tree"]
+    assert tree.n_trials > 0
+    assert tree.estimator.get_params()["max_depth"] == tree.best_params["max_depth"]
+    assert tree.estimator.predict(X).shape == y.shape
+    # a family with a single candidate is only fitted
+    assert results["Logistic Regression"].n_trials == 0
+    assert results["Logistic Regression"].estimator.coef_.shape == (1, 8)
+
+
+def test_search_respects_trial_budget(classification_data, families):
+    """Test that no more candidates are evaluated than the trial budget"""
+    X, y = classification_data
+    models, params = families
+
+    results = ModelSearch(max_trials=3, n_jobs=1).run(X, y, models, params)
+
+    assert sum(result.n_trials for result in results.values()) == 3
+    assert results["Decision Tree"].estimator is not None
+
+
+def test_search_reuses_cached_fits(tmp_path, classification_data, families):
+    """Test that a re-run reads every fold score and fitted model from the cache"""
+    X, y = classification_data
+    models, params = families
+
+    first = ModelSearch(n_jobs=1, min_resources=100, fit_cache=FitCache(str(tmp_path)))
+    first_results = first.run(X, y, models, params)
+    cache = FitCache(str(tmp_path))
+    second_results = ModelSearch(n_jobs=1, min_resources=100, fit_cache=cache).run(
+        X, y, models, params
+    )
+
+    assert cache.misses == 0
+    assert all(result.fit_time == 0 for result in second_results.values())
+    for name, result in second_results.items():
+        assert result.best_params == first_results[name].best_params
+
+
+def test_fit_cache_evicts_least_recently_used(tmp_path):
+    """Test that the oldest entries are evicted beyond the size limit"""
+    cache = FitCache(str(tmp_path), max_bytes=2500)
+    for key in ["a", "b", "c"]:
+        cache.set(key, np.zeros(100))
+        cache.get("a")
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_fit_cache_scans_only_to_evict(tmp_path, monkeypatch):
+    """Test that the cache size is tracked in memory between evictions"""
+    FitCache(str(tmp_path)).set("old", np.zeros(100))
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or scandir(path))
+
+    cache = FitCache(str(tmp_path), max_bytes=10500)
+    for i in range(10):
+        cache.set(str(i), np.zeros(100))
+    assert len(scans) == 1
+
+    cache.set("10", np.zeros(100))
+    assert len(scans) == 2
+    assert cache.get("old") is None
+    assert cache._total_bytes == sum(
+        os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)
+    )
+    assert cache._total_bytes <= 0.8 * 10500
+
+
+def test_search_resumes_from_checkpoints(tmp_path, classification_data, families):
+    """Test that families with a checkpoint of the same search are not searched again"""
+    X, y = classification_data
+    models, params = families
+    checkpoint_dir = str(tmp_path / "search_checkpoints")
+
+    first = ModelSearch(n_jobs=1, min_resources=100, checkpoint_dir=checkpoint_dir).run(
+        X, y, models, params
+    )
+    resumed = ModelSearch(
+        n_jobs=1, min_resources=100, checkpoint_dir=checkpoint_dir
+    ).run(X, y, models, params)
+
+    tree = resumed["Decision Tree"]
+    assert tree.history == first["Decision Tree"].history
+    assert tree.estimator.get_params() == first["Decision Tree"].estimator.get_params()
+
+    # a different grid invalidates the checkpoint of the family
+    params["Decision Tree"] = {"max_depth": [1, 2]}
+    changed = ModelSearch(
+        n_jobs=1, min_resources=100, checkpoint_dir=checkpoint_dir
+    ).run(X, y, models, params)
+    assert changed["Decision Tree"].best_params["max_depth"] in (1, 2)
+
+    # as does other data of the same number of rows
+    shuffled = ModelSearch(
+        n_jobs=1, min_resources=100, checkpoint_dir=checkpoint_dir
+    ).run(X[::-1], y, models, params)
+    assert shuffled["Decision Tree"].history != changed["Decision Tree"].history
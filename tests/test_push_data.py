@@ -0,0 +1,155 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from pymongo.errors import BulkWriteError
+
+from push_data import DUPLICATE_KEY_ERROR_CODE, BulkDataLoader
+
+
+class FakeCollection:
+    """In-memory collection whose insert_many behaves like an unordered MongoDB one"""
+
+    def __init__(self, on_insert=None):
+        self.documents = {}
+        self.on_insert = on_insert
+        self.lock = threading.Lock()
+
+    def insert_many(self, documents, ordered=True):
+        if self.on_insert is not None:
+            self.on_insert(documents)
+        inserted_ids, write_errors = [], []
+        with self.lock:
+            for index, document in enumerate(documents):
+                if document["_id"] in self.documents:
+                    write_errors.append(
+                        {"index": index, "code": DUPLICATE_KEY_ERROR_CODE}
+                    )
+                else:
+                    self.documents[document["_id"]] = dict(document)
+                    inserted_ids.append(document["_id"])
+        if write_errors:
+            raise BulkWriteError(
+                {"writeErrors": write_errors, "nInserted": len(inserted_ids)}
+            )
+        return type("InsertManyResult", (), {"inserted_ids": inserted_ids})()
+
+
+def get_loader(collection, **kwargs) -> BulkDataLoader:
+    loader = BulkDataLoader("database", "collection", **kwargs)
+    loader.collection = collection
+    return loader
+
+
+@pytest.fixture
+def csv_file_path(tmp_path):
+    """Write a csv file of twelve rows"""
+    file_path = str(tmp_path / "data.csv")
+    pd.DataFrame({"id": range(12), "V1": np.arange(12) / 10}).to_csv(
+        file_path, index=False
+    )
+    return file_path
+
+
+def test_chunk_to_records():
+    """Test that nan becomes None and the _id is the row number in the file"""
+    chunk = pd.DataFrame({"id": [4, 5], "V1": [0.5, np.nan]})
+    records = BulkDataLoader.chunk_to_records(chunk, first_row=4)
+
+    assert records == [
+        {"id": 4, "V1": 0.5, "_id": 4},
+        {"id": 5, "V1": None, "_id": 5},
+    ]
+
+
+def test_insert_records_ignores_only_duplicate_keys():
+    """Test that duplicate keys are skipped and any other write error is raised"""
+    collection = FakeCollection()
+    loader = get_loader(collection, batch_size=2)
+    records = [{"_id": i} for i in range(3)]
+
+    assert loader.insert_records(records) == 3
+    assert loader.insert_records(records + [{"_id": 3}]) == 1
+    assert sorted(collection.documents) == [0, 1, 2, 3]
+
+    def fail(documents):
+        raise BulkWriteError({"writeErrors": [{"code": 121}], "nInserted": 0})
+
+    collection.on_insert = fail
+    with pytest.raises(BulkWriteError):
+        loader.insert_records([{"_id": 4}])
+
+
+def test_read_checkpoint_mismatch(tmp_path):
+    """Test that a checkpoint of another load starts the load from scratch"""
+    loader = get_loader(FakeCollection(), chunk_size=2)
+    checkpoint_file_path = str(tmp_path / "data.csv.checkpoint.json")
+    assert loader.read_checkpoint(checkpoint_file_path) == -1
+
+    loader.write_checkpoint(checkpoint_file_path, 3)
+    assert loader.read_checkpoint(checkpoint_file_path) == 3
+    assert get_loader(FakeCollection(), chunk_size=4).read_checkpoint(
+        checkpoint_file_path
+    ) == -1
+    other_collection = BulkDataLoader("database", "other", chunk_size=2)
+    assert other_collection.read_checkpoint(checkpoint_file_path) == -1
+
+
+def test_load_resumes_after_checkpoint(csv_file_path):
+    """Test that a resumed load skips the rows of the committed chunks"""
+    collection = FakeCollection()
+    loader = get_loader(collection, chunk_size=4)
+    loader.write_checkpoint(f"{csv_file_path}.checkpoint.json", 0)
+
+    stats = loader.load(csv_file_path)
+
+    assert stats["inserted_rows"] == 8
+    assert sorted(collection.documents) == list(range(4, 12))
+    assert collection.documents[7] == {"id": 7, "V1": 0.7, "_id": 7}
+    assert loader.read_checkpoint(f"{csv_file_path}.checkpoint.json") == -1
+
+
+def test_load_commits_contiguous_chunks(csv_file_path):
+    """Test that the checkpoint never passes a chunk still being inserted"""
+    chunk_3_inserted = threading.Event()
+
+    def delay_first_chunk(documents):
+        if documents[0]["_id"] == 0:
+            chunk_3_inserted.wait(5)
+        if documents[0]["_id"] == 6:
+            chunk_3_inserted.set()
+
+    collection = FakeCollection(on_insert=delay_first_chunk)
+    loader = get_loader(collection, chunk_size=2, max_workers=2)
+    checkpoints = []
+
+    def write_checkpoint(checkpoint_file_path, last_committed_chunk):
+        # every row up to the committed chunk is in the collection
+        assert set(range(2 * (last_committed_chunk + 1))) <= set(collection.documents)
+        checkpoints.append(last_committed_chunk)
+
+    loader.write_checkpoint = write_checkpoint
+    stats = loader.load(csv_file_path)
+
+    assert stats["inserted_rows"] == 12
+    assert checkpoints == list(range(6))
+
+
+def test_load_resumes_after_failed_chunk(csv_file_path):
+    """Test that a load failing on a chunk resumes without duplicating rows"""
+
+    def fail_chunk_3(documents):
+        if documents[0]["_id"] == 6:
+            raise BulkWriteError({"writeErrors": [{"code": 121}], "nInserted": 0})
+
+    collection = FakeCollection(on_insert=fail_chunk_3)
+    loader = get_loader(collection, chunk_size=2, max_workers=2)
+    with pytest.raises(Exception):
+        loader.load(csv_file_path)
+
+    assert loader.read_checkpoint(f"{csv_file_path}.checkpoint.json") <= 2
+
+    collection.on_insert = None
+    loader.load(csv_file_path)
+    assert sorted(collection.documents) == list(range(12))
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.ml_utils.validation.schema import SchemaValidator
+
+
+@pytest.fixture
+def schema_config():
+    """Create a schema with dtypes, default and per-column constraints"""
+    return {
+        "columns": [{"id": "int64"}, {"V1": "float32"}, {"Class": "int8"}],
+        "default_constraints": {"max_null_ratio": 0.5},
+        "constraints": {
+            "id": {"min": 0, "nullable": False},
+            "V1": {"min": -5, "max": 5},
+            "Class": {"allowed": [0, 1], "nullable": False},
+        },
+    }
+
+
+def test_invalid_rows(schema_config):
+    """Test that every row-level constraint flags its row"""
+    df = pd.DataFrame(
+        {
+            "id": [0, 1, -2, 3, np.nan, 5.5],
+            "V1": [0.0, np.nan, 1.0, 9.0, 0.0, 0.0],
+            "Class": [0, 1, 0, 1, 0, 0],
+        }
+    )
+    df.loc[1, "Class"] = 2
+
+    result = SchemaValidator(schema_config).validate(df)
+
+    assert result.status
+    np.testing.assert_array_equal(
+        result.valid_rows, [True, False, False, False, False, False]
+    )
+    assert result.n_invalid_rows == 5
+    assert result.null_ratios["V1"] == pytest.approx(1 / 6)
+
+
+def test_batch_errors(schema_config):
+    """Test missing columns, unparsable values and null ratios of a batch"""
+    df = pd.DataFrame({"id": [0, 1, 2], "V1": ["0.5", "x", None]})
+
+    result = SchemaValidator(schema_config).validate(df)
+
+    assert not result.status
+    assert len(result.errors) == 2
+    assert "Class" in result.errors[0]
+    np.testing.assert_array_equal(result.valid_rows, [True, False, True])
+
+    result = SchemaValidator(schema_config, exclude=["Class"]).validate(
+        df.assign(V1=[0.5, np.nan, np.nan])
+    )
+    assert not result.status
+    assert "null ratio" in result.errors[0]
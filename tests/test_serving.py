@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.pipeline import Pipeline
+from xgboost import XGBClassifier
+
+from src.serving.api import create_app
+from src.serving.micro_batcher import MicroBatcher
+from src.serving.model_registry import ModelRegistry
+from src.utils.main_utils.utils import save_object
+from src.utils.ml_utils.model.estimator import CreditCardModel
+from src.utils.ml_utils.preprocessing.imputer import get_imputer
+
+
+def fit_model(threshold: float = 0.4) -> CreditCardModel:
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.normal(size=(200, 2)), columns=["V1", "Amount"])
+    y = (X["V1"] > 0).astype(int)
+    preprocessor = Pipeline([("imputer", get_imputer({"method": "median"}))]).fit(X)
+    model = XGBClassifier(n_estimators=10).fit(preprocessor.transform(X), y)
+    return CreditCardModel(preprocessor, model, threshold=threshold)
+
+
+@pytest.fixture
+def model_file_path(tmp_path):
+    """Save a small CreditCardModel fitted on two features"""
+    file_path = str(tmp_path / "credit_card_model.pkl")
+    save_object(file_path, fit_model())
+    return file_path
+
+
+def test_micro_batcher_coalesces_requests():
+    """Test that concurrent rows are scored in batches, each getting its own score"""
+
+    async def run():
+        batcher = MicroBatcher(
+            lambda rows: rows.sum(axis=1), max_batch_size=8, max_wait=0.05
+        )
+        await batcher.start()
+        scores = await asyncio.gather(
+            *(batcher.submit(np.array([[i, 1.0]])) for i in range(20))
+        )
+        await batcher.stop()
+        return batcher, scores
+
+    batcher, scores = asyncio.run(run())
+    assert scores == [i + 1.0 for i in range(20)]
+    assert batcher.n_rows == 20
+    assert batcher.n_batches <= 4
+
+
+def test_predict_endpoints(model_file_path):
+    """Test that both endpoints give the predictions of the model"""
+    records = [{"V1": 1.5, "Amount": 0.2}, {"V1": -2.0, "Amount": None}]
+    with TestClient(create_app(model_file_path, max_wait=0.001)) as client:
+        credit_card_model = client.app.state.registry.get_current().model
+        expected = credit_card_model.predict(pd.DataFrame(records, dtype=float))
+
+        batch = client.post("/predict/batch", json={"records": records}).json()
+        assert batch["predictions"] == expected.tolist()
+        for record, prediction in zip(records, expected):
+            response = client.post("/predict", json=record)
+            assert response.json()["prediction"] == prediction
+        assert client.post("/predict", json={"V1": 1.0}).status_code == 422
+
+
+def test_model_registry_swaps_and_rolls_back(model_file_path, monkeypatch):
+    """Test that new versions are swapped in and known versions never reloaded"""
+
+    def publish(content: bytes, mtime_ns: int):
+        with open(model_file_path, "wb") as file_obj:
+            file_obj.write(content)
+        os.utime(model_file_path, ns=(mtime_ns, mtime_ns))
+
+    registry = ModelRegistry(model_file_path)
+    assert registry.refresh()
+    first = registry.current
+    assert not registry.refresh()
+    with open(model_file_path, "rb") as file_obj:
+        first_bytes = file_obj.read()
+
+    save_object(model_file_path, fit_model(threshold=0.9))
+    os.utime(model_file_path, ns=(1, 1))
+    assert registry.refresh()
+    second = registry.current
+    assert second.version != first.version
+    assert second.model.threshold == 0.9
+
+    # republishing a loaded version swaps it back without unpickling
+    monkeypatch.setattr(
+        "src.serving.model_registry.load_object",
+        lambda file_path: pytest.fail("reloaded a known version"),
+    )
+    publish(first_bytes, 2)
+    assert registry.refresh()
+    assert registry.current is first
+    assert registry.rollback() is second
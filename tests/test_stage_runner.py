@@ -0,0 +1,115 @@
+import pytest
+
+from src.constant import training_pipeline
+from src.entity.artifact_entity import (
+    ClassificationMetricArtifact,
+    DataIngestionArtifact,
+    ModelTrainerArtifact,
+    artifact_from_dict,
+    artifact_to_dict,
+)
+from src.pipeline.stage_runner import Stage, StageRunner
+
+
+@pytest.fixture
+def stages(tmp_path):
+    """Create an ingestion and a trainer stage counting their runs"""
+    runs = {"data_ingestion": 0, "model_trainer": 0}
+    data_file_path = tmp_path / "train.csv"
+
+    def ingest():
+        runs["data_ingestion"] += 1
+        data_file_path.write_text("id\n1\n")
+        return DataIngestionArtifact(str(data_file_path), str(data_file_path))
+
+    def train(data_ingestion_artifact):
+        runs["model_trainer"] += 1
+        metric = ClassificationMetricArtifact(0.5, 0.5, 0.5)
+        return ModelTrainerArtifact(
+            data_ingestion_artifact.trained_file_path, metric, metric
+        )
+
+    return runs, data_file_path, [
+        Stage(
+            name="data_ingestion",
+            run=ingest,
+            artifact_class=DataIngestionArtifact,
+            constant_prefixes=("DATA_INGESTION",),
+            source_fingerprint=lambda: "source",
+        ),
+        Stage(
+            name="model_trainer",
+            run=train,
+            artifact_class=ModelTrainerArtifact,
+            depends_on=("data_ingestion",),
+            constant_prefixes=("MODEL_TRAINER",),
+        ),
+    ]
+
+
+def test_artifact_dict_round_trip():
+    """Test that nested artifacts survive the dict round trip"""
+    metric = ClassificationMetricArtifact(0.1, 0.2, 0.3, pr_auc=0.4)
+    artifact = ModelTrainerArtifact("model.pkl", metric, metric, threshold=0.7)
+    assert artifact_from_dict(ModelTrainerArtifact, artifact_to_dict(artifact)) == artifact
+
+
+def test_unchanged_stages_are_skipped(tmp_path, stages, monkeypatch):
+    """Test that only the stages downstream of a change run again"""
+    runs, data_file_path, stage_list = stages
+    cache_dir = str(tmp_path / "stage_cache")
+
+    def run_pipeline():
+        runner = StageRunner(cache_dir)
+        artifact = runner.run(stage_list)
+        runner.commit()
+        return artifact
+
+    artifact = run_pipeline()
+    assert run_pipeline() == artifact
+    assert runs == {"data_ingestion": 1, "model_trainer": 1}
+
+    monkeypatch.setattr(training_pipeline, "MODEL_TRAINER_SELECTION_METRIC", "f1")
+    run_pipeline()
+    assert runs == {"data_ingestion": 1, "model_trainer": 2}
+
+    # lost files are written again, the unchanged downstream stage is reused
+    data_file_path.unlink()
+    run_pipeline()
+    assert runs == {"data_ingestion": 2, "model_trainer": 2}
+
+
+def test_unknown_source_reruns_downstream_stages(tmp_path, stages):
+    """Test that stages downstream of an unknown source fingerprint always run"""
+    runs, _, stage_list = stages
+    stage_list[0].source_fingerprint = lambda: None
+    cache_dir = str(tmp_path / "stage_cache")
+
+    for _ in range(2):
+        runner = StageRunner(cache_dir)
+        runner.run(stage_list)
+        runner.commit()
+    assert runner.fingerprints == {"data_ingestion": None, "model_trainer": None}
+    assert runs == {"data_ingestion": 2, "model_trainer": 2}
+
+
+def test_failed_run_resumes_after_completed_stages(tmp_path, stages):
+    """Test that a resumed run only runs the stages after the last checkpoint"""
+    runs, _, stage_list = stages
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    train = stage_list[1].run
+
+    def fail(data_ingestion_artifact):
+        raise RuntimeError("trainer failed")
+
+    stage_list[1].run = fail
+    with pytest.raises(Exception):
+        StageRunner(None, checkpoint_dir=checkpoint_dir).run(stage_list)
+    assert runs == {"data_ingestion": 1, "model_trainer": 0}
+
+    stage_list[1].run = train
+    runner = StageRunner(None, checkpoint_dir=checkpoint_dir)
+    artifact = runner.run(stage_list)
+    assert runner.resumed == ["data_ingestion"]
+    assert runs == {"data_ingestion": 1, "model_trainer": 1}
+    assert artifact.trained_model_file_path == str(tmp_path / "train.csv")
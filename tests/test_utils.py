@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.exception.exception import CreditCardException
+from src.utils.main_utils.background_writer import BackgroundWriter
+from src.utils.main_utils.model_artifact import save_model_artifact
+from src.utils.main_utils.utils import (
+    apply_schema_dtypes,
+    get_schema_dtypes,
+    load_object,
+    read_dataframe,
+    save_object,
+    write_dataframe,
+)
+
+
+@pytest.fixture
+def schema_dtypes():
+    """Create the dtypes of a sample schema file"""
+    schema_config = {
+        "columns": [{"id": "int64"}, {"V1": "float32"}, {"Class": "int8"}],
+    }
+    return get_schema_dtypes(schema_config)
+
+
+@pytest.fixture
+def sample_frame():
+    """Create a sample frame as parsed from csv"""
+    return pd.DataFrame(
+        {
+            "id": np.arange(5),
+            "V1": np.linspace(-1, 1, 5),
+            "Class": np.array([0, 1, 0, 1, 0]),
+        }
+    )
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow", ".csv"])
+def test_dataframe_round_trip(tmp_path, extension, sample_frame, schema_dtypes):
+    """Test that every artifact format reads back the typed columns"""
+    file_path = str(tmp_path / f"train{extension}")
+    write_dataframe(file_path, apply_schema_dtypes(sample_frame, schema_dtypes))
+
+    df = read_dataframe(file_path, dtypes=schema_dtypes)
+
+    assert df["V1"].dtype == np.float32
+    assert df["Class"].dtype == np.int8
+    np.testing.assert_allclose(df["V1"], sample_frame["V1"], rtol=1e-6)
+
+
+def test_apply_schema_dtypes_keeps_int_with_nan(sample_frame, schema_dtypes):
+    """Test that integer columns with nan values are not cast"""
+    sample_frame["Class"] = sample_frame["Class"].astype(float)
+    sample_frame.loc[0, "Class"] = np.nan
+
+    df = apply_schema_dtypes(sample_frame, schema_dtypes)
+
+    assert df["Class"].dtype == np.float64
+    assert df["V1"].dtype == np.float32
+
+
+def test_background_writer(tmp_path, sample_frame):
+    """Test that background writes land on flush and write errors are raised"""
+    file_path = str(tmp_path / "out" / "train.parquet")
+    with BackgroundWriter() as writer:
+        writer.write_dataframe(file_path, sample_frame)
+        writer.flush()
+        pd.testing.assert_frame_equal(read_dataframe(file_path), sample_frame)
+
+        writer.write_dataframe(str(tmp_path / "train.parquet"), object())
+        with pytest.raises(CreditCardException):
+            writer.flush()
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_model_artifact_round_trip(tmp_path, sample_frame, compression):
+    """Test that model artifacts load the models, mapping the uncompressed arrays"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    from xgboost import XGBClassifier
+
+    from src.utils.ml_utils.model.estimator import CreditCardModel
+
+    X = sample_frame[["id", "V1"]]
+    y = sample_frame["Class"]
+    classifiers = (RandomForestClassifier(n_estimators=5), XGBClassifier(n_estimators=5))
+    for classifier in classifiers:
+        preprocessor = StandardScaler().fit(X)
+        classifier.fit(preprocessor.transform(X), y)
+        model = CreditCardModel(preprocessor, classifier)
+        model.compile()
+        file_path = str(tmp_path / "model.pkl")
+        save_model_artifact(file_path, model, compression=compression)
+
+        loaded = load_object(file_path)
+        np.testing.assert_array_equal(
+            loaded.compile().score(X.to_numpy()), model.predict_proba(X)[:, 1]
+        )
+        if isinstance(classifier, RandomForestClassifier):
+            # scored from the flat trees, the forest is only rebuilt when used
+            assert loaded._model is None
+            if compression is None:
+                assert not loaded._flat_trees["nodes"].flags.writeable
+        np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+        if isinstance(classifier, RandomForestClassifier):
+            rebuilt = loaded.model.estimators_[0].tree_.__getstate__()
+            original = classifier.estimators_[0].tree_.__getstate__()
+            for name in original["nodes"].dtype.names:
+                np.testing.assert_array_equal(
+                    rebuilt["nodes"][name], original["nodes"][name]
+                )
+            np.testing.assert_array_equal(rebuilt["values"], original["values"])
+        if compression is None:
+            assert not loaded.preprocessor.mean_.flags.writeable
+
+    # plain pickles still load
+    save_object(file_path, model)
+    np.testing.assert_array_equal(
+        load_object(file_path).predict_proba(X), model.predict_proba(X)
+    )